@@ -0,0 +1,244 @@
+# Copyright (c) 2017 Cisco Systems
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""AID reconciliation cycle accounting.
+
+Every phase of the reconciliation cycle (observe, vote, reconcile, push...)
+is timed and counted, globally, per universe and per tenant. At the end of
+each cycle a structured log line is emitted, and the last cycles are
+periodically dumped to a file that can be inspected from the CLI.
+Optionally, when a cycle is slower than a threshold, the next one is run
+under cProfile.
+"""
+
+from contextlib import contextmanager
+import cProfile
+import glob
+import json
+import os
+import threading
+import time
+
+from oslo_log import log as logging
+
+from aim.common import utils
+
+
+LOG = logging.getLogger(__name__)
+HISTORY_LEN = 10
+DUMP_INTERVAL = 60
+MAX_PROFILES = 5
+TOP_TENANTS = 5
+PROFILE_PREFIX = 'aid-cycle-'
+
+
+class CycleStats(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.history = []
+        self.cycle = None
+        self.event_latency = None
+
+    def start_cycle(self):
+        with self._lock:
+            self.cycle = {'start': time.time(), 'elapsed': 0.0,
+                          'phases': {}, 'universes': {}, 'tenants': {}}
+
+    def record(self, phase, elapsed, universe=None, tenant=None):
+        with self._lock:
+            if self.cycle is None:
+                return
+            targets = [self.cycle['phases']]
+            if universe:
+                targets.append(
+                    self.cycle['universes'].setdefault(universe, {}))
+            if tenant:
+                targets.append(self.cycle['tenants'].setdefault(tenant, {}))
+            for stats in targets:
+                # phase -> [calls, time]
+                entry = stats.setdefault(phase, [0, 0.0])
+                entry[0] += 1
+                entry[1] += elapsed
+
+    def end_cycle(self):
+        with self._lock:
+            cycle, self.cycle = self.cycle, None
+            if cycle is None:
+                return {}
+            cycle['elapsed'] = time.time() - cycle['start']
+            # Cumulative hit rates of the DN caches
+            cycle['caches'] = utils.get_cache_stats()
+            self.history = (self.history + [cycle])[-HISTORY_LEN:]
+        return cycle
+
+    def record_event_latency(self, latency):
+        # The latency is only known once the cycle triggered by the event
+        # is over, so it's attached to the last completed cycle.
+        with self._lock:
+            if self.event_latency is None:
+                self.event_latency = {'last': latency, 'min': latency,
+                                      'max': latency}
+            else:
+                self.event_latency = {
+                    'last': latency,
+                    'min': min(self.event_latency['min'], latency),
+                    'max': max(self.event_latency['max'], latency)}
+            if self.history:
+                self.history[-1]['event_latency'] = dict(self.event_latency)
+
+    def to_dict(self):
+        with self._lock:
+            return {'cycles': list(self.history)}
+
+
+def top_tenants(cycle, count=TOP_TENANTS):
+    """Return (tenant, time) tuples of the slowest tenants of a cycle."""
+    result = [(k, sum(x[1] for x in v.values())) for k, v in
+              cycle.get('tenants', {}).iteritems()]
+    return sorted(result, key=lambda x: x[1], reverse=True)[:count]
+
+
+def summarize(cycle):
+    """Compact version of a cycle, suitable for a single log line."""
+    return {'elapsed': round(cycle['elapsed'], 3),
+            'phases': {k: [v[0], round(v[1], 3)] for k, v in
+                       cycle['phases'].iteritems()},
+            'universes': {u: {k: [v[0], round(v[1], 3)] for k, v in
+                              phases.iteritems()}
+                          for u, phases in cycle['universes'].iteritems()},
+            'tenants': len(cycle['tenants']),
+            'cache_hit_rates': {k: round(v['hit_rate'], 3) for k, v in
+                                cycle.get('caches', {}).iteritems()},
+            'slowest_tenants': [[k, round(v, 3)] for k, v in
+                                top_tenants(cycle)],
+            'event_latency': {k: round(v, 3) for k, v in
+                              cycle.get('event_latency', {}).iteritems()}}
+
+
+_stats = CycleStats()
+_config = {'dump_dir': None, 'profile_threshold': 0, 'profiler': None,
+           'profile_next': False, 'last_dump': 0}
+
+
+def configure(dump_dir=None, profile_threshold=0):
+    """Configure cycle accounting for this process.
+
+    :param dump_dir: if set, the last cycles are written in this directory
+    at most every DUMP_INTERVAL seconds, together with the cProfile
+    captures.
+    :param profile_threshold: cycles slower than this number of seconds
+    cause the next cycle to be profiled, 0 disables profiling.
+    """
+    _config['dump_dir'] = dump_dir
+    _config['profile_threshold'] = profile_threshold or 0
+    _config['last_dump'] = 0
+
+
+def configure_from_config(conf):
+    configure(dump_dir=conf.aim.cycle_stats_dir,
+              profile_threshold=conf.aim.cycle_profile_threshold)
+
+
+def get_stats():
+    return _stats
+
+
+@contextmanager
+def measure(phase, universe=None, tenant=None):
+    start = time.time()
+    try:
+        yield
+    finally:
+        _stats.record(phase, time.time() - start, universe=universe,
+                      tenant=tenant)
+
+
+def record_event_latency(latency):
+    _stats.record_event_latency(latency)
+
+
+def start_cycle():
+    _stats.start_cycle()
+    if _config['profiler']:
+        # Previous cycle didn't complete
+        _config['profiler'].disable()
+        _config['profiler'] = None
+    if _config['profile_next']:
+        # Only the calling thread is profiled, reconcile workers are not
+        _config['profiler'] = cProfile.Profile()
+        _config['profiler'].enable()
+
+
+def end_cycle(log=None):
+    """Return the statistics of the cycle, and log a summary of them."""
+    cycle = _stats.end_cycle()
+    if not cycle:
+        return cycle
+    if log:
+        log.info("AID cycle stats: %s",
+                 json.dumps(summarize(cycle), sort_keys=True))
+    profiler, _config['profiler'] = _config['profiler'], None
+    if profiler:
+        profiler.disable()
+        _config['profile_next'] = False
+        _dump_profile(profiler, cycle, log)
+    threshold = _config['profile_threshold']
+    if threshold and cycle['elapsed'] >= threshold:
+        _config['profile_next'] = True
+    dump(force=False)
+    return cycle
+
+
+def dump(force=True):
+    dump_dir = _config['dump_dir']
+    if not dump_dir:
+        return
+    now = time.time()
+    if not force and now - _config['last_dump'] < DUMP_INTERVAL:
+        return
+    _config['last_dump'] = now
+    path = os.path.join(dump_dir, 'aid.json')
+    try:
+        utils.dump_json_file(path, _stats.to_dict())
+    except (IOError, OSError) as e:
+        LOG.warning("Failed to dump cycle statistics to %s: %s", path, e)
+
+
+def load(path):
+    return utils.load_json_file(path)
+
+
+def list_profiles(dump_dir):
+    return sorted(glob.glob(os.path.join(dump_dir,
+                                         PROFILE_PREFIX + '*.prof')))
+
+
+def _dump_profile(profiler, cycle, log):
+    dump_dir = _config['dump_dir']
+    if not dump_dir:
+        return
+    path = os.path.join(dump_dir, '%s%d.prof' % (PROFILE_PREFIX,
+                                                 int(cycle['start'])))
+    try:
+        utils.ensure_dir(dump_dir)
+        profiler.dump_stats(path)
+        for old in list_profiles(dump_dir)[:-MAX_PROFILES]:
+            os.remove(old)
+    except (IOError, OSError) as e:
+        LOG.warning("Failed to dump cycle profile to %s: %s", path, e)
+        return
+    if log:
+        log.info("Profile of the reconciliation cycle saved in %s", path)
@@ -18,6 +18,7 @@ import os
 import Queue as queue
 import six
 import socket
+import threading
 import time
 import traceback
 
@@ -30,6 +31,8 @@ LOG = logging.getLogger(__name__)
 EVENT_SERVE = 'serve'
 EVENT_RECONCILE = 'reconcile'
 EVENTS = [EVENT_SERVE, EVENT_RECONCILE]
+# Internal event, only used to interrupt waits on the event queue
+EVENT_WAKEUP = 'wakeup'
 PAYLOAD_MAX_LEN = 1024
 SOCKET_RECONNECT_MAX_WAIT = 10
 
@@ -77,16 +80,40 @@ class SenderBase(object):
         """
 
     @abc.abstractmethod
-    def reconcile(self):
+    def reconcile(self, roots=None):
         """Send a reconcile event.
 
+        :param roots: root RNs that need reconciliation, all of them if None
         :return:
         """
 
 
+def encode_event(event, roots=None):
+    """Build socket payload, roots are dropped if they don't fit."""
+    if roots:
+        payload = utils.json_dumps({'event': event, 'roots': sorted(roots)})
+        if len(payload) <= PAYLOAD_MAX_LEN:
+            return payload
+    return event
+
+
+def decode_event(payload):
+    """Return (event, roots) from a socket payload."""
+    if payload.startswith('{'):
+        try:
+            data = utils.json_loads(payload)
+            return data.get('event', '').lower(), data.get('roots')
+        except (ValueError, AttributeError):
+            return None, None
+    return payload.lower(), None
+
+
 class EventHandler(EventHandlerBase):
 
     q = None
+    # Roots changed since the last reconciliation, None means all of them
+    dirty_roots = set()
+    _dirty_roots_lock = threading.Lock()
 
     def initialize(self, conf_manager):
         LOG.info("Initialize Event Handler")
@@ -94,6 +121,7 @@ class EventHandler(EventHandlerBase):
         self.conf_manager = conf_manager
         self.listener = self._spawn_listener()
         EventHandler.q = queue.Queue()
+        EventHandler.dirty_roots = set()
         time.sleep(0)
         return self
 
@@ -138,10 +166,13 @@ class EventHandler(EventHandlerBase):
                     LOG.debug("Socket wasn't initialized before failure")
 
     def _recv_loop(self):
-        event = self.sock.recv(PAYLOAD_MAX_LEN)
-        LOG.debug("Received event %s" % event)
-        if event.lower() in EVENTS:
-            self._put_event(event)
+        payload = self.sock.recv(PAYLOAD_MAX_LEN)
+        LOG.debug("Received event %s" % payload)
+        event, roots = decode_event(payload)
+        if event == EVENT_SERVE:
+            self.serve()
+        elif event == EVENT_RECONCILE:
+            self.reconcile(roots=roots)
 
     def get_event(self, timeout=None):
         try:
@@ -152,12 +183,33 @@ class EventHandler(EventHandlerBase):
 
     @staticmethod
     def serve():
+        EventHandler._mark_dirty(None)
         EventHandler._put_event(EVENT_SERVE)
 
     @staticmethod
-    def reconcile():
+    def reconcile(roots=None):
+        EventHandler._mark_dirty(roots)
         EventHandler._put_event(EVENT_RECONCILE)
 
+    @staticmethod
+    def wakeup():
+        EventHandler._put_event(EVENT_WAKEUP)
+
+    @staticmethod
+    def _mark_dirty(roots):
+        with EventHandler._dirty_roots_lock:
+            if roots is None:
+                EventHandler.dirty_roots = None
+            elif EventHandler.dirty_roots is not None:
+                EventHandler.dirty_roots |= set(roots)
+
+    @staticmethod
+    def pop_dirty_roots():
+        """Roots to reconcile since the last call, None if all of them."""
+        with EventHandler._dirty_roots_lock:
+            roots, EventHandler.dirty_roots = EventHandler.dirty_roots, set()
+        return roots
+
     @staticmethod
     def _put_event(event):
         try:
@@ -191,8 +243,8 @@ class EventSender(SenderBase):
     def serve(self):
         self._send(EVENT_SERVE)
 
-    def reconcile(self):
-        self._send(EVENT_RECONCILE)
+    def reconcile(self, roots=None):
+        self._send(encode_event(EVENT_RECONCILE, roots))
 
     def _send(self, event):
         LOG.debug("Sending %s event" % event)
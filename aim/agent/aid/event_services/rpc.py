@@ -54,29 +54,33 @@ class AIDEventRpcApi(object):
         LOG.debug("Sending broadcast 'serve' message")
         return self._cast(context, 'serve', server)
 
-    def reconcile(self, context, server=None):
-        LOG.debug("Sending broadcast 'reconcile' message")
-        return self._cast(context, 'reconcile', server)
-
-    def _cast(self, context, method, server):
+    def reconcile(self, context, server=None, roots=None):
+        LOG.debug("Sending broadcast 'reconcile' message for roots %s" %
+                  roots)
+        kwargs = {}
+        if roots:
+            kwargs['roots'] = sorted(roots)
+        return self._cast(context, 'reconcile', server, **kwargs)
+
+    def _cast(self, context, method, server, **kwargs):
         if self.client:
             if server:
                 cctxt = self.client.prepare(server=server)
             else:
                 cctxt = self.client
-            return cctxt.cast(context, method, fanout=True)
+            return cctxt.cast(context, method, fanout=True, **kwargs)
 
     def tree_creation_postcommit(self, added, updated, deleted):
         should_serve = any(isinstance(x, tree.TypeTreeBase)
                            for x in added + deleted)
-        should_reconcile = any(isinstance(x, (tree.TypeTreeBase,
-                                              tree.ActionLog))
-                               for x in added + updated)
+        # Only the roots affected by this transaction need reconciliation
+        roots = set(x.root_rn for x in added + updated
+                    if isinstance(x, (tree.TypeTreeBase, tree.ActionLog)))
         if should_serve:
             self.serve({})
-        elif should_reconcile:
+        elif roots:
             # Serve implies a reconcile
-            self.reconcile({})
+            self.reconcile({}, roots=roots)
 
 
 class AIDEventServerRpcCallback(object):
@@ -92,7 +96,8 @@ class AIDEventServerRpcCallback(object):
         return self.sender.serve()
 
     def reconcile(self, context, **kwargs):
-        return self.sender.reconcile()
+        # Older clients don't send roots, reconcile everything then
+        return self.sender.reconcile(roots=kwargs.get('roots'))
 
 
 class Connection(object):
@@ -20,6 +20,7 @@ import time
 from oslo_log import log as logging
 import semantic_version
 
+from aim.agent.aid import cycle_stats
 from aim.agent.aid import event_handler
 from aim.agent.aid.universes.aci import aci_universe
 from aim.agent.aid.universes import aim_universe
@@ -32,6 +33,7 @@ from aim.common import utils
 from aim import config as aim_cfg
 from aim import context
 from aim.db import api
+from aim.db import sql_stats
 from aim import tree_manager
 
 LOG = logging.getLogger(__name__)
@@ -57,6 +59,8 @@ class AID(object):
         self.run_daemon_loop = True
         self.host = conf.aim.aim_service_identifier
 
+        sql_stats.enable_from_config(conf, 'aid')
+        cycle_stats.configure_from_config(conf)
         aim_ctx = context.AimContext(store=api.get_store())
         # This config manager is shared between multiple threads. Therefore
         # all DB activity through this config manager will use the same
@@ -108,9 +112,28 @@ class AID(object):
             self._change_report_interval, 'agent_report_interval', group='aim')
         self.squash_time = self.conf_manager.get_option_and_subscribe(
             self._change_squash_time, 'agent_event_squash_time', group='aim')
+        self.squash_max_time = self.conf_manager.get_option_and_subscribe(
+            self._change_squash_max_time, 'agent_event_squash_max_time',
+            group='aim')
+        # Time before which no new cycle can start
+        self._next_cycle_time = 0
+        # Seconds from the first event of a cycle to the end of the cycle,
+        # when changes have been handed to the ACI tenant managers
+        self.event_latency = {'last': 0.0, 'max': 0.0, 'total': 0.0,
+                              'count': 0}
+        self.full_sweep_interval = (
+            self.conf_manager.get_option_and_subscribe(
+                self._change_full_sweep_interval, 'agent_full_sweep_interval',
+                group='aim'))
+        self._last_full_sweep = 0
         self._spawn_heartbeat_loop()
         self.events = event_handler.EventHandler().initialize(
             self.conf_manager)
+        self.observer_interval = self.conf_manager.get_option(
+            'aim_observer_interval', 'aim')
+        if self.observer_interval > 0 and not self.k8s_watcher:
+            # The K8S watcher already keeps the trees up to date
+            self._spawn_observer_loop()
         self.max_down_time = 4 * self.report_interval
 
     def daemon_loop(self):
@@ -124,76 +147,124 @@ class AID(object):
         serve = False
         # wait first event
         first_event_time = None
-        squash_time = AID_EXIT_CHECK_INTERVAL
-        while squash_time > 0:
-            event = self.events.get_event(squash_time)
-            if not event and first_event_time is None:
-                # This is a lone timeout, just check if we need to exit
+        squash_deadline = None
+        timeout = AID_EXIT_CHECK_INTERVAL
+        while timeout > 0:
+            event = self.events.get_event(timeout)
+            now = time.time()
+            if event not in event_handler.EVENTS and first_event_time is None:
+                # This is a lone timeout or wakeup, just check if we need to
+                # exit
                 if not self.run_daemon_loop:
                     LOG.info("Stopping AID main loop.")
                     raise utils.StopLoop()
+                if self.full_sweep_interval > 0 and self._full_sweep_due():
+                    # Safety net in case some event was lost
+                    self.events.reconcile()
                 continue
-            if not first_event_time:
-                first_event_time = time.time()
-            if event in event_handler.EVENTS + [None]:
-                # Set squash timeout
-                squash_time = (first_event_time + self.squash_time -
-                               time.time())
+            if first_event_time is None:
+                first_event_time = now
+            if event in event_handler.EVENTS:
+                # Keep squashing while events keep coming
+                squash_deadline = now + self.squash_time
                 if event == event_handler.EVENT_SERVE:
                     # Serving tenants is required as well
                     serve = True
+            # Bursts can't delay the cycle more than squash_max_time, but
+            # cycles can't start more often than polling_interval
+            timeout = max(
+                min(squash_deadline, first_event_time +
+                    max(self.squash_time, self.squash_max_time)),
+                self._next_cycle_time) - now
+        roots = self.events.pop_dirty_roots()
+        if serve or self._full_sweep_due():
+            roots = None
         start_time = time.time()
-        self._reconciliation_cycle(serve)
-        utils.wait_for_next_cycle(start_time, self.polling_interval,
-                                  LOG, readable_caller='AID',
-                                  notify_exceeding_timeout=False)
+        self._reconciliation_cycle(serve, roots=roots)
+        self._next_cycle_time = start_time + self.polling_interval
+        self._record_event_latency(time.time() - first_event_time)
+
+    def _record_event_latency(self, latency):
+        self.event_latency['last'] = latency
+        self.event_latency['max'] = max(self.event_latency['max'], latency)
+        self.event_latency['total'] += latency
+        self.event_latency['count'] += 1
+        cycle_stats.record_event_latency(latency)
+        LOG.info("Event to APIC backlog latency: %.3fs (max %.3fs, average "
+                 "%.3fs)" % (latency, self.event_latency['max'],
+                             self.event_latency['total'] /
+                             self.event_latency['count']))
 
     @utils.retry_loop(DAEMON_LOOP_MAX_WAIT, DAEMON_LOOP_MAX_RETRIES, 'AID-REC',
                       fail=False, return_=True)
-    def _reconciliation_cycle(self, serve=True):
+    def _reconciliation_cycle(self, serve=True, roots=None):
         # Regenerate context at each reconciliation cycle
         # TODO(ivar): set request-id so that oslo log can track it
-        aim_ctx = context.AimContext(store=api.get_store())
+        aim_ctx = context.AimContext(store=api.get_store(), cache=True)
+        sql_stats.start_cycle()
+        cycle_stats.start_cycle()
+        if serve:
+            # Serving might change the set of roots, observe all of them
+            roots = None
+        if roots is None:
+            self._last_full_sweep = time.time()
         if serve:
             LOG.info("Start serving cycle.")
-            tenants = self._calculate_tenants(aim_ctx)
+            with cycle_stats.measure('calculate_tenants'):
+                tenants = self._calculate_tenants(aim_ctx)
             # Serve tenants
             for pair in self.multiverse:
-                pair[DESIRED].serve(aim_ctx, tenants)
-                pair[CURRENT].serve(aim_ctx, tenants)
+                for universe in (pair[DESIRED], pair[CURRENT]):
+                    with cycle_stats.measure('serve', universe.name):
+                        universe.serve(aim_ctx, tenants)
             LOG.info("AID %s is currently serving: "
                      "%s" % (self.agent.id, tenants))
 
-        LOG.info("Start reconciliation cycle.")
+        if roots is None:
+            LOG.info("Start reconciliation cycle.")
+        else:
+            LOG.info("Start reconciliation cycle for roots %s." % roots)
         # REVISIT(ivar) Might be wise to wait here upon tenant serving to allow
         # time for events to happen
 
         # Observe the two universes to fix their current state
         with utils.get_rlock(lcon.AID_OBSERVER_LOCK):
             for pair in self.multiverse:
-                pair[DESIRED].observe(aim_ctx)
-                pair[CURRENT].observe(aim_ctx)
+                for universe in (pair[DESIRED], pair[CURRENT]):
+                    with cycle_stats.measure('observe', universe.name):
+                        universe.observe(aim_ctx, roots=roots)
 
         delete_candidates = set()
         vetoes = set()
         for pair in self.multiverse:
-            pair[DESIRED].vote_deletion_candidates(
-                aim_ctx, pair[CURRENT], delete_candidates, vetoes)
-            pair[CURRENT].vote_deletion_candidates(
-                aim_ctx, pair[DESIRED], delete_candidates, vetoes)
+            for mine, other in ((pair[DESIRED], pair[CURRENT]),
+                                (pair[CURRENT], pair[DESIRED])):
+                with cycle_stats.measure('vote_deletion_candidates',
+                                         mine.name):
+                    mine.vote_deletion_candidates(
+                        aim_ctx, other, delete_candidates, vetoes)
         # Reconcile everything
         changes = False
         for pair in self.multiverse:
-            changes |= pair[CURRENT].reconcile(aim_ctx, pair[DESIRED],
-                                               delete_candidates)
+            with cycle_stats.measure('reconcile', pair[CURRENT].name):
+                changes |= pair[CURRENT].reconcile(
+                    aim_ctx, pair[DESIRED], delete_candidates, roots=roots)
+        deferred = set()
+        for pair in self.multiverse:
+            deferred |= pair[CURRENT].pop_deferred_roots()
+        if deferred:
+            # Tenants over their key budget need another cycle
+            self.events.reconcile(roots=deferred)
         if not changes:
             LOG.info("Congratulations! your multiverse is nice and synced :)")
 
         for pair in self.multiverse:
-            pair[DESIRED].finalize_deletion_candidates(aim_ctx, pair[CURRENT],
-                                                       delete_candidates)
-            pair[CURRENT].finalize_deletion_candidates(aim_ctx, pair[DESIRED],
-                                                       delete_candidates)
+            for mine, other in ((pair[DESIRED], pair[CURRENT]),
+                                (pair[CURRENT], pair[DESIRED])):
+                with cycle_stats.measure('finalize_deletion_candidates',
+                                         mine.name):
+                    mine.finalize_deletion_candidates(aim_ctx, other,
+                                                      delete_candidates)
 
         # Delete tenants if there's consensus
         for tenant in delete_candidates:
@@ -202,11 +273,37 @@ class AID(object):
                 for universe in pair.values():
                     LOG.info("%s removing tenant from AID %s" %
                              (universe.name, tenant))
-                    universe.cleanup_state(aim_ctx, tenant)
+                    with cycle_stats.measure('cleanup_state', universe.name,
+                                             tenant):
+                        universe.cleanup_state(aim_ctx, tenant)
+        if aim_ctx.cache:
+            LOG.debug("Identity cache stats for this cycle: %s",
+                      aim_ctx.cache.stats())
+        sql_stats.end_cycle(log=LOG, name='reconciliation cycle')
+        cycle_stats.end_cycle(log=LOG)
 
     def _spawn_heartbeat_loop(self):
         utils.spawn_thread(self._heartbeat_loop)
 
+    def _spawn_observer_loop(self):
+        utils.spawn_thread(self._observer_loop)
+
+    @utils.retry_loop(DAEMON_LOOP_MAX_WAIT, DAEMON_LOOP_MAX_RETRIES,
+                      'AID-OBSERVER')
+    def _observer_loop(self):
+        if not self.run_daemon_loop:
+            raise utils.StopLoop()
+        start_time = time.time()
+        # New context, sessions are not thread safe
+        aim_ctx = context.AimContext(store=api.get_store())
+        with utils.get_rlock(lcon.AID_OBSERVER_LOCK):
+            for pair in self.multiverse:
+                for universe in pair.values():
+                    universe.background_observe(aim_ctx)
+        utils.wait_for_next_cycle(start_time, self.observer_interval,
+                                  LOG, readable_caller='AID-OBSERVER',
+                                  notify_exceeding_timeout=False)
+
     @utils.retry_loop(HB_LOOP_MAX_WAIT, HB_LOOP_MAX_WAIT, 'AID-HB', fail=True)
     def _heartbeat_loop(self):
         start_time = time.time()
@@ -281,20 +378,33 @@ class AID(object):
     def _handle_sigterm(self, signum, frame):
         LOG.warn("Agent caught SIGTERM, quitting daemon loop.")
         self.run_daemon_loop = False
+        self.events.wakeup()
         if self.k8s_watcher:
             self.k8s_watcher.stop_threads()
 
     def _change_polling_interval(self, new_conf):
-        # TODO(ivar): interrupt current sleep and restart with new value
+        self._next_cycle_time += new_conf['value'] - self.polling_interval
         self.polling_interval = new_conf['value']
+        self.events.wakeup()
 
     def _change_report_interval(self, new_conf):
         # TODO(ivar): interrupt current sleep and restart with new value
         self.report_interval = new_conf['value']
 
     def _change_squash_time(self, new_conf):
-        # TODO(ivar): interrupt current sleep and restart with new value
         self.squash_time = new_conf['value']
+        self.events.wakeup()
+
+    def _change_squash_max_time(self, new_conf):
+        self.squash_max_time = new_conf['value']
+        self.events.wakeup()
+
+    def _change_full_sweep_interval(self, new_conf):
+        self.full_sweep_interval = new_conf['value']
+
+    def _full_sweep_due(self):
+        return (time.time() - self._last_full_sweep >=
+                self.full_sweep_interval)
 
 
 def main():
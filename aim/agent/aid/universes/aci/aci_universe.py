@@ -14,6 +14,9 @@
 #    under the License.
 
 import collections
+import json
+import Queue as queue
+import threading
 import time
 import traceback
 
@@ -46,6 +49,9 @@ LOG = logging.getLogger(__name__)
 # instance of each per AID agent.
 serving_tenants = {}
 ws_context = None
+tenant_worker_pool = None
+apic_session_pool = None
+full_reset_limiter = None
 
 
 class WebSocketSessionLoginFailed(exceptions.AimException):
@@ -63,6 +69,18 @@ class WebSocketUnsubscriptionFailed(exceptions.AimException):
                "with error %(code)s: %(text)s")
 
 
+class NotifyingQueue(queue.Queue):
+    """Queue that hands a copy of every item to a callback."""
+
+    def __init__(self, callback):
+        queue.Queue.__init__(self)
+        self._callback = callback
+
+    def put(self, item, *args, **kwargs):
+        queue.Queue.put(self, item, *args, **kwargs)
+        self._callback(item)
+
+
 class WebSocketContext(object):
     """Placeholder for websocket session"""
     EMPTY_URLS = ["empty/url"]
@@ -77,6 +95,14 @@ class WebSocketContext(object):
         self.login_thread = None
         self.subs_thread = None
         self.monitor_thread = None
+        # Subscription URL -> threading.Event of the tenant owning it
+        self._listeners = {}
+        self._listeners_lock = threading.Lock()
+        self.dispatcher_thread = None
+        # Raw websocket events waiting to be routed to their listeners
+        self._dispatch_q = queue.Queue()
+        # Subscription ID -> subscription URL
+        self._subscription_urls = {}
         self.establish_ws_session()
 
     def _spawn_monitors(self):
@@ -87,6 +113,24 @@ class WebSocketContext(object):
                                                      self.monitor_runs)
         self.login_thread = self.session.login_thread
         self.subs_thread = self.session.subscription_thread
+        self._watch_event_queue()
+
+    def _watch_event_queue(self):
+        # acitoolkit only sorts events by subscription URL when they are
+        # polled, get a copy of every event received by the new session
+        # so that only the tenants having work to do are woken up.
+        subscriber = self.session.subscription_thread
+        self._subscription_urls = {}
+        if not isinstance(subscriber._event_q, NotifyingQueue):
+            event_q = NotifyingQueue(self._dispatch_q.put)
+            while not subscriber._event_q.empty():
+                event_q.put(subscriber._event_q.get())
+            subscriber._event_q = event_q
+        # Tenants need to run to subscribe again after a reconnection
+        with self._listeners_lock:
+            listeners = self._listeners.values()
+        for ready in listeners:
+            ready.set()
 
     def _reload_websocket_config(self):
         # Don't subscribe in this case
@@ -218,6 +262,78 @@ class WebSocketContext(object):
         self.subscribe(urls)
         return any(self.session.has_events(url) for url in urls)
 
+    def register_listener(self, urls, ready=None):
+        """Return an event that is set when any of the URLs gets events.
+
+        A single dispatcher thread watches the URLs of all the tenants, so
+        that tenant managers can sleep until there's work for them instead
+        of polling the websocket session. An event-like object can be
+        passed in place of the default threading.Event.
+        """
+        ready = ready or threading.Event()
+        with self._listeners_lock:
+            for url in urls:
+                self._listeners[url] = ready
+            if not self.dispatcher_thread:
+                self.dispatcher_thread = utils.spawn_thread(
+                    self._dispatch_loop)
+        return ready
+
+    def unregister_listener(self, urls):
+        with self._listeners_lock:
+            for url in urls:
+                self._listeners.pop(url, None)
+
+    def _dispatch_loop(self):
+        while True:
+            try:
+                self._dispatch_events()
+            except Exception as e:
+                # Session might be reconnecting
+                LOG.debug("Failed to dispatch websocket events: %s" %
+                          e.message)
+
+    def _dispatch_events(self, block=True):
+        """Wake up the listeners of the URLs that received events.
+
+        Waits for the websocket to receive events, and only looks up the
+        subscriptions they refer to: idle tenants cost nothing.
+        """
+        try:
+            events = [self._dispatch_q.get(block=block)]
+        except queue.Empty:
+            return
+        while True:
+            try:
+                events.append(self._dispatch_q.get_nowait())
+            except queue.Empty:
+                break
+        urls = set()
+        for event in events:
+            try:
+                subscription_ids = json.loads(event)['subscriptionId']
+            except (ValueError, TypeError, KeyError):
+                continue
+            for subscription_id in subscription_ids:
+                url = self._get_subscription_url(str(subscription_id))
+                if url:
+                    urls.add(url)
+        with self._listeners_lock:
+            listeners = [self._listeners[x] for x in urls
+                         if x in self._listeners]
+        for ready in listeners:
+            ready.set()
+
+    def _get_subscription_url(self, subscription_id):
+        url = self._subscription_urls.get(subscription_id)
+        if url is None:
+            # IDs change whenever URLs are subscribed again
+            subscriptions = self.session.subscription_thread._subscriptions
+            self._subscription_urls = {
+                str(v): k for k, v in subscriptions.items() if v is not None}
+            url = self._subscription_urls.get(subscription_id)
+        return url
+
     def _thread_monitor(self, flag):
         login_thread_name = 'login_thread'
         subscription_thread_name = 'subscription_thread'
@@ -269,6 +385,34 @@ def get_websocket_context(apic_config):
     return ws_context
 
 
+def get_tenant_worker_pool(apic_config):
+    """Return the pool shared by all the tenant managers, if configured."""
+    global tenant_worker_pool
+    workers = apic_config.get_option('aci_tenant_workers', 'aim')
+    if workers and not tenant_worker_pool:
+        tenant_worker_pool = aci_tenant.AciTenantWorkerPool(workers)
+    return tenant_worker_pool
+
+
+def get_apic_session_pool(apic_config):
+    """Return the APIC sessions shared by all the tenants, if configured."""
+    global apic_session_pool
+    size = apic_config.get_option('apic_session_pool_size', 'aim')
+    if size and not apic_session_pool:
+        apic_session_pool = aci_tenant.ApicSessionPool(
+            lambda: AciUniverse.establish_aci_session(apic_config), size)
+    return apic_session_pool
+
+
+def get_full_reset_limiter(apic_config):
+    """Return the limiter of concurrent tenant resets, if configured."""
+    global full_reset_limiter
+    size = apic_config.get_option('aci_tenant_max_concurrent_resets', 'aim')
+    if size and not full_reset_limiter:
+        full_reset_limiter = aci_tenant.FullResetLimiter(size)
+    return full_reset_limiter
+
+
 class AciUniverse(base.HashTreeStoredUniverse):
     """HashTree Universe of the ACI state.
 
@@ -285,6 +429,9 @@ class AciUniverse(base.HashTreeStoredUniverse):
         aci_tenant.get_children_mos(self.aci_session, 'tn-common')
         aci_tenant.get_children_mos(self.aci_session, 'pod-1')
         self.ws_context = get_websocket_context(self.conf_manager)
+        self.tenant_pool = get_tenant_worker_pool(self.conf_manager)
+        self.session_pool = get_apic_session_pool(self.conf_manager)
+        self.reset_limiter = get_full_reset_limiter(self.conf_manager)
         self.aim_system_id = self.conf_manager.get_option('aim_system_id',
                                                           'aim')
         return self
@@ -360,7 +507,9 @@ class AciUniverse(base.HashTreeStoredUniverse):
                         added, self.conf_manager, self.aci_session,
                         self.ws_context, self.creation_succeeded,
                         self.tenant_creation_failed, self.aim_system_id,
-                        self.get_resources)
+                        self.get_resources, pool=self.tenant_pool,
+                        session_pool=self.session_pool,
+                        reset_limiter=self.reset_limiter)
                     # A subscription might be leaking here
                     serving_tenants[added]._unsubscribe_tenant()
                     serving_tenants[added].start()
@@ -378,14 +527,19 @@ class AciUniverse(base.HashTreeStoredUniverse):
         context = aim_ctx.AimContext(store=store)
         self.creation_failed(context, aim_object, reason=reason, error=error)
 
-    def observe(self, context):
+    def observe(self, context, roots=None):
         # Copy state accumulated so far
         global serving_tenants
         new_state = {}
         for tenant in serving_tenants.keys():
+            if (roots is not None and tenant not in roots and
+                    tenant in self._state and self._is_warm(tenant)):
+                # Nothing changed since the last observation
+                new_state[tenant] = self._state[tenant]
+                continue
             # Only copy state if the tenant is warm
             with utils.get_rlock(lcon.ACI_TREE_LOCK_NAME_PREFIX + tenant):
-                if serving_tenants[tenant].is_warm():
+                if self._is_warm(tenant):
                     new_state[tenant] = self._get_state_copy(tenant)
         self._state = new_state
 
@@ -428,8 +582,7 @@ class AciUniverse(base.HashTreeStoredUniverse):
             if data.keys()[0] == 'tagInst':
                 # Retrieve tag parent
                 dn = data.values()[0]['attributes']['dn']
-                decomposed = apic_client.DNManager().aci_decompose_dn_guess(
-                    dn, 'tagInst')
+                decomposed = utils.decompose_dn_guess(dn, 'tagInst')
                 parent_type = decomposed[1][-2][0]
                 data = {
                     parent_type: {
@@ -460,7 +613,7 @@ class AciUniverse(base.HashTreeStoredUniverse):
                 dn = aci_object.values()[0]['attributes']['dn']
                 res_type = aci_object.keys()[0]
                 dn_mgr = apic_client.DNManager()
-                mo, rns = dn_mgr.aci_decompose_dn_guess(dn, res_type)
+                mo, rns = utils.decompose_dn_guess(dn, res_type)
                 if len(rns) > 1:
                     parent_dn = dn_mgr.build(rns[:-1])
                     parent_type, xxx = rns[-2]
@@ -489,6 +642,10 @@ class AciUniverse(base.HashTreeStoredUniverse):
         global serving_tenants
         return serving_tenants[tenant].get_state_copy()
 
+    def _is_warm(self, tenant):
+        global serving_tenants
+        return serving_tenants[tenant].is_config_warm()
+
     @staticmethod
     def establish_aci_session(apic_config):
         return apic_client.RestClient(
@@ -541,6 +698,10 @@ class AciOperationalUniverse(AciUniverse):
         global serving_tenants
         return serving_tenants[tenant].get_operational_state_copy()
 
+    def _is_warm(self, tenant):
+        global serving_tenants
+        return serving_tenants[tenant].is_warm()
+
     def get_resources_for_delete(self, resource_keys):
         curr_mon = self.multiverse[base.MONITOR_UNIVERSE]['current'].state
 
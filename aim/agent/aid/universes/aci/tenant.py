@@ -13,8 +13,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
 import copy
+import heapq
+import itertools
+import os
 import Queue
+import threading
 import time
 import traceback
 
@@ -45,6 +50,18 @@ TOPOLOGY_CHILDREN_LIST = ['fabricPod', 'opflexODev', 'fabricTopology']
 CHILDREN_MOS_UNI = None
 CHILDREN_MOS_TOPOLOGY = None
 RESET_INTERVAL = 3600
+# Scheduled resets postponed by the full reset limiter are retried after
+# this many seconds (+- 50%)
+RESET_RETRY_INTERVAL = 60
+# Object counts can't tell modified objects apart, tenants verifying their
+# state on scheduled resets still fully reset after this many verifications
+MAX_RESET_VERIFICATIONS = 5
+# Maximum time a tenant manager sleeps waiting for events
+TENANT_MAX_IDLE_TIME = 10
+# The configuration tree is saved in the warm start cache after a quiet
+# loop, at most this often, and caches older than RESET_INTERVAL are not
+# loaded
+TREE_CACHE_SAVE_INTERVAL = 300
 DEFAULT_WS_TO = '900'
 
 
@@ -52,6 +69,173 @@ class ScheduledReset(Exception):
     pass
 
 
+class AciTenantWorkerPool(object):
+    """Run the loops of many tenant managers on a fixed number of threads.
+
+    Tenant managers attached to a pool don't own a thread, they are
+    scheduled on one of the workers whenever they are ready: when they
+    receive websocket events, when their push backlog is filled, or when
+    their idle/backoff timer expires. A manager is never run by more than
+    one worker at the same time.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._cond = threading.Condition()
+        self._ready = collections.deque()
+        # Managers either waiting in the ready queue or being run
+        self._queued = set()
+        self._running = set()
+        # Managers scheduled while running, they will run once more
+        self._rerun = set()
+        # Heap of (due time, sequence, manager) and earliest due per manager
+        self._timers = []
+        self._due = {}
+        self._sequence = itertools.count()
+        self._threads = [utils.spawn_thread(self._work) for _ in range(size)]
+
+    def schedule(self, manager, delay=0):
+        """Run the manager once, after at least delay seconds."""
+        with self._cond:
+            if delay > 0:
+                due = time.time() + delay
+                if manager in self._due and self._due[manager] <= due:
+                    return
+                self._due[manager] = due
+                heapq.heappush(self._timers,
+                               (due, next(self._sequence), manager))
+            else:
+                self._enqueue(manager)
+            self._cond.notify()
+
+    def _enqueue(self, manager):
+        if manager in self._running:
+            self._rerun.add(manager)
+        elif manager not in self._queued:
+            self._queued.add(manager)
+            self._ready.append(manager)
+
+    def _next(self):
+        with self._cond:
+            while True:
+                now = time.time()
+                while self._timers and self._timers[0][0] <= now:
+                    due, _, manager = heapq.heappop(self._timers)
+                    # Stale timers were replaced by an earlier one
+                    if self._due.get(manager) == due:
+                        del self._due[manager]
+                        self._enqueue(manager)
+                if self._ready:
+                    manager = self._ready.popleft()
+                    self._queued.discard(manager)
+                    self._running.add(manager)
+                    return manager
+                timeout = (self._timers[0][0] - now) if self._timers else None
+                self._cond.wait(timeout)
+
+    def _done(self, manager):
+        with self._cond:
+            self._running.discard(manager)
+            if manager in self._rerun:
+                self._rerun.discard(manager)
+                self._enqueue(manager)
+                self._cond.notify()
+
+    def _work(self):
+        while True:
+            manager = self._next()
+            try:
+                manager.run_step()
+            except Exception as e:
+                LOG.error("Unexpected error running tenant %s: %s" %
+                          (manager.tenant_name, e.message))
+                LOG.debug(traceback.format_exc())
+            finally:
+                self._done(manager)
+
+
+class ApicSessionPool(object):
+    """Authenticated APIC sessions shared by all the tenant managers.
+
+    Every request is run on a worker thread holding one of the sessions,
+    so the pool size bounds the number of concurrent requests to APIC.
+    """
+
+    def __init__(self, session_factory, size):
+        self.size = size
+        self._sessions = Queue.Queue()
+        for _ in range(size):
+            self._sessions.put(session_factory())
+        self._workers = utils.WorkerPool(size, name='apic-session')
+
+    def delete(self, dn_groups, max_concurrency=None):
+        """DELETE groups of DNs concurrently.
+
+        The DNs of a group are deleted in order, by the same session. At
+        most max_concurrency requests of the caller run at the same time.
+
+        :return: list of (DN, exception) tuples for the failed requests.
+        """
+        lanes = [[] for _ in range(min(max_concurrency or self.size,
+                                       len(dn_groups)))]
+        for group in sorted(dn_groups, key=len, reverse=True):
+            min(lanes, key=len).extend(group)
+        failures = []
+        for result in self._workers.map(self._delete, lanes):
+            failures.extend(result or [])
+        return failures
+
+    def _delete(self, dns):
+        failures = []
+        session = self._sessions.get()
+        try:
+            for dn in dns:
+                try:
+                    session.DELETE('/mo/%s.json' % dn)
+                except Exception as e:
+                    failures.append((dn, e))
+        finally:
+            self._sessions.put(session)
+        return failures
+
+
+class FullResetLimiter(object):
+    """Bound the number of tenants reloading their full state at once.
+
+    A slot is taken when a scheduled reset starts, and released once the
+    tenant is warm again. Tenants that can't get a slot postpone their
+    reset.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._slots = threading.BoundedSemaphore(size)
+
+    def acquire(self):
+        return self._slots.acquire(False)
+
+    def release(self):
+        self._slots.release()
+
+
+class PoolWakeup(object):
+    """Event-like object scheduling a pooled tenant manager when set."""
+
+    def __init__(self, manager):
+        self.manager = manager
+        self._flag = False
+
+    def is_set(self):
+        return self._flag
+
+    def set(self):
+        self._flag = True
+        self.manager.schedule()
+
+    def clear(self):
+        self._flag = False
+
+
 def get_children_mos(apic_session, root):
     root_type = 'uni'
     try:
@@ -162,7 +346,8 @@ class AciTenantManager(utils.AIMThread):
 
     def __init__(self, tenant_name, apic_config, apic_session, ws_context,
                  creation_succeeded=None, creation_failed=None,
-                 aim_system_id=None, get_resources=None, *args, **kwargs):
+                 aim_system_id=None, get_resources=None, pool=None,
+                 session_pool=None, reset_limiter=None, *args, **kwargs):
         super(AciTenantManager, self).__init__(*args, **kwargs)
         LOG.info("Init manager for tenant %s" % tenant_name)
         self.get_resources = get_resources
@@ -182,6 +367,27 @@ class AciTenantManager(utils.AIMThread):
         self._monitored_state = structured_tree.StructuredHashTree()
         self.polling_yield = self.apic_config.get_option(
             'aci_tenant_polling_yield', 'aim')
+        self.push_batch_size = self.apic_config.get_option(
+            'aci_push_batch_size', 'aim')
+        # Deletes run concurrently when a session pool is available
+        self.session_pool = session_pool
+        self.delete_concurrency = self.apic_config.get_option(
+            'aci_tenant_delete_concurrency', 'aim')
+        self.tree_cache_dir = self.apic_config.get_option(
+            'aci_tree_cache_dir', 'aim')
+        self._cache_dirty = False
+        self._cache_saved = 0
+        # Scheduled resets verify the state against APIC instead of
+        # reloading it, see _verify_state
+        self.reset_verify = self.apic_config.get_option(
+            'aci_tenant_reset_verify', 'aim')
+        # class -> DNs received from the subscription
+        self._known_dns = {}
+        self._verifications = 0
+        self.reset_limiter = reset_limiter
+        self._reset_slot = False
+        # The slot is released by either the tenant or the AID thread
+        self._reset_slot_lock = threading.Lock()
         self.to_aim_converter = converter.AciToAimModelConverter()
         self.to_aci_converter = converter.AimToAciModelConverter()
         self._reset_object_backlog()
@@ -198,7 +404,16 @@ class AciTenantManager(utils.AIMThread):
         # Warm bit to avoid rushed synchronization before receiving the first
         # batch of APIC events
         self._warm = False
+        # Set when the configuration tree is loaded from the warm start cache,
+        # until the subscription replaces it
+        self._cache_warm = False
         self.ws_context = ws_context
+        # When a worker pool is used, this manager doesn't own a thread
+        self._pool = pool
+        self._subscribed = False
+        self._rest_until = 0
+        # Set by the websocket dispatcher when this tenant has events
+        self._events_ready = PoolWakeup(self) if pool else None
         self.recovery_retries = None
         self.max_retries = 5
         self.error_handler = error.APICAPIErrorHandler()
@@ -208,23 +423,57 @@ class AciTenantManager(utils.AIMThread):
 
     def _reset_object_backlog(self):
         self.object_backlog = Queue.Queue()
+        # (operation, DN) -> (list, position) of the items in the backlog
+        self._backlog_index = {}
+
+    @staticmethod
+    def _backlog_dn(op, item):
+        if op == base_universe.CREATE:
+            return item.dn
+        # Delete items are in ACI format
+        return item.values()[0]['attributes']['dn']
 
     def kill(self, *args, **kwargs):
         try:
+            self._release_reset_slot()
             self._unsubscribe_tenant(kill=True)
         except Exception as e:
             LOG.warn("Failed to unsubscribe tenant during kill "
                      "procedure: %s %s" % (self.tenant_name, e.message))
         finally:
+            if self._pool:
+                self._stop = True
             super(AciTenantManager, self).kill(*args, **kwargs)
+            self._wake_up()
+
+    def _wake_up(self):
+        if self._events_ready:
+            self._events_ready.set()
+
+    def _wait_for_events(self):
+        ready = self._events_ready
+        if not ready:
+            return
+        if self.object_backlog.empty():
+            ready.wait(max(0, min(TENANT_MAX_IDLE_TIME,
+                                  self.scheduled_reset - time.time())))
+        # Anything happening from now on will be handled by the next loop
+        ready.clear()
 
     def is_dead(self):
+        if self._pool:
+            return self._stop
         # Wrapping the greenlet property for easier testing
         return self.dead
 
     def is_warm(self):
         return self._warm
 
+    def is_config_warm(self):
+        # The cached configuration tree can be served before subscribing,
+        # operational and monitored state always come from APIC
+        return self.is_warm() or self._cache_warm
+
     def get_state_copy(self):
         with utils.get_rlock(lcon.ACI_TREE_LOCK_NAME_PREFIX +
                              self.tenant_name):
@@ -246,6 +495,81 @@ class AciTenantManager(utils.AIMThread):
                 str(self._monitored_state),
                 root_key=self._monitored_state.root_key)
 
+    def start(self):
+        if self.tree_cache_dir and self.load_tree_cache():
+            # Serve the cached configuration until the subscription
+            # replaces it
+            self._cache_warm = True
+        if self._pool:
+            LOG.debug("Scheduling tenant %s on the worker pool" %
+                      self.tenant_name)
+            self._pool.schedule(self)
+            return self
+        return super(AciTenantManager, self).start()
+
+    def schedule(self):
+        if self._pool and not self._stop:
+            # Don't run more often than the polling yield allows
+            self._pool.schedule(self, self._rest_until - time.time())
+
+    def run_step(self):
+        """Run one iteration of the tenant loop on a pool worker."""
+        if self._stop:
+            return
+        try:
+            delay = self._step()
+        except Exception as e:
+            LOG.error(traceback.format_exc())
+            LOG.error("Stopping manager for tenant %s: %s" %
+                      (self.tenant_name, e.message))
+            self.kill()
+            return
+        self._rest_until = time.time() + self.polling_yield
+        if not self._stop:
+            self._pool.schedule(self, delay)
+
+    def _step(self):
+        """Pooled equivalent of a _main_loop iteration.
+
+        Returns the number of seconds after which the tenant needs to run
+        again even if no events are received.
+        """
+        # Anything happening from now on will be handled by the next step
+        self._events_ready.clear()
+        try:
+            if not self._subscribed:
+                self._subscribe_tenant()
+                self._subscribed = True
+            else:
+                if time.time() > self.scheduled_reset:
+                    self._check_scheduled_reset()
+                self._event_loop()
+            self.recovery_retries = None
+        except ScheduledReset:
+            self._subscribed = False
+            self._unsubscribe_for_reset()
+            return 0
+        except Exception as e:
+            LOG.error("An exception has occurred serving tenant %s, "
+                      "error: %s" % (self.tenant_name, e.message))
+            LOG.error(traceback.format_exc())
+            self._subscribed = False
+            self._release_reset_slot()
+            self._unsubscribe_tenant()
+            # Back off without blocking the worker
+            self.recovery_retries = self.recovery_retries or utils.Counter()
+            backoff = utils.get_backoff_time(TENANT_FAILURE_MAX_WAIT,
+                                             self.recovery_retries.get())
+            self.recovery_retries.increment()
+            if self.recovery_retries.get() >= self.max_retries:
+                LOG.error("Exceeded max recovery retries for tenant %s. "
+                          "Destroying the manager." %
+                          self.tenant_name)
+                self.kill()
+            return backoff
+        return max(0, min(TENANT_MAX_IDLE_TIME,
+                          self.scheduled_reset - time.time()))
+
     def run(self):
         LOG.debug("Starting main loop for tenant %s" % self.tenant_name)
         try:
@@ -256,6 +580,7 @@ class AciTenantManager(utils.AIMThread):
             LOG.error("Exiting thread for tenant %s: %s" %
                       (self.tenant_name, e.message))
             try:
+                self._release_reset_slot()
                 self._unsubscribe_tenant()
             except Exception as e:
                 LOG.error("An exception has occurred while exiting thread "
@@ -276,7 +601,7 @@ class AciTenantManager(utils.AIMThread):
             while not self._stop and self.num_loop_runs > 0:
                 start = time.time()
                 if start > self.scheduled_reset:
-                    raise ScheduledReset()
+                    self._check_scheduled_reset()
                 self._event_loop()
                 curr_time = time.time() - start
                 if abs(curr_time - last_time) > epsilon:
@@ -290,13 +615,15 @@ class AciTenantManager(utils.AIMThread):
                 # Successfull run
                 self.num_loop_runs -= 1
                 self.recovery_retries = None
+                if not self._stop and self.num_loop_runs > 0:
+                    self._wait_for_events()
         except ScheduledReset:
-            LOG.info("Scheduled tree reset for root %s" % self.tenant_name)
-            self._unsubscribe_tenant()
+            self._unsubscribe_for_reset()
         except Exception as e:
             LOG.error("An exception has occurred in thread serving tenant "
                       "%s, error: %s" % (self.tenant_name, e.message))
             LOG.error(traceback.format_exc())
+            self._release_reset_slot()
             self._unsubscribe_tenant()
             self.recovery_retries = utils.exponential_backoff(
                 TENANT_FAILURE_MAX_WAIT, tentative=self.recovery_retries)
@@ -306,6 +633,106 @@ class AciTenantManager(utils.AIMThread):
                           self.tenant_name)
                 self.kill()
 
+    def _check_scheduled_reset(self):
+        """Handle a scheduled reset that is due.
+
+        Raises ScheduledReset when the tenant has to reload its full state,
+        otherwise the next reset is rescheduled.
+        """
+        if (self.reset_verify and not self.tenant.dn.startswith('topology')
+                and self._verifications < MAX_RESET_VERIFICATIONS):
+            try:
+                self._verify_state()
+            except Exception as e:
+                LOG.warn("Failed to verify the state of root %s, "
+                         "falling back to a full reset: %s" %
+                         (self.tenant_name, e.message))
+            else:
+                self._verifications += 1
+                self.scheduled_reset = utils.schedule_next_event(
+                    RESET_INTERVAL, 0.2)
+                return
+        if self.reset_limiter:
+            with self._reset_slot_lock:
+                if not self._reset_slot:
+                    if not self.reset_limiter.acquire():
+                        LOG.debug("Too many concurrent resets, postponing "
+                                  "reset of root %s" % self.tenant_name)
+                        self.scheduled_reset = utils.schedule_next_event(
+                            RESET_RETRY_INTERVAL, 0.5)
+                        return
+                    self._reset_slot = True
+        self._verifications = 0
+        raise ScheduledReset()
+
+    def _unsubscribe_for_reset(self):
+        LOG.info("Scheduled tree reset for root %s" % self.tenant_name)
+        try:
+            self._unsubscribe_tenant()
+        except Exception:
+            # The reset won't complete, don't keep other roots waiting
+            self._release_reset_slot()
+            raise
+
+    def _release_reset_slot(self):
+        with self._reset_slot_lock:
+            if not self._reset_slot:
+                return
+            self._reset_slot = False
+        self.reset_limiter.release()
+
+    def _verify_state(self):
+        """Compare the objects known by this tenant with APIC.
+
+        A single count query covers all the subscribed classes. When it
+        doesn't match, every class is counted and only the objects of the
+        classes whose count differs are downloaded again.
+        """
+        classes = sorted(self.tenant.filtered_children)
+        if not classes:
+            raise Exception("Unfiltered subscription")
+        url = '/node/mo/%s.json?query-target=subtree&target-subtree-class=%s'
+        count_url = url + '&rsp-subtree-include=count'
+        known = self._known_dns
+        if (self._count_objects(count_url % (self.tenant.dn,
+                                             ','.join(classes))) ==
+                sum(len(known.get(x, [])) for x in classes)):
+            return
+        diverged = [x for x in classes if
+                    self._count_objects(count_url % (self.tenant.dn, x)) !=
+                    len(known.get(x, []))]
+        if not diverged:
+            # Objects changed between the queries, next verification will
+            # tell
+            return
+        LOG.info("Classes %s of root %s diverged from APIC, retrieving "
+                 "them again" % (diverged, self.tenant_name))
+        events = self.aci_session.GET(url % (self.tenant.dn,
+                                             ','.join(diverged)))
+        current = set(x.values()[0]['attributes']['dn'] for x in events)
+        for klass in diverged:
+            for dn in known.get(klass, set()) - current:
+                events.append({klass: {'attributes': {
+                    'dn': dn, STATUS_FIELD: 'deleted'}}})
+        self._process_events(events)
+
+    def _count_objects(self, url):
+        result = self.aci_session.GET(url)
+        return int(result[0]['moCount']['attributes']['count'])
+
+    def _track_objects(self, events):
+        classes = set(self.tenant.filtered_children)
+        for event in events:
+            klass = event.keys()[0]
+            if klass not in classes:
+                continue
+            attrs = event[klass]['attributes']
+            dns = self._known_dns.setdefault(klass, set())
+            if attrs.get(STATUS_FIELD) == 'deleted':
+                dns.discard(attrs['dn'])
+            else:
+                dns.add(attrs['dn'])
+
     def _event_loop(self):
         start_time = time.time()
         # Push the backlog at right before the event loop, so that
@@ -313,46 +740,123 @@ class AciTenantManager(utils.AIMThread):
         # iteration.
         self._push_aim_resources()
         if self.ws_context.has_event(self.tenant.urls):
-            with utils.get_rlock(lcon.ACI_TREE_LOCK_NAME_PREFIX +
-                                 self.tenant_name):
-                events = self.ws_context.get_event_data(self.tenant.urls)
-                for event in events:
-                    # REVISIT(ivar): remove vmmDomP once websocket ACI bug is
-                    # fixed
-                    if (event.keys()[0] in [self.tenant.type,
-                                            'vmmDomP'] and not
-                            event[event.keys()[0]]['attributes'].get(
-                                STATUS_FIELD)):
-                        LOG.info("Resetting Tree %s" % self.tenant_name)
-                        # REVISIT(ivar): on subscription to VMMPolicy objects,
-                        # aci doesn't return the root object itself because of
-                        # a bug. Let's craft a fake root to work around this
-                        # problem
-                        if self.tenant_name.startswith('vmmp-'):
-                            LOG.debug('Faking vmmProvP %s' % self.tenant_name)
-                            events.append({'vmmProvP': {
-                                'attributes': {'dn': self.tenant.dn}}})
-                        # This is a full resync, trees need to be reset
-                        self._state = structured_tree.StructuredHashTree()
-                        self._operational_state = (
-                            structured_tree.StructuredHashTree())
-                        self._monitored_state = (
-                            structured_tree.StructuredHashTree())
-                        self.tag_set = set()
-                        break
-                # REVISIT(ivar): there's already a debug log in acitoolkit
-                # listing all the events received one by one. The following
-                # would be more compact, we need to choose which to keep.
-                # LOG.debug("received events for root %s: %s" %
-                #           (self.tenant_name, events))
-                # Make events list flat
-                self.flat_events(events)
-                # Pull incomplete objects
-                events = self._fill_events(events)
-                # Manage Tags
-                events = self._filter_ownership(events)
-                self._event_to_tree(events)
-        time.sleep(max(0, self.polling_yield - (time.time() - start_time)))
+            events = self.ws_context.get_event_data(self.tenant.urls)
+            if self._is_full_resync(events):
+                # Hold the lock for the whole processing, so that the trees
+                # are never observed empty
+                with utils.get_rlock(lcon.ACI_TREE_LOCK_NAME_PREFIX +
+                                     self.tenant_name):
+                    LOG.info("Resetting Tree %s" % self.tenant_name)
+                    previous_hash = self._state.root_full_hash
+                    self._state = structured_tree.StructuredHashTree()
+                    self._operational_state = (
+                        structured_tree.StructuredHashTree())
+                    self._monitored_state = (
+                        structured_tree.StructuredHashTree())
+                    self.tag_set = set()
+                    self._known_dns = {}
+                    self._process_events(events)
+                    # The cached tree is validated by the full resync
+                    self._cache_dirty = (previous_hash !=
+                                         self._state.root_full_hash)
+            else:
+                # Only this thread modifies the trees, the lock is taken
+                # when they are updated
+                self._process_events(events)
+        elif (self.tree_cache_dir and self._cache_dirty and
+                time.time() - self._cache_saved > TREE_CACHE_SAVE_INTERVAL):
+            # Nothing happened in this loop, save a stable state
+            self.save_tree_cache()
+        if not self._pool:
+            time.sleep(max(0, self.polling_yield -
+                           (time.time() - start_time)))
+
+    def _tree_cache_path(self):
+        return os.path.join(self.tree_cache_dir, '%s.json' % self.tenant_name)
+
+    def save_tree_cache(self):
+        """Save the configuration tree and owned DNs in the cache."""
+        path = self._tree_cache_path()
+        with utils.get_rlock(lcon.ACI_TREE_LOCK_NAME_PREFIX +
+                             self.tenant_name):
+            data = {'saved': time.time(), 'tag_set': sorted(self.tag_set),
+                    'config': {'tree': str(self._state),
+                               'root_key': self._state.root_key,
+                               'has_populated': self._state.has_populated}}
+            self._cache_dirty = False
+            self._cache_saved = data['saved']
+        try:
+            utils.dump_json_file(path, data)
+        except (IOError, OSError) as e:
+            LOG.warning("Failed to save tree cache of tenant %s to %s: %s",
+                        self.tenant_name, path, e)
+
+    def load_tree_cache(self):
+        """Load the configuration tree and owned DNs from the cache.
+
+        Operational and monitored trees are not cached: they can change on
+        APIC while AID is down, and AIM would be reconciled against them.
+
+        :return: whether a recent enough cache was loaded
+        """
+        path = self._tree_cache_path()
+        try:
+            with open(path) as f:
+                data = utils.json_loads(f.read())
+            if time.time() - data['saved'] > RESET_INTERVAL:
+                LOG.debug("Ignoring stale tree cache %s", path)
+                return False
+            config = data['config']
+            tree = structured_tree.StructuredHashTree.from_string(
+                config['tree'],
+                root_key=tuple(config['root_key'] or ()) or None,
+                has_populated=config['has_populated'])
+        except (IOError, OSError, ValueError, KeyError, TypeError) as e:
+            LOG.debug("No tree cache loaded for tenant %s: %s",
+                      self.tenant_name, e)
+            return False
+        with utils.get_rlock(lcon.ACI_TREE_LOCK_NAME_PREFIX +
+                             self.tenant_name):
+            self._state = tree
+            self.tag_set = set(data['tag_set'])
+            self._cache_saved = data['saved']
+        LOG.info("Loaded tree cache of tenant %s saved at %s",
+                 self.tenant_name, time.ctime(data['saved']))
+        return True
+
+    def _is_full_resync(self, events):
+        for event in events:
+            type = event.keys()[0]
+            # REVISIT(ivar): remove vmmDomP once websocket ACI bug is
+            # fixed
+            if (type in [self.tenant.type, 'vmmDomP'] and
+                    not event[type]['attributes'].get(STATUS_FIELD)):
+                # REVISIT(ivar): on subscription to VMMPolicy objects,
+                # aci doesn't return the root object itself because of
+                # a bug. Let's craft a fake root to work around this
+                # problem
+                if self.tenant_name.startswith('vmmp-'):
+                    LOG.debug('Faking vmmProvP %s' % self.tenant_name)
+                    events.append({'vmmProvP': {
+                        'attributes': {'dn': self.tenant.dn}}})
+                return True
+        return False
+
+    def _process_events(self, events):
+        # REVISIT(ivar): there's already a debug log in acitoolkit
+        # listing all the events received one by one. The following
+        # would be more compact, we need to choose which to keep.
+        # LOG.debug("received events for root %s: %s" %
+        #           (self.tenant_name, events))
+        # Make events list flat
+        self.flat_events(events)
+        if self.reset_verify:
+            self._track_objects(events)
+        # Pull incomplete objects
+        events = self._fill_events(events)
+        # Manage Tags
+        events = self._filter_ownership(events)
+        self._event_to_tree(events)
 
     def push_aim_resources(self, resources):
         """Given a map of AIM resources for this tenant, push them into APIC
@@ -369,35 +873,22 @@ class AciTenantManager(utils.AIMThread):
         try:
             with utils.get_rlock(lcon.ACI_BACKLOG_LOCK_NAME_PREFIX +
                                  self.tenant_name, blocking=False):
-                backlock = Queue.Queue()
-                while not self.object_backlog.empty():
-                    requests = self.object_backlog.get()
-                    # check if there's an event to squash
-                    for op in ['create', 'delete']:
-                        for i, req in enumerate(requests.get(op, [])):
-                            for j, new in enumerate(resources.get(op, [])):
-                                if op is 'create':
-                                    req_dn = req.dn
-                                    new_dn = new.dn
-                                else:
-                                    # Delete items are in ACI format
-                                    req_dn = req.values()[0][
-                                        'attributes']['dn']
-                                    new_dn = new.values()[0][
-                                        'attributes']['dn']
-                                if req_dn == new_dn:
-                                    # Replace old with new
-                                    requests[op][i] = new
-                                    break
-                            else:
-                                # No colliding item found
-                                continue
-                            # new can be removed from resources
-                            resources[op].pop(j)
-                    backlock.put(requests)
+                index = self._backlog_index
+                for op, items in resources.items():
+                    pending = []
+                    for new in items:
+                        key = (op, self._backlog_dn(op, new))
+                        if key in index:
+                            # Replace the queued item with the new one
+                            queued, position = index[key]
+                            queued[position] = new
+                        else:
+                            index[key] = (pending, len(pending))
+                            pending.append(new)
+                    resources[op] = pending
                 if any(resources.values()):
-                    backlock.put(resources)
-                self.object_backlog = backlock
+                    self.object_backlog.put(resources)
+            self._wake_up()
         except utils.LockNotAcquired:
             # If changes need to be pushed, AID will do it on the next
             # iteration
@@ -405,109 +896,223 @@ class AciTenantManager(utils.AIMThread):
 
     def _push_aim_resources(self):
         dn_mgr = apic_client.DNManager()
-        decompose = dn_mgr.aci_decompose_dn_guess
+        decompose = utils.decompose_dn_guess
+        # Only hold the lock while draining the backlog, so that new
+        # requests can be stashed while these are pushed
         with utils.get_rlock(lcon.ACI_BACKLOG_LOCK_NAME_PREFIX +
                              self.tenant_name):
+            requests = []
             while not self.object_backlog.empty():
-                request = self.object_backlog.get()
-                for method, aim_objects in request.iteritems():
-                    # Method will be either "create" or "delete"
-                    # sort the aim_objects based on DN first for DELETE method
-                    sorted_aim_objs = aim_objects
+                requests.append(self.object_backlog.get())
+            self._backlog_index = {}
+        for request in requests:
+            for method, aim_objects in request.iteritems():
+                # Method will be either "create" or "delete"
+                # sort the aim_objects based on DN first for DELETE method
+                sorted_aim_objs = aim_objects
+                if method == base_universe.DELETE:
+                    sorted_aim_objs = sorted(
+                        aim_objects,
+                        key=lambda x: x.values()[0]['attributes']['dn'])
+                potential_parent_dn = ' '
+                batch = []
+                deletes = []
+                for aim_object in sorted_aim_objs:
+                    # get MO from ACI client, identify it via its DN parts
+                    # and push the new body
                     if method == base_universe.DELETE:
-                        sorted_aim_objs = sorted(
-                            aim_objects,
-                            key=lambda x: x.values()[0]['attributes']['dn'])
-                    potential_parent_dn = ' '
-                    for aim_object in sorted_aim_objs:
-                        # get MO from ACI client, identify it via its DN parts
-                        # and push the new body
+                        # If a parent is also being deleted then we don't
+                        # have to send those children requests to APIC
+                        dn = aim_object.values()[0]['attributes']['dn']
+                        res_type = aim_object.keys()[0]
+                        decomposed = decompose(dn, res_type)
+                        parent_dn = dn_mgr.build(decomposed[1][:-1])
+                        if parent_dn.startswith(potential_parent_dn):
+                            continue
+                        else:
+                            potential_parent_dn = dn
+                        to_push = [copy.deepcopy(aim_object)]
+                    else:
+                        if getattr(aim_object, 'monitored', False):
+                            # When pushing to APIC, treat monitored
+                            # objects as pre-existing
+                            aim_object.monitored = False
+                            aim_object.pre_existing = True
+                        to_push = self.to_aci_converter.convert(
+                            [aim_object])
+                    LOG.debug('%s AIM object %s in APIC' % (
+                        method, repr(aim_object)))
+                    # Set TAGs before pushing the request
+                    tags = []
+                    if method == base_universe.CREATE:
+                        # No need to deal with tags on deletion
+                        for obj in to_push:
+                            if not obj.keys()[0].startswith(TAG_KEY):
+                                dn = obj.values()[0]['attributes']['dn']
+                                dn += '/tag-%s' % self.tag_name
+                                tags.append({"tagInst__%s" % obj.keys()[0]:
+                                             {"attributes": {"dn": dn}}})
+                    if (method == base_universe.CREATE and
+                            self.push_batch_size > 1):
+                        batch.append((aim_object, to_push + tags))
+                        continue
+                    if (method == base_universe.DELETE and
+                            self.session_pool):
+                        deletes.append((aim_object, to_push))
+                        continue
+                    LOG.debug("Pushing %s into APIC: %s" %
+                              (method, to_push + tags))
+                    # Multiple objects could result from a conversion, push
+                    # them in a single transaction
+                    try:
                         if method == base_universe.DELETE:
-                            # If a parent is also being deleted then we don't
-                            # have to send those children requests to APIC
-                            dn = aim_object.values()[0]['attributes']['dn']
-                            res_type = aim_object.keys()[0]
-                            decomposed = decompose(dn, res_type)
-                            parent_dn = dn_mgr.build(decomposed[1][:-1])
-                            if parent_dn.startswith(potential_parent_dn):
-                                continue
-                            else:
-                                potential_parent_dn = dn
-                            to_push = [copy.deepcopy(aim_object)]
+                            for obj in to_push + tags:
+                                attr = obj.values()[0]['attributes']
+                                self.aci_session.DELETE(
+                                    '/mo/%s.json' % attr.pop('dn'))
                         else:
-                            if getattr(aim_object, 'monitored', False):
-                                # When pushing to APIC, treat monitored
-                                # objects as pre-existing
-                                aim_object.monitored = False
-                                aim_object.pre_existing = True
-                            to_push = self.to_aci_converter.convert(
-                                [aim_object])
-                        LOG.debug('%s AIM object %s in APIC' % (
-                            method, repr(aim_object)))
-                        # Set TAGs before pushing the request
-                        tags = []
-                        if method == base_universe.CREATE:
-                            # No need to deal with tags on deletion
-                            for obj in to_push:
-                                if not obj.keys()[0].startswith(TAG_KEY):
-                                    dn = obj.values()[0]['attributes']['dn']
-                                    dn += '/tag-%s' % self.tag_name
-                                    tags.append({"tagInst__%s" % obj.keys()[0]:
-                                                 {"attributes": {"dn": dn}}})
-                        LOG.debug("Pushing %s into APIC: %s" %
-                                  (method, to_push + tags))
-                        # Multiple objects could result from a conversion, push
-                        # them in a single transaction
-                        try:
-                            if method == base_universe.DELETE:
+                            with self.aci_session.transaction(
+                                    top_send=True) as trs:
                                 for obj in to_push + tags:
                                     attr = obj.values()[0]['attributes']
-                                    self.aci_session.DELETE(
-                                        '/mo/%s.json' % attr.pop('dn'))
-                            else:
-                                with self.aci_session.transaction(
-                                        top_send=True) as trs:
-                                    for obj in to_push + tags:
-                                        attr = obj.values()[0]['attributes']
-                                        mo, parents_rns = decompose(
-                                            attr.pop('dn'), obj.keys()[0])
-                                        rns = dn_mgr.filter_rns(parents_rns)
-                                        getattr(getattr(self.aci_session, mo),
-                                                method)(*rns, transaction=trs,
-                                                        **attr)
-                                # Object creation was successful, change object
-                                # state
-                                self.creation_succeeded(aim_object)
-                        except Exception as e:
-                            LOG.debug(traceback.format_exc())
-                            LOG.error("An error has occurred during %s for "
-                                      "object %s: %s" % (method, aim_object,
-                                                         e.message))
-                            if method == base_universe.CREATE:
-                                err_type = (
-                                    self.error_handler.analyze_exception(e))
-                                # REVISIT(ivar): for now, treat UNKNOWN errors
-                                # the same way as OPERATION_TRANSIENT.
-                                # Investigate a way to understand when such
-                                # errors might require agent restart.
-                                self.creation_failed(aim_object, e.message,
-                                                     err_type)
+                                    mo, parents_rns = decompose(
+                                        attr.pop('dn'), obj.keys()[0])
+                                    rns = dn_mgr.filter_rns(parents_rns)
+                                    getattr(getattr(self.aci_session, mo),
+                                            method)(*rns, transaction=trs,
+                                                    **attr)
+                            # Object creation was successful, change object
+                            # state
+                            self.creation_succeeded(aim_object)
+                    except Exception as e:
+                        LOG.debug(traceback.format_exc())
+                        LOG.error("An error has occurred during %s for "
+                                  "object %s: %s" % (method, aim_object,
+                                                     e.message))
+                        if method == base_universe.CREATE:
+                            err_type = (
+                                self.error_handler.analyze_exception(e))
+                            # REVISIT(ivar): for now, treat UNKNOWN errors
+                            # the same way as OPERATION_TRANSIENT.
+                            # Investigate a way to understand when such
+                            # errors might require agent restart.
+                            self.creation_failed(aim_object, e.message,
+                                                 err_type)
+                if batch:
+                    self._push_batch(batch)
+                if deletes:
+                    self._push_deletes(deletes)
+
+    def _push_deletes(self, deletes):
+        """Run the DELETE requests of the backlog on the session pool.
+
+        DNs nested in another DN being deleted are kept in its group, so
+        that they are deleted after it by the same session.
+        """
+        groups = []
+        group_by_dn = {}
+        owners = {}
+        for aim_object, to_push in deletes:
+            for obj in to_push:
+                dn = obj.values()[0]['attributes']['dn']
+                parts = dn.split('/')
+                group = None
+                for i in range(len(parts) - 1, 0, -1):
+                    group = group_by_dn.get('/'.join(parts[:i]))
+                    if group is not None:
+                        break
+                if group is None:
+                    group = []
+                    groups.append(group)
+                group.append(dn)
+                group_by_dn[dn] = group
+                owners[dn] = aim_object
+        LOG.debug("Deleting %s objects from APIC for root %s" %
+                  (len(owners), self.tenant_name))
+        for dn, e in self.session_pool.delete(groups,
+                                              self.delete_concurrency):
+            LOG.error("An error has occurred during %s for object %s: %s" %
+                      (base_universe.DELETE, owners[dn], e.message))
+
+    def _push_batch(self, batch):
+        """Create AIM objects in multi-object transactions.
+
+        Objects sharing the same root are committed in transactions of up
+        to push_batch_size AIM objects, each posted from the root down in a
+        single request.
+        """
+        by_root = collections.OrderedDict()
+        for aim_object, to_push in batch:
+            # Objects of different roots can't share a transaction
+            dn = to_push[0].values()[0]['attributes']['dn'] if to_push else ''
+            by_root.setdefault('/'.join(dn.split('/')[:2]), []).append(
+                (aim_object, to_push))
+        for objects in by_root.values():
+            for i in range(0, len(objects), self.push_batch_size):
+                self._push_transaction(objects[i:i + self.push_batch_size])
+
+    def _push_transaction(self, objects):
+        """Push a list of (AIM object, ACI objects) in one transaction.
+
+        When the transaction fails it is split in half and retried, until
+        the failing objects are isolated and reported as such.
+        """
+        LOG.debug("Pushing %s objects into APIC for root %s" %
+                  (len(objects), self.tenant_name))
+        decompose = utils.decompose_dn_guess
+        try:
+            with self.aci_session.transaction() as trs:
+                for aim_object, to_push in objects:
+                    for obj in to_push:
+                        # Keep the original objects intact for retries
+                        attr = dict(obj.values()[0]['attributes'])
+                        mo, parents_rns = decompose(attr.pop('dn'),
+                                                    obj.keys()[0])
+                        rns = self.dn_manager.filter_rns(parents_rns)
+                        getattr(getattr(self.aci_session, mo),
+                                base_universe.CREATE)(*rns, transaction=trs,
+                                                      **attr)
+        except Exception as e:
+            if len(objects) > 1:
+                LOG.debug("Transaction of %s objects failed for root %s, "
+                          "splitting it: %s" % (len(objects),
+                                                self.tenant_name, e.message))
+                half = len(objects) // 2
+                self._push_transaction(objects[:half])
+                self._push_transaction(objects[half:])
+                return
+            aim_object = objects[0][0]
+            LOG.debug(traceback.format_exc())
+            LOG.error("An error has occurred during %s for object %s: %s" %
+                      (base_universe.CREATE, aim_object, e.message))
+            self.creation_failed(aim_object, e.message,
+                                 self.error_handler.analyze_exception(e))
+            return
+        for aim_object, _ in objects:
+            self.creation_succeeded(aim_object)
 
     def _unsubscribe_tenant(self, kill=False):
         LOG.info("Unsubscribing tenant websocket %s" % self.tenant_name)
         self._warm = False
+        self._cache_warm = False
         urls = self.tenant.urls
         if kill:
             # Make sure this thread cannot use websocket anymore
             self.tenant.urls = self.ws_context.EMPTY_URLS
+        self.ws_context.unregister_listener(urls)
         self.ws_context.unsubscribe(urls)
         self._reset_object_backlog()
 
     def _subscribe_tenant(self):
         self.ws_context.subscribe(self.tenant.urls)
+        # Pooled managers keep their wakeup object across subscriptions
+        ready = self._events_ready if self._pool else None
+        self._events_ready = self.ws_context.register_listener(
+            self.tenant.urls, ready=ready)
         self.scheduled_reset = utils.schedule_next_event(RESET_INTERVAL, 0.2)
         self._event_loop()
         self._warm = True
+        self._release_reset_slot()
 
     def _event_to_tree(self, events):
         """Parse the event and push it into the tree
@@ -517,56 +1122,10 @@ class AciTenantManager(utils.AIMThread):
         :param events: an ACI event in the form of a list of objects
         :return:
         """
+        # Filtering and conversion don't need the trees
+        updated, removed = self._events_to_aim(events)
         with utils.get_rlock(lcon.ACI_TREE_LOCK_NAME_PREFIX +
                              self.tenant_name):
-            removed, updated = [], []
-            removing_dns = set()
-            filtered_events = []
-            # Set the owned events
-            for event in events:
-                # Exclude some events from monitored objects.
-                # Some RS objects can be set from AIM even for monitored
-                # objects, therefore we need to exclude events regarding those
-                # RS objects when we don't own them. One example is fvRsProv on
-                # external networks
-                type = event.keys()[0]
-                if type in ACI_TYPES_NOT_CONVERT_IF_MONITOR:
-                    # Check that the object is indeed correct looking at the
-                    # parent
-                    if self._check_parent_type(
-                            event,
-                            ACI_TYPES_NOT_CONVERT_IF_MONITOR[type]):
-                        if not self._is_owned(event):
-                            # For an RS object like fvRsProv we check the
-                            # parent ownership as well.
-                            continue
-                # Exclude from conversion those list RS objects that we want
-                # allow to be manually configured in ACI
-                if type in ACI_TYPES_SKIP_ON_MANAGES:
-                    if self._check_parent_type(
-                            event, ACI_TYPES_SKIP_ON_MANAGES[type]):
-                        # Check whether the event is owned, and whether its
-                        # parent is.
-                        if (not self._is_owned(event, check_parent=False) and
-                                self._is_owned(event)):
-                            continue
-                if self.is_child_object(type) and self._is_deleting(event):
-                    # Can be excluded, we expect parent objects
-                    continue
-
-                if self._is_deleting(event):
-                    dn = event.values()[0]['attributes']['dn']
-                    removing_dns.add(dn)
-                filtered_events.append(event)
-            for event in self.to_aim_converter.convert(filtered_events):
-                if event.dn not in self.tag_set:
-                    event.monitored = True
-                if event.dn in removing_dns:
-                    LOG.info('ACI event: REMOVED %s' % event)
-                    removed.append(event)
-                else:
-                    LOG.info('ACI event: ADDED %s' % event)
-                    updated.append(event)
             upd_trees, upd_op_trees, upd_mon_trees = self.tree_builder.build(
                 [], updated, removed,
                 {self.tree_builder.CONFIG: {self.tenant_name: self._state},
@@ -585,8 +1144,64 @@ class AciTenantManager(utils.AIMThread):
                     modified = True
                     LOG.debug("New %s tree for tenant %s: %s" %
                               (readable, self.tenant_name, tree))
+            if upd_trees:
+                self._cache_dirty = True
             if modified:
-                event_handler.EventHandler.reconcile()
+                event_handler.EventHandler.reconcile(roots=[self.tenant_name])
+
+    def _events_to_aim(self, events):
+        """Filter owned events and convert them into AIM objects.
+
+        :return: (updated, removed) lists of AIM objects
+        """
+        removed, updated = [], []
+        removing_dns = set()
+        filtered_events = []
+        # Set the owned events
+        for event in events:
+            # Exclude some events from monitored objects.
+            # Some RS objects can be set from AIM even for monitored
+            # objects, therefore we need to exclude events regarding those
+            # RS objects when we don't own them. One example is fvRsProv on
+            # external networks
+            type = event.keys()[0]
+            if type in ACI_TYPES_NOT_CONVERT_IF_MONITOR:
+                # Check that the object is indeed correct looking at the
+                # parent
+                if self._check_parent_type(
+                        event, ACI_TYPES_NOT_CONVERT_IF_MONITOR[type]):
+                    if not self._is_owned(event):
+                        # For an RS object like fvRsProv we check the
+                        # parent ownership as well.
+                        continue
+            # Exclude from conversion those list RS objects that we want
+            # allow to be manually configured in ACI
+            if type in ACI_TYPES_SKIP_ON_MANAGES:
+                if self._check_parent_type(
+                        event, ACI_TYPES_SKIP_ON_MANAGES[type]):
+                    # Check whether the event is owned, and whether its
+                    # parent is.
+                    if (not self._is_owned(event, check_parent=False) and
+                            self._is_owned(event)):
+                        continue
+            deleting = self._is_deleting(event)
+            if deleting:
+                if self.is_child_object(type):
+                    # Can be excluded, we expect parent objects
+                    continue
+                removing_dns.add(event[type]['attributes']['dn'])
+            filtered_events.append(event)
+        for event in self.to_aim_converter.convert(filtered_events):
+            dn = event.dn
+            if dn not in self.tag_set:
+                event.monitored = True
+            if dn in removing_dns:
+                LOG.info('ACI event: REMOVED %s' % event)
+                removed.append(event)
+            else:
+                LOG.info('ACI event: ADDED %s' % event)
+                updated.append(event)
+        return updated, removed
 
     def _fill_events(self, events):
         """Gets incomplete objects from APIC if needed
@@ -612,8 +1227,15 @@ class AciTenantManager(utils.AIMThread):
 
     def retrieve_aci_objects(self, events):
         result = {}
+        # Synthesized parent events are queued after the received ones,
+        # at most once per parent.
+        pending = list(events)
+        seen_dns = set(x.values()[0]['attributes'].get('dn') for x in events)
+        # Modified objects are resolved in one batch once all the events
+        # are evaluated
+        modified = []
 
-        for event in events:
+        for event in pending:
             resource = event.values()[0]
             res_type = event.keys()[0]
             status = (resource['attributes'].get(STATUS_FIELD) or '').lower()
@@ -621,13 +1243,12 @@ class AciTenantManager(utils.AIMThread):
             if self.is_child_object(res_type) and res_type != FAULT_KEY:
                 # We need to make sure to retrieve the parent object as well
                 try:
-                    decomposed = (
-                        apic_client.DNManager().aci_decompose_dn_guess(
-                            raw_dn, res_type))
+                    decomposed = utils.decompose_dn_guess(raw_dn, res_type)
                     parent_dn = apic_client.DNManager().build(
                         decomposed[1][:-1])
-                    if parent_dn not in result:
-                        events.append(
+                    if parent_dn not in seen_dns:
+                        seen_dns.add(parent_dn)
+                        pending.append(
                             {decomposed[1][-2][0]:
                              {'attributes': {
                                  'dn': parent_dn,
@@ -639,8 +1260,7 @@ class AciTenantManager(utils.AIMThread):
             if res_type == FAULT_KEY:
                 # Make sure we support the parent object
                 try:
-                    apic_client.DNManager().aci_decompose_dn_guess(raw_dn,
-                                                                   res_type)
+                    utils.decompose_dn_guess(raw_dn, res_type)
                     utils.retrieve_fault_parent(raw_dn, converter.resource_map)
                 except (apic_client.DNManager.InvalidNameFormat, KeyError):
                     LOG.debug("Fault with DN %s is not supported." % raw_dn)
@@ -662,27 +1282,40 @@ class AciTenantManager(utils.AIMThread):
                         event_attrs)
                 key = tree_manager.AimHashTreeMaker._dn_to_key(res_type,
                                                                raw_dn)
-                data = []
-                if key:
-                    # Search within the TenantManager state, which is the most
-                    # up to date.
-                    data = self.get_resources(
-                        [key], desired_state=self._get_full_state())
-                if not data and not apnf:
-                    LOG.debug("Resource %s not found or not supported", raw_dn)
-                for item in data:
-                    dn = item.values()[0]['attributes']['dn']
-                    if dn not in result:
-                        result[dn] = item
-                        if dn == raw_dn:
-                            result[raw_dn].values()[0]['attributes'].update(
-                                event_attrs)
+                modified.append((raw_dn, key, event_attrs, apnf))
             if not status or status == converter.CREATED_STATUS:
                 result[raw_dn] = event
+        self._retrieve_modified_objects(modified, result)
         LOG.debug("Result for retrieving ACI resources: %s\n %s" %
-                  (events, result))
+                  (pending, result))
         return result.values()
 
+    def _retrieve_modified_objects(self, modified, result):
+        """Resolve modified objects with a single get_resources call.
+
+        Objects already in the result, because of a later event, are not
+        replaced.
+        """
+        keys = list(collections.OrderedDict.fromkeys(
+            x[1] for x in modified if x[1]))
+        data = []
+        if keys:
+            # Search within the TenantManager state, which is the most
+            # up to date.
+            data = self.get_resources(keys,
+                                      desired_state=self._get_full_state())
+        retrieved = set()
+        for item in data:
+            dn = item.values()[0]['attributes']['dn']
+            if dn not in result:
+                result[dn] = item
+                retrieved.add(dn)
+        for raw_dn, key, event_attrs, apnf in modified:
+            if raw_dn in retrieved:
+                result[raw_dn].values()[0]['attributes'].update(event_attrs)
+            elif raw_dn not in result and not apnf:
+                LOG.debug("Resource %s not found or not supported", raw_dn)
+
     @staticmethod
     def flat_events(events):
         # If there are children objects, put them at the top level
@@ -745,9 +1378,7 @@ class AciTenantManager(utils.AIMThread):
             if not owned and self.is_child_object(type) and check_parent:
                 # Check for parent ownership
                 try:
-                    decomposed = (
-                        apic_client.DNManager().aci_decompose_dn_guess(
-                            dn, type))
+                    decomposed = utils.decompose_dn_guess(dn, type)
                 except apic_client.DNManager.InvalidNameFormat:
                     LOG.debug("Type %s with DN %s is not supported." %
                               (type, dn))
@@ -762,9 +1393,7 @@ class AciTenantManager(utils.AIMThread):
         dn = aci_object.values()[0]['attributes']['dn']
         type = aci_object.keys()[0]
         try:
-            decomposed = (
-                apic_client.DNManager().aci_decompose_dn_guess(
-                    dn, type))
+            decomposed = utils.decompose_dn_guess(dn, type)
         except apic_client.DNManager.InvalidNameFormat:
             LOG.debug("Type %s with DN %s is not supported." %
                       (type, dn))
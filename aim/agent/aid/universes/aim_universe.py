@@ -14,6 +14,7 @@
 #    under the License.
 
 import copy
+import threading
 import traceback
 
 from oslo_log import log as logging
@@ -29,6 +30,20 @@ from aim import tree_manager
 
 
 LOG = logging.getLogger(__name__)
+# Root -> number of times its trees were modified by this process
+_tree_versions = {}
+_tree_versions_lock = threading.Lock()
+
+
+def _touch_roots(roots):
+    with _tree_versions_lock:
+        for root in roots:
+            _tree_versions[root] = _tree_versions.get(root, 0) + 1
+
+
+def _get_tree_versions(roots):
+    with _tree_versions_lock:
+        return dict((x, _tree_versions.get(x, 0)) for x in roots)
 
 
 class AimDbUniverse(base.HashTreeStoredUniverse):
@@ -46,6 +61,10 @@ class AimDbUniverse(base.HashTreeStoredUniverse):
         self._served_tenants = set()
         self._monitored_state_update_failures = 0
         self._max_monitored_state_update_failures = 5
+        # Root -> (tree version, tree) loaded by the background observer
+        self._snapshot = {}
+        self.push_chunk_size = max(conf_mgr.get_option(
+            'aim_push_chunk_size', 'aim'), 1)
         self._recovery_interval = conf_mgr.get_option(
             'error_state_recovery_interval', 'aim')
         self.schedule_next_recovery()
@@ -82,35 +101,64 @@ class AimDbUniverse(base.HashTreeStoredUniverse):
             new_state.setdefault(tenant, self._state.get(tenant))
         self._state = new_state
 
-    def observe(self, context):
-        # TODO(ivar): move this to a separate thread and add scheduled reset
-        # mechanism
+    def observe(self, context, roots=None):
+        # When the background observer is enabled, most of the action log
+        # has already been consumed and the trees loaded at this point.
+        served_tenants = copy.deepcopy(self._served_tenants)
+        observed = served_tenants
+        if roots is not None:
+            observed = served_tenants & set(roots)
+        self._recover_errors(context, served_tenants)
+        if roots is not None and not observed:
+            # None of the changed roots is served here
+            return
+        self._catch_up(context, observed)
+        # REVISIT(ivar): what if a root is marked as needs_reset? we could
+        # avoid syncing it altogether
+        self._state.update(self.get_optimized_state(context, self.state,
+                                                    roots=observed))
+
+    def background_observe(self, context):
         served_tenants = copy.deepcopy(self._served_tenants)
+        self._recover_errors(context, served_tenants)
+        if not served_tenants:
+            self._snapshot = {}
+            return
+        self._catch_up(context, served_tenants)
+        versions = _get_tree_versions(served_tenants)
+        state = self.get_optimized_state(context, self.state,
+                                         roots=served_tenants)
+        self._snapshot = dict((x, (versions[x], y))
+                              for x, y in state.iteritems())
+
+    def _recover_errors(self, context, served_tenants):
         # TODO(ivar): object based reset scheduling would be more correct
         # to prevent objects from being re-tried too soon.
         # This will require working with the DB timestamp and proper range
         # query design.
-        htdbl = hashtree_db_listener.HashTreeDbListener(self.manager)
         if utils.get_time() > self._scheduled_recovery:
+            htdbl = hashtree_db_listener.HashTreeDbListener(self.manager)
             for root in served_tenants:
                 self.manager.recover_root_errors(context, root)
             htdbl.cleanup_zombie_status_objects(context, served_tenants)
             self.schedule_next_recovery()
-        htdbl.catch_up_with_action_log(context.store, served_tenants)
-        # REVISIT(ivar): what if a root is marked as needs_reset? we could
-        # avoid syncing it altogether
-        self._state.update(self.get_optimized_state(context, self.state))
+
+    def _catch_up(self, context, roots):
+        htdbl = hashtree_db_listener.HashTreeDbListener(self.manager)
+        _touch_roots(htdbl.catch_up_with_action_log(context.store, roots) or
+                     [])
 
     def reset(self, context, tenants):
         LOG.warn('Reset called for roots %s' % tenants)
         for root in tenants:
             hashtree_db_listener.HashTreeDbListener(
                 self.manager).tt_mgr.set_needs_reset_by_root_rn(context, root)
+        _touch_roots(tenants)
 
     def get_optimized_state(self, context, other_state,
-                            tree=tree_manager.CONFIG_TREE):
+                            tree=tree_manager.CONFIG_TREE, roots=None):
         # TODO(ivar): make it tree-version based to reflect metadata changes
-        return self._get_state(context, tree=tree)
+        return self._get_state(context, tree=tree, roots=roots)
 
     def cleanup_state(self, context, key):
         # Only delete if state is still empty. Never remove a tenant if there
@@ -119,11 +167,28 @@ class AimDbUniverse(base.HashTreeStoredUniverse):
             # There could still be logs, but they will re-create the
             # tenants in the next iteration.
             self.tree_manager.delete_by_root_rn(context, key, if_empty=True)
-
-    def _get_state(self, context, tree=tree_manager.CONFIG_TREE):
-        return self.tree_manager.find_changed(
-            context, dict([(x, None) for x in self._served_tenants]),
+        _touch_roots([key])
+
+    def _get_state(self, context, tree=tree_manager.CONFIG_TREE, roots=None):
+        if roots is None:
+            roots = self._served_tenants
+        # Snapshot trees are reused unless this process modified them since,
+        # or their hash changed in the DB.
+        snapshot = self._snapshot
+        versions = _get_tree_versions(roots)
+        fresh = dict((x, snapshot[x][1]) for x in roots
+                     if x in snapshot and snapshot[x][0] == versions[x] and
+                     snapshot[x][1].root_full_hash is not None)
+        result = self.tree_manager.find_changed(
+            context, dict([(x, None) for x in roots if x not in fresh]),
             tree=tree)
+        if fresh:
+            result.update(self.tree_manager.find_changed(
+                context, dict((x, y.root_full_hash)
+                              for x, y in fresh.iteritems()), tree=tree))
+            for root, tree_ in fresh.iteritems():
+                result.setdefault(root, tree_)
+        return result
 
     @property
     def state(self):
@@ -184,37 +249,124 @@ class AimDbUniverse(base.HashTreeStoredUniverse):
             else:
                 # Convert everything before creating
                 items = self._converter.convert(resources[method])
-            for resource in items:
-                # Items are in the other universe's format unless deletion
-                try:
-                    self._push_resource(context, resource, method, monitored)
-                except aim_exc.InvalidMonitoredStateUpdate as e:
-                    msg = ("Failed to %s object %s in AIM: %s." %
-                           (method, resource, e.message))
-                    LOG.warn(msg)
-                except Exception as e:
-                    LOG.error("Failed to %s object %s in AIM: %s." %
-                              (method, resource, e.message))
-                    LOG.debug(traceback.format_exc())
-                    if method == 'delete':
-                        self.deletion_failed(context, resource)
-                else:
-                    self._monitored_state_update_failures = 0
-
-    def _push_resource(self, context, resource, method, monitored):
-        if isinstance(resource, aim_status.AciFault):
-            # Retrieve fault's parent and set/unset the fault
+            items = self._group_by_class(items)
+            faults = []
             if method == 'create':
-                parents = utils.retrieve_fault_parent(
-                    resource.external_identifier, converter.resource_map)
+                # Faults go last, once their parents have been created
+                faults = [x for x in items
+                          if isinstance(x, aim_status.AciFault)]
+                items = [x for x in items
+                         if not isinstance(x, aim_status.AciFault)]
+            self._push_in_chunks(context, items, method, monitored, {})
+            if faults:
+                self._push_in_chunks(
+                    context, faults, method, monitored,
+                    self._resolve_fault_parents(context, faults))
+
+    def _push_in_chunks(self, context, items, method, monitored,
+                        fault_parents):
+        for i in range(0, len(items), self.push_chunk_size):
+            self._push_chunk(context, items[i:i + self.push_chunk_size],
+                             method, monitored, fault_parents)
+
+    def _group_by_class(self, items):
+        # Keep the classes in order of appearance, so that parents are
+        # still pushed before their children.
+        order = {}
+        for item in items:
+            order.setdefault(type(item), len(order))
+        return sorted(items, key=lambda x: order[type(x)])
+
+    def _resolve_fault_parents(self, context, items):
+        """Map the faults' external identifiers to their existing parent."""
+        candidates = {}
+        for item in items:
+            if isinstance(item, aim_status.AciFault):
+                candidates[item.external_identifier] = (
+                    utils.retrieve_fault_parent(item.external_identifier,
+                                                converter.resource_map))
+        if not candidates:
+            return {}
+        result = {}
+        if not context.store.supports_sql:
+            for fault, parents in candidates.iteritems():
                 for parent in parents:
                     if self.manager.get_status(context, parent):
-                        LOG.debug("%s for object %s: %s",
-                                  self.manager.set_fault.__name__, parent,
-                                  resource)
-                        self.manager.set_fault(context, resource=parent,
-                                               fault=resource)
+                        result[fault] = parent
                         break
+            return result
+        # Find all the existing parents at once
+        existing = {}
+        with context.store.begin(subtransactions=True):
+            for parent, aim_id in context.store.query_aim_ids(
+                    [x for y in candidates.values() for x in y]):
+                existing[(type(parent), tuple(parent.identity))] = aim_id
+        for fault, parents in candidates.iteritems():
+            for parent in parents:
+                aim_id = existing.get((type(parent), tuple(parent.identity)))
+                if aim_id is not None:
+                    # Spare get_status a lookup
+                    parent._injected_aim_id = aim_id
+                    result[fault] = parent
+                    break
+        return result
+
+    def _push_chunk(self, context, chunk, method, monitored, fault_parents):
+        # A chunk is only pushed at once in its own outermost transaction:
+        # a failure nested in a caller's transaction would invalidate it,
+        # and non SQL stores can't roll back a partially pushed chunk.
+        store = context.store
+        if (len(chunk) > 1 and store.supports_sql and
+                not store.in_transaction):
+            try:
+                with store.begin(subtransactions=True):
+                    succeeded = [
+                        x for x in chunk if self._push_resource(
+                            context, x, method, monitored, fault_parents)]
+            except Exception as e:
+                # Replay the chunk one item at a time to isolate failures
+                LOG.debug("Failed to %s %s objects in AIM at once, retrying "
+                          "one by one: %s" % (method, len(chunk), e.message))
+            else:
+                for resource in succeeded:
+                    self.creation_succeeded(resource)
+                self._monitored_state_update_failures = 0
+                return
+        for resource in chunk:
+            # Items are in the other universe's format unless deletion
+            try:
+                if self._push_resource(context, resource, method, monitored,
+                                       fault_parents):
+                    self.creation_succeeded(resource)
+            except aim_exc.InvalidMonitoredStateUpdate as e:
+                msg = ("Failed to %s object %s in AIM: %s." %
+                       (method, resource, e.message))
+                LOG.warn(msg)
+            except Exception as e:
+                LOG.error("Failed to %s object %s in AIM: %s." %
+                          (method, resource, e.message))
+                LOG.debug(traceback.format_exc())
+                if method == 'delete':
+                    self.deletion_failed(context, resource)
+            else:
+                self._monitored_state_update_failures = 0
+
+    def _push_resource(self, context, resource, method, monitored,
+                       fault_parents=None):
+        """Push a single resource, tell whether its creation succeeded."""
+        if isinstance(resource, aim_status.AciFault):
+            # Retrieve fault's parent and set/unset the fault
+            if method == 'create':
+                if fault_parents is None:
+                    fault_parents = self._resolve_fault_parents(context,
+                                                                [resource])
+                parent = fault_parents.get(resource.external_identifier)
+                if parent:
+                    LOG.debug("%s for object %s: %s",
+                              self.manager.set_fault.__name__, parent,
+                              resource)
+                    self.manager.set_fault(context, resource=parent,
+                                           fault=resource)
             else:
                 self.manager.delete(context, resource)
         else:
@@ -247,15 +399,14 @@ class AimDbUniverse(base.HashTreeStoredUniverse):
                         obj = self.manager.update(
                             context, resource, fix_ownership=monitored,
                             **ext(resource, "other"))
-                        if obj:
-                            # Declare victory for the update
-                            self.creation_succeeded(resource)
+                        # Declare victory for the update
+                        return bool(obj)
                     else:
                         self.manager.create(
                             context, resource, overwrite=True,
                             fix_ownership=monitored)
                         # Declare victory for the created object
-                        self.creation_succeeded(resource)
+                        return True
             else:
                 if isinstance(resource, aim_resource.AciRoot) and monitored:
                     # Monitored Universe doesn't delete Tenant
@@ -283,15 +434,13 @@ class AimDbUniverse(base.HashTreeStoredUniverse):
         all_modified_keys = set(raw_diff[base.CREATE])
         keys_to_sync = all_modified_keys - set(pending_nodes)
         aim_to_sync = self.get_resources(list(keys_to_sync))
-        for obj in aim_to_sync:
-            self.manager.set_resource_sync_pending(context, obj)
+        self.manager.set_resources_sync_pending(context, aim_to_sync)
 
     def _set_synced_state(self, context, raw_diff, unsynced_nodes, skip_keys):
         all_modified_keys = set(raw_diff[base.CREATE] + raw_diff[base.DELETE])
         keys_to_sync = (set(unsynced_nodes) - all_modified_keys) - skip_keys
         aim_to_sync = self.get_resources(list(keys_to_sync))
-        for obj in aim_to_sync:
-            self.manager.set_resource_sync_synced(context, obj)
+        self.manager.set_resources_sync_synced(context, aim_to_sync)
 
     def update_status_objects(self, context, tenant_state, raw_diff,
                               skip_keys):
@@ -336,9 +485,9 @@ class AimDbOperationalUniverse(AimDbUniverse):
         return [self.state]
 
     def get_optimized_state(self, context, other_state,
-                            tree=tree_manager.OPERATIONAL_TREE):
+                            tree=tree_manager.OPERATIONAL_TREE, roots=None):
         return super(AimDbOperationalUniverse, self).get_optimized_state(
-            context, other_state, tree=tree)
+            context, other_state, tree=tree, roots=roots)
 
     def vote_deletion_candidates(self, context, other_universe,
                                  delete_candidates, vetoes):
@@ -356,9 +505,10 @@ class AimDbOperationalUniverse(AimDbUniverse):
                 # AIM monitored DB still has stuff to delete
                 delete_candidates.discard(tenant)
 
-    def reconcile(self, context, other_universe, delete_candidates):
+    def reconcile(self, context, other_universe, delete_candidates,
+                  roots=None):
         self._mask_tenant_state(other_universe, delete_candidates)
-        return self._reconcile(context, other_universe)
+        return self._reconcile(context, other_universe, roots=roots)
 
     def update_status_objects(self, context, tenant_state, raw_diff,
                               skip_keys):
@@ -384,9 +534,9 @@ class AimDbMonitoredUniverse(AimDbUniverse):
         return [self.state, self.get_state_by_type(base.CONFIG_UNIVERSE)]
 
     def get_optimized_state(self, context, other_state,
-                            tree=tree_manager.MONITORED_TREE):
+                            tree=tree_manager.MONITORED_TREE, roots=None):
         return super(AimDbMonitoredUniverse, self).get_optimized_state(
-            context, other_state, tree=tree)
+            context, other_state, tree=tree, roots=roots)
 
     def push_resources(self, context, resources):
         self._push_resources(context, resources, monitored=True)
@@ -412,9 +562,10 @@ class AimDbMonitoredUniverse(AimDbUniverse):
                 # AIM monitored DB still has stuff to delete
                 delete_candidates.discard(tenant)
 
-    def reconcile(self, context, other_universe, delete_candidates):
+    def reconcile(self, context, other_universe, delete_candidates,
+                  roots=None):
         self._mask_tenant_state(other_universe, delete_candidates)
-        return self._reconcile(context, other_universe)
+        return self._reconcile(context, other_universe, roots=roots)
 
     def get_resources_for_delete(self, resource_keys):
         des_mon = self.multiverse[base.MONITOR_UNIVERSE]['desired'].state
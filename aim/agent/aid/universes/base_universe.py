@@ -16,18 +16,22 @@
 
 import abc
 import six
+import threading
 import time
 import traceback
 
 from apicapi import apic_client
 from oslo_log import log as logging
 
+from aim.agent.aid import cycle_stats
 from aim.agent.aid.universes.aci import converter
 from aim.agent.aid.universes import constants as lcon
 from aim.agent.aid.universes import errors
 from aim import aim_manager
 from aim.common.hashtree import structured_tree
 from aim.common import utils
+from aim import context as aim_ctx
+from aim.db import api
 from aim import exceptions
 from aim import tree_manager
 
@@ -39,6 +43,12 @@ CONFIG_UNIVERSE = 0
 OPER_UNIVERSE = 1
 MONITOR_UNIVERSE = 2
 ACTION_RESET = 'reset'
+# Tenant reconciliation priorities, lower first
+PRIORITY_CHANGED = 0
+PRIORITY_RETRY = 1
+PRIORITY_VERIFY = 2
+# Fraction of the tenant key budget reserved to deletions
+DELETE_BUDGET_SHARE = 0.25
 ACTION_PURGE = 'purge'
 
 
@@ -69,17 +79,19 @@ class BaseUniverse(object):
         """
 
     @abc.abstractmethod
-    def observe(self, context):
+    def observe(self, context, roots=None):
         """Observes the current state of the Universe
 
         This method is used to refresh the current state. Some Universes might
         want to run threads at initialization time for this purpose. In that
         case this method can be void.
+        :param roots: only refresh the state of these roots, all if None
         :return:
         """
 
     @abc.abstractmethod
-    def reconcile(self, context, other_universe, delete_candidates):
+    def reconcile(self, context, other_universe, delete_candidates,
+                  roots=None):
         """State reconciliation method.
 
         When an universe's reconcile method is called, the state of the passed
@@ -96,6 +108,7 @@ class BaseUniverse(object):
                identifier, while the value is a set of universes' instance
                where a specific Universe adds/removes itself to when he
                agrees/desagrees on a tenant being removed.
+        :param roots: only reconcile these roots, all of them if None
         :return:
         """
 
@@ -293,6 +306,23 @@ class HashTreeStoredUniverse(AimUniverse):
             errors.SYSTEM_CRITICAL: self._fail_agent,
         }
         self._sync_log = {}
+        # Seconds spent tracking universe actions since startup, updated by
+        # the reconcile workers
+        self._sync_log_time = 0.0
+        self._sync_log_time_lock = threading.Lock()
+        self.reconcile_workers = self.conf_manager.get_option(
+            'reconcile_workers', 'aim')
+        self._reconcile_pool = None
+        # AIM context of each reconcile worker
+        self._worker_contexts = threading.local()
+        self.reconcile_max_keys = self.conf_manager.get_option(
+            'reconcile_tenant_max_keys', 'aim')
+        # Tenants which exceeded their key budget in the last cycle
+        self._deferred_roots = set()
+        # Tenant -> seconds spent in its last reconciliation
+        self.reconcile_time = {}
+        # Tenant -> (desired, current) root hashes when they last converged
+        self._converged_hashes = {}
         return self
 
     def _dissect_key(self, key):
@@ -306,6 +336,7 @@ class HashTreeStoredUniverse(AimUniverse):
     def _keys_to_bare_aci_objects(self, keys):
         # Transforms hashtree keys into minimal ACI objects
         aci_objects = []
+        dn_mgr = apic_client.DNManager()
         for key in keys:
             fault_code = None
             key_parts = self._split_key(key)
@@ -314,7 +345,7 @@ class HashTreeStoredUniverse(AimUniverse):
             if mo_type == 'faultInst':
                 fault_code = key_parts[-1][1]
                 key_parts = key_parts[:-1]
-            dn = apic_client.DNManager().build(key_parts)
+            dn = dn_mgr.build(key_parts)
             if fault_code:
                 dn += '/fault-%s' % fault_code
                 aci_object[mo_type]['attributes']['code'] = fault_code
@@ -328,11 +359,16 @@ class HashTreeStoredUniverse(AimUniverse):
                 other_universe.state[tenant] = (
                     structured_tree.StructuredHashTree())
 
-    def observe(context, self):
+    def observe(context, self, roots=None):
         pass
 
-    def reconcile(self, context, other_universe, delete_candidates):
-        return self._reconcile(context, other_universe)
+    def background_observe(self, context):
+        """Refresh the state ahead of the next observe, out of the cycle."""
+        pass
+
+    def reconcile(self, context, other_universe, delete_candidates,
+                  roots=None):
+        return self._reconcile(context, other_universe, roots=roots)
 
     def vote_deletion_candidates(self, context, other_universe,
                                  delete_candidates, vetoes):
@@ -342,96 +378,221 @@ class HashTreeStoredUniverse(AimUniverse):
         for root in delete_candidates:
             with utils.get_rlock(lcon.SYNC_LOG_LOCK + root):
                 self._sync_log.pop(root, None)
+            self.reconcile_time.pop(root, None)
+            self._converged_hashes.pop(root, None)
 
     def finalize_deletion_candidates(self, context, other_universe,
                                      delete_candidates):
         self._pop_up_sync_log(delete_candidates)
 
-    def _reconcile(self, context, other_universe):
+    def _reconcile(self, context, other_universe, roots=None):
         # "self" is always the current state, "other" the desired
         my_state = self.state
         other_state = other_universe.state
+        tenants = set(my_state.keys()) & set(other_state.keys())
+        if roots is not None:
+            # Tenants that didn't converge yet are always reconciled
+            tenants = set(x for x in tenants if x in roots or
+                          x not in self._converged_hashes)
+        self._evict_sync_log(my_state)
+        tenants = self._schedule_tenants(tenants, my_state, other_state)
+        if self.reconcile_workers > 1 and len(tenants) > 1:
+            if not self._reconcile_pool:
+                self._reconcile_pool = utils.WorkerPool(
+                    self.reconcile_workers, name='%s reconcile' % self.name)
+
+            def reconcile_tenant(tenant):
+                # Sessions are not thread safe, every worker reuses its own
+                # context
+                tenant_ctx = getattr(self._worker_contexts, 'context', None)
+                if tenant_ctx is None:
+                    tenant_ctx = aim_ctx.AimContext(
+                        store=api.get_store(),
+                        cache=getattr(context, 'cache', None) is not None)
+                    self._worker_contexts.context = tenant_ctx
+                return self._reconcile_tenant(tenant_ctx, other_universe,
+                                              tenant, my_state, other_state)
+            # Failed workers return None, which is considered a diff
+            results = self._reconcile_pool.map(reconcile_tenant, tenants)
+            diff = any(x is not False for x in results)
+        else:
+            diff = False
+            for tenant in tenants:
+                diff |= self._reconcile_tenant(context, other_universe,
+                                               tenant, my_state, other_state)
+        if self.reconcile_time:
+            LOG.debug("Slowest tenants reconciled by %s: %s" % (
+                self.name, ', '.join(
+                    '%s (%.3fs)' % x for x in sorted(
+                        self.reconcile_time.items(), key=lambda x: x[1],
+                        reverse=True)[:5])))
+        LOG.debug("Sync log of %s: %s" % (self.name, self.sync_log_stats()))
+        return diff
+
+    def _tenant_priority(self, tenant, my_state, other_state):
+        my_tenant_state = my_state.get(tenant)
+        if (my_tenant_state is None or my_tenant_state.root_full_hash !=
+                other_state[tenant].root_full_hash):
+            # Changes waiting to be pushed
+            return PRIORITY_CHANGED
+        if self._has_pending_retries(tenant):
+            return PRIORITY_RETRY
+        return PRIORITY_VERIFY
+
+    def _schedule_tenants(self, tenants, my_state, other_state):
+        """Order tenants by urgency.
+
+        Tenants with pending changes come first, then the ones with
+        operations being retried, and finally those only being verified.
+        Within the same priority, the fastest tenants of the previous cycle
+        go first.
+        """
+        return sorted(
+            tenants, key=lambda x: (
+                self._tenant_priority(x, my_state, other_state),
+                self.reconcile_time.get(x, 0), x))
+
+    def _apply_key_budget(self, tenant, differences):
+        """Trim the differences of a tenant to the per cycle key budget.
+
+        Deletions are granted DELETE_BUDGET_SHARE of the budget, so that a
+        big creation backlog doesn't starve them, creations get the rest.
+        Any unused share goes to the other action. Parents go before their
+        children. Returns the keys deferred to the next cycles.
+        """
+        budget = self.reconcile_max_keys
+        if not budget or (len(differences[CREATE]) +
+                          len(differences[DELETE])) <= budget:
+            return []
+        delete_share = min(len(differences[DELETE]),
+                           max(1, int(budget * DELETE_BUDGET_SHARE)))
+        create_count = min(len(differences[CREATE]), budget - delete_share)
+        counts = {CREATE: create_count, DELETE: budget - create_count}
+        deferred = []
+        for action in [CREATE, DELETE]:
+            keys = sorted(differences[action], key=len)
+            differences[action] = keys[:counts[action]]
+            deferred.extend(keys[counts[action]:])
+        LOG.info("%s deferring %s differences of tenant %s to the next "
+                 "cycles" % (self.name, len(deferred), tenant))
+        self._deferred_roots.add(tenant)
+        return deferred
+
+    def pop_deferred_roots(self):
+        """Tenants that need another cycle to push all their changes."""
+        roots, self._deferred_roots = self._deferred_roots, set()
+        return roots
+
+    def _reconcile_tenant(self, context, other_universe, tenant, my_state,
+                          other_state):
+        """Reconcile a single tenant, return whether a diff was found."""
+        start = time.time()
         diff = False
-        for tenant in set(my_state.keys()) & set(other_state.keys()):
-            # TODO(ivar): parallelize the procedure on Tenant's basis
-            try:
-                differences = {CREATE: [], DELETE: []}
-                other_tenant_state = other_state[tenant]
-                my_tenant_state = my_state.get(
-                    tenant, structured_tree.StructuredHashTree())
-                # Retrieve difference to transform self into other
+        try:
+            differences = {CREATE: [], DELETE: []}
+            other_tenant_state = other_state[tenant]
+            my_tenant_state = my_state.get(
+                tenant, structured_tree.StructuredHashTree())
+            hashes = (other_tenant_state.root_full_hash,
+                      my_tenant_state.root_full_hash)
+            # Nothing changed since both trees converged, unless some
+            # operation is still being retried there's no work to do
+            if (self._converged_hashes.get(tenant) == hashes and
+                    not self._has_pending_retries(tenant)):
+                return diff
+            self._converged_hashes.pop(tenant, None)
+            # Retrieve difference to transform self into other
+            with cycle_stats.measure('diff', self.name, tenant):
                 difference = other_tenant_state.diff(my_tenant_state)
-                differences[CREATE].extend(difference['add'])
-                differences[DELETE].extend(difference['remove'])
+            differences[CREATE].extend(difference['add'])
+            differences[DELETE].extend(difference['remove'])
 
-                if differences.get(CREATE) or differences.get(DELETE):
-                    LOG.info("Universe differences between %s and %s: %s",
-                             self.name, other_universe.name, differences)
-                    diff = True
+            if differences.get(CREATE) or differences.get(DELETE):
+                LOG.info("Universe differences between %s and %s: %s",
+                         self.name, other_universe.name, differences)
+                diff = True
+            # Deferred keys are handled as skipped ones for this cycle
+            skipset = set(self._apply_key_budget(tenant, differences))
+            with cycle_stats.measure('get_resources', self.name, tenant):
                 result = {
                     CREATE: other_universe.get_resources(differences[CREATE]),
                     DELETE: self.get_resources_for_delete(differences[DELETE])
                 }
 
+            with cycle_stats.measure('track_actions', self.name, tenant):
                 reset, fail, skip = self._track_universe_actions(result,
                                                                  tenant)
-                if (self._sync_log.get(tenant, {}).get('create') or
-                        self._sync_log.get(tenant, {}).get('delete')):
-                    LOG.debug('Sync log cache for %s (%s): %s' %
-                              (self.name, tenant, self._sync_log))
-
-                if reset:
-                    self.reset(context, [tenant])
-                    other_universe.reset(context, [tenant])
-                    # Don't synchronize resetting roots
-                    continue
-
-                for action, res in fail:
-                    if action == CREATE:
-                        self.creation_failed(
-                            context, res,
-                            reason='Divergence detected on this object.',
-                            error=errors.OPERATION_CRITICAL)
-                    if action == DELETE:
-                        self.deletion_failed(
-                            context, res,
-                            reason='Divergence detected on this object.',
-                            error=errors.OPERATION_CRITICAL)
-                    skip.append((action, res))
-
-                skipset = set()
-                if skip:
-                    differences[CREATE] = set(differences[CREATE])
-                    differences[DELETE] = set(differences[DELETE])
-
-                    for action, res in skip:
-                        for key in (tree_manager.AimHashTreeMaker.
-                                    aim_res_to_nodes(res)):
-                            differences[action].discard(key)
-                            skipset.add(key)
-                    differences[CREATE] = list(differences[CREATE])
-                    differences[DELETE] = list(differences[DELETE])
-                    # Need to rebuild results
+            if (self._sync_log.get(tenant, {}).get('create') or
+                    self._sync_log.get(tenant, {}).get('delete')):
+                LOG.debug('Sync log cache for %s (%s): %s' %
+                          (self.name, tenant, self._sync_log))
+
+            if reset:
+                self.reset(context, [tenant])
+                other_universe.reset(context, [tenant])
+                # Don't synchronize resetting roots
+                return diff
+
+            for action, res in fail:
+                if action == CREATE:
+                    self.creation_failed(
+                        context, res,
+                        reason='Divergence detected on this object.',
+                        error=errors.OPERATION_CRITICAL)
+                if action == DELETE:
+                    self.deletion_failed(
+                        context, res,
+                        reason='Divergence detected on this object.',
+                        error=errors.OPERATION_CRITICAL)
+                skip.append((action, res))
+
+            if skip:
+                differences[CREATE] = set(differences[CREATE])
+                differences[DELETE] = set(differences[DELETE])
+
+                for action, res in skip:
+                    for key in (tree_manager.AimHashTreeMaker.
+                                aim_res_to_nodes(res)):
+                        differences[action].discard(key)
+                        skipset.add(key)
+                differences[CREATE] = list(differences[CREATE])
+                differences[DELETE] = list(differences[DELETE])
+                # Need to rebuild results
+                with cycle_stats.measure('get_resources', self.name, tenant):
                     result = {
                         CREATE: other_universe.get_resources(
                             differences[CREATE]),
                         DELETE: self.get_resources_for_delete(
                             differences[DELETE])
                     }
+            with cycle_stats.measure('update_status', self.name, tenant):
                 self.update_status_objects(context, my_tenant_state,
                                            differences, skipset)
                 other_universe.update_status_objects(
                     context, other_tenant_state, differences, skipset)
-                # Reconciliation method for pushing changes
+            # Reconciliation method for pushing changes
+            with cycle_stats.measure('push_resources', self.name, tenant):
                 self.push_resources(context, result)
-            except Exception as e:
-                LOG.error("An unexpected error has occurred while "
-                          "reconciling tenant %s: %s" % (tenant, e.message))
-                LOG.error(traceback.format_exc())
-                # Guess we can't consider the multiverse synced if this happens
-                diff = True
+            if not diff and not skipset:
+                self._converged_hashes[tenant] = hashes
+        except Exception as e:
+            LOG.error("An unexpected error has occurred while "
+                      "reconciling tenant %s: %s" % (tenant, e.message))
+            LOG.error(traceback.format_exc())
+            # Guess we can't consider the multiverse synced if this happens
+            diff = True
+        finally:
+            self.reconcile_time[tenant] = time.time() - start
+            cycle_stats.get_stats().record(
+                'reconcile_tenant', self.reconcile_time[tenant],
+                universe=self.name, tenant=tenant)
         return diff
 
+    def _has_pending_retries(self, tenant):
+        with utils.get_rlock(lcon.SYNC_LOG_LOCK + tenant):
+            sync_log = self._sync_log.get(tenant, {})
+            return bool(sync_log.get(CREATE) or sync_log.get(DELETE))
+
     def reset(self, context, tenants):
         pass
 
@@ -451,39 +612,55 @@ class HashTreeStoredUniverse(AimUniverse):
         # NOTE(ivar): state is a copy at the current iteration that was created
         # through the observe() method.
         desired_state = desired_state or self.get_relevant_state_for_read()
-        result = []
+        nodes_cache = {}
+        resolved = []
         id_set = set()
+        # Related and parent nodes are queued after the requested keys, and
+        # each key is looked up only once in every state.
+        pending = list(resource_keys)
+        for key in pending:
+            if key in id_set:
+                continue
+            nodes = self._find_nodes(key, desired_state, nodes_cache)
+            node = next((x for x in nodes if not x.dummy), None)
+            if not node:
+                continue
+            attr = node.metadata.to_dict()
+            # Capture related objects
+            for current_node in nodes:
+                pending.extend(
+                    child.key for child in current_node.get_children()
+                    if child.metadata.get('related') and not child.dummy)
+            if attr.get('related', False):
+                pending.extend(
+                    x.key for x in self._find_nodes(key[:-1], desired_state,
+                                                    nodes_cache)
+                    if not x.dummy)
+            resolved.append((key, attr))
+            id_set.add(key)
+        # Callers rely on the expanded keys
+        resource_keys.extend(pending[len(resource_keys):])
+
+        result = []
         monitored_set = set()
-        for key in resource_keys:
-            if key not in id_set:
-                attr = self._fill_node(key, desired_state)
-                if not attr:
-                    continue
-                monitored = attr.pop('monitored', None)
-                related = attr.pop('related', False)
-                attr = attr.get('attributes', {})
-                aci_object = self._keys_to_bare_aci_objects([key])[0]
-                aci_object.values()[0]['attributes'].update(attr)
-                dn = aci_object.values()[0]['attributes']['dn']
-                # Capture related objects
-                if desired_state:
-                    self._fill_related_nodes(resource_keys, key,
-                                             desired_state)
-                    if related:
-                        self._fill_parent_node(resource_keys, key,
-                                               desired_state)
-                result.append(aci_object)
-                if monitored:
-                    if related:
-                        try:
-                            monitored_set.add(
-                                converter.AciToAimModelConverter().convert(
-                                    [aci_object])[0].dn)
-                        except IndexError:
-                            pass
-                    else:
-                        monitored_set.add(dn)
-                id_set.add(key)
+        aim_converter = None
+        aci_objects = self._keys_to_bare_aci_objects([x[0] for x in resolved])
+        for (key, attr), aci_object in zip(resolved, aci_objects):
+            aci_object.values()[0]['attributes'].update(
+                attr.get('attributes', {}))
+            result.append(aci_object)
+            if attr.get('monitored'):
+                if attr.get('related', False):
+                    aim_converter = (aim_converter or
+                                     converter.AciToAimModelConverter())
+                    try:
+                        monitored_set.add(
+                            aim_converter.convert([aci_object])[0].dn)
+                    except IndexError:
+                        pass
+                else:
+                    monitored_set.add(
+                        aci_object.values()[0]['attributes']['dn'])
         if resource_keys:
             result = self._convert_get_resources_result(result, monitored_set)
             LOG.debug("Result for keys %s\n in %s:\n %s" %
@@ -509,40 +686,23 @@ class HashTreeStoredUniverse(AimUniverse):
                       (resource_keys, result))
         return result
 
-    def _fill_node(self, current_key, desired_state):
-        root = tree_manager.AimHashTreeMaker._extract_root_rn(current_key)
-        for state in desired_state:
-            try:
-                current_node = state[root].find(current_key)
-            except (IndexError, KeyError):
-                continue
-            if current_node and not current_node.dummy:
-                return current_node.metadata.to_dict()
-
-    def _fill_related_nodes(self, resource_keys, current_key, desired_state):
-        root = tree_manager.AimHashTreeMaker._extract_root_rn(current_key)
-        for state in desired_state:
-            try:
-                current_node = state[root].find(current_key)
-                if not current_node:
-                    continue
-            except (IndexError, KeyError):
-                continue
-            for child in current_node.get_children():
-                if child.metadata.get('related') and not child.dummy:
-                    resource_keys.append(child.key)
-
-    def _fill_parent_node(self, resource_keys, current_key, desired_state):
-        root = tree_manager.AimHashTreeMaker._extract_root_rn(current_key)
+    def _find_nodes(self, key, desired_state, nodes_cache):
+        # Nodes of this key in every state of desired_state, memoized
+        try:
+            return nodes_cache[key]
+        except KeyError:
+            pass
+        root = tree_manager.AimHashTreeMaker._extract_root_rn(key)
+        nodes = []
         for state in desired_state:
             try:
-                parent_node = state[root].find(current_key[:-1])
-                if not parent_node:
-                    continue
+                node = state[root].find(key)
             except (IndexError, KeyError):
                 continue
-            if not parent_node.dummy:
-                resource_keys.append(parent_node.key)
+            if node:
+                nodes.append(node)
+        nodes_cache[key] = nodes
+        return nodes
 
     def serve(self, context, tenants):
         pass
@@ -597,9 +757,8 @@ class HashTreeStoredUniverse(AimUniverse):
         :param root: root under consideration
         :return:
         """
-        # TODO(ivar): if tenant is unserved, its action track will leak until
-        # AID is restarted. Be aware of this during tracking refactoring.
-        curr_time = time.time()
+        start = time.time()
+        curr_time = start
         reset = False
         seen = set()
         fail = []
@@ -609,26 +768,30 @@ class HashTreeStoredUniverse(AimUniverse):
         with utils.get_rlock(lcon.SYNC_LOG_LOCK + root):
             root_state = self._sync_log.setdefault(
                 root, {'create': {}, 'delete': {}})
-            new_state = {'create': {}, 'delete': {}}
             for action in [CREATE, DELETE]:
+                action_state = root_state[action]
+                tracked = set()
                 for res in self._action_items_to_aim_resources(actions,
                                                                action):
-                    if res in seen:
+                    # Identity tuples are much cheaper to hash than resources
+                    res_id = self._get_aim_object_identifier(res)
+                    if res_id in seen:
                         continue
-                    seen.add(res)
+                    seen.add(res_id)
+                    tracked.add(res_id)
                     # Same resource created twice in the same iteration is
                     # increased only once
                     if root != res.root:
                         raise exceptions.BadTrackingArgument(
                             exp=root, act=res.root, res=actions)
-                    new = (new_state[action].setdefault(
-                        res, {'limit': self.reset_retry_limit, 'res': res,
-                              'retries': -1, 'action': ACTION_RESET,
-                              'last': curr_time, 'next': curr_time}))
-                    curr = root_state[action].get(res, {})
-                    if curr:
-                        new.update(curr)
-                    curr = new
+                    curr = action_state.get(res_id)
+                    if not curr or curr['res'] != res:
+                        # New action, or the object has changed since the
+                        # previous attempts: start over
+                        curr = action_state[res_id] = {
+                            'limit': self.reset_retry_limit, 'res': res,
+                            'retries': -1, 'action': ACTION_RESET,
+                            'last': curr_time, 'next': curr_time}
                     if curr_time < curr['next']:
                         # Let's not make any consideration about this object
                         LOG.debug("AIM object %s is being re-tried too soon "
@@ -654,8 +817,26 @@ class HashTreeStoredUniverse(AimUniverse):
                                      (str(res), action, curr['retries']))
                             curr['limit'] += 5
                             fail.append((action, res))
-            self._sync_log[root] = new_state
-            return reset, fail, skip
+                # Actions not happening anymore are off the hook
+                for res_id in [x for x in action_state if x not in tracked]:
+                    del action_state[res_id]
+        with self._sync_log_time_lock:
+            self._sync_log_time += time.time() - start
+        return reset, fail, skip
+
+    def _evict_sync_log(self, served_roots):
+        # Drop retry tracking of roots that are not served anymore
+        for root in [x for x in self._sync_log if x not in served_roots]:
+            with utils.get_rlock(lcon.SYNC_LOG_LOCK + root):
+                self._sync_log.pop(root, None)
+
+    def sync_log_stats(self):
+        """Size of the retry tracker and time spent maintaining it."""
+        entries = 0
+        for root_state in self._sync_log.values():
+            entries += sum(len(x) for x in root_state.values())
+        return {'roots': len(self._sync_log), 'entries': entries,
+                'time': self._sync_log_time}
 
     @property
     def state(self):
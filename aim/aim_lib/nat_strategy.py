@@ -684,13 +684,22 @@ class NoNatStrategy(NatStrategyMixin):
             # BDs in all tenants are candidates - locate all BDs whose
             # vrf_name matches vrf.name, and exclude those that have a
             # local VRF aliasing the given VRF.
-            all_bds = self.mgr.find(ctx, resource.BridgeDomain,
-                                    vrf_name=vrf.name)
+            # Only identities are needed to select the candidate tenants.
+            all_bds = self.mgr.find_identities(ctx, resource.BridgeDomain,
+                                               vrf_name=vrf.name)
             bd_tenants = set([b.tenant_name for b in all_bds])
-            bd_tenants = [t for t in bd_tenants
-                          if not self.mgr.get(
-                              ctx, resource.VRF(tenant_name=t, name=vrf.name))]
-            return [b for b in all_bds if b.tenant_name in bd_tenants]
+            if not bd_tenants:
+                return []
+            vrf_tenants = set(
+                v.tenant_name for v in self.mgr.find_identities(
+                    ctx, resource.VRF, name=vrf.name,
+                    in_={'tenant_name': list(bd_tenants)}))
+            bd_tenants = list(bd_tenants - vrf_tenants)
+            if not bd_tenants:
+                return []
+            return self.mgr.find(ctx, resource.BridgeDomain,
+                                 vrf_name=vrf.name,
+                                 in_={'tenant_name': bd_tenants})
         elif (vrf.tenant_name == 'common' or
               vrf.tenant_name == l3out.tenant_name):
             # VRF and L3out are visible only to BDs in l3out's tenant
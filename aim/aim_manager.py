@@ -142,7 +142,7 @@ class AimManager(object):
             old_monitored = None
             new_monitored = None
             if overwrite:
-                old_db_obj = self._query_db_obj(context.store, resource)
+                old_db_obj = self._get_db_obj(context, resource)
                 if old_db_obj:
                     old_monitored = getattr(old_db_obj, 'monitored', None)
                     new_monitored = getattr(resource, 'monitored', None)
@@ -161,6 +161,7 @@ class AimManager(object):
                                             attr_val)
             db_obj = old_db_obj or context.store.make_db_obj(resource)
             context.store.add(db_obj)
+            self._invalidate_cache(context, type(resource), resource.identity)
             if self._should_set_pending(old_db_obj, old_monitored,
                                         new_monitored):
                 # NOTE(ivar): we shouldn't change status in the AIM manager
@@ -185,7 +186,7 @@ class AimManager(object):
         """
         self._validate_resource_class(resource)
         with context.store.begin(subtransactions=True):
-            db_obj = self._query_db_obj(context.store, resource)
+            db_obj = self._get_db_obj(context, resource)
             if db_obj:
                 old_resource = self._make_resource(context, resource, db_obj)
                 old_monitored = getattr(db_obj, 'monitored', None)
@@ -209,6 +210,8 @@ class AimManager(object):
                     attr_val = {id_attr_0: getattr(resource, id_attr_0)}
                 context.store.from_attr(db_obj, type(resource), attr_val)
                 context.store.add(db_obj)
+                self._invalidate_cache(context, type(resource),
+                                       resource.identity)
                 if self._should_set_pending(db_obj, old_monitored,
                                             new_monitored):
                     # NOTE(ivar): we shouldn't change status in the AIM manager
@@ -232,7 +235,7 @@ class AimManager(object):
         """
         self._validate_resource_class(resource)
         with context.store.begin(subtransactions=True):
-            db_obj = self._query_db_obj(context.store, resource)
+            db_obj = self._get_db_obj(context, resource)
             if db_obj:
                 if isinstance(resource, api_res.AciResourceBase):
                     status = self.get_status(
@@ -247,10 +250,13 @@ class AimManager(object):
                     if status:
                         self.delete(context, status, force=force)
                 context.store.delete(db_obj)
+                # Deletion might cascade to other objects (eg. faults)
+                self._invalidate_cache(context)
             # When cascade is specified, delete the object's subtree even if
             # the resource itself doesn't exist.
             if cascade:
-                for child_res in self.get_subtree(context, resource):
+                for child_res in self.get_subtree(context, resource,
+                                                  identities_only=True):
                     # Delete without cascade
                     self.delete(context, child_res, force=force)
 
@@ -267,6 +273,7 @@ class AimManager(object):
         attr_val = {k: v for k, v in kwargs.iteritems()
                     if k in resource_class.attributes() +
                     ['in_', 'notin_', 'order_by']}
+        self._invalidate_cache(context)
         return self._delete_db(context.store, resource_class, **attr_val)
 
     def get(self, context, resource, for_update=False, include_aim_id=False):
@@ -280,8 +287,7 @@ class AimManager(object):
         otherwise.
         """
         self._validate_resource_class(resource)
-        db_obj = self._query_db_obj(context.store, resource,
-                                    for_update=for_update)
+        db_obj = self._get_db_obj(context, resource, for_update=for_update)
         return self._make_resource(context, resource, db_obj,
                                    include_aim_id=include_aim_id)
 
@@ -300,18 +306,25 @@ class AimManager(object):
             include_aim_id=include_aim_id) if db_obj else None
 
     def find(self, context, resource_class, for_update=False,
-             include_aim_id=False, **kwargs):
+             include_aim_id=False, attributes=None, **kwargs):
         """Find AIM resources from the database that match specified criteria.
 
         Parameter 'resource_class' indicates the type of resource to
         look for. Matching criteria are specified as keyword-arguments.
         Only equality matches are supported.
+        If 'attributes' is specified, only those attributes (along with the
+        identity ones) are retrieved, the others are left to their default
+        values.
         Returns a list of resources that match.
         """
         self._validate_resource_class(resource_class)
         attr_val = {k: v for k, v in kwargs.iteritems()
                     if k in resource_class.attributes() +
                     ['in_', 'notin_', 'order_by']}
+        if attributes is not None:
+            return self._find_attributes(
+                context, resource_class, attributes, for_update=for_update,
+                include_aim_id=include_aim_id, **attr_val)
         result = []
         for obj in self._query_db(context.store, resource_class,
                                   for_update=for_update, **attr_val):
@@ -320,6 +333,54 @@ class AimManager(object):
                                             include_aim_id=include_aim_id))
         return result
 
+    def find_identities(self, context, resource_class, include_aim_id=False,
+                        **kwargs):
+        """Find AIM resources, only retrieving their identity attributes."""
+        return self.find(context, resource_class,
+                         include_aim_id=include_aim_id, attributes=[],
+                         **kwargs)
+
+    def _find_attributes(self, context, resource_class, attributes,
+                         for_update=False, include_aim_id=False, **kwargs):
+        db_cls = context.store.resource_to_db_type(resource_class)
+        if not db_cls:
+            return []
+        attributes = resource_class.identity_attributes.keys() + [
+            x for x in attributes if x in resource_class.attributes() and
+            x not in resource_class.identity_attributes]
+        if include_aim_id:
+            attributes.append('aim_id')
+        result = []
+        for attr in context.store.query_attributes(
+                db_cls, resource_class, attributes, lock_update=for_update,
+                **kwargs):
+            res = resource_class(**{k: v for k, v in attr.iteritems()
+                                    if k in resource_class.attributes()})
+            if include_aim_id and 'aim_id' in attr:
+                res._aim_id = attr['aim_id']
+            result.append(res)
+        return result
+
+    def iter_find(self, context, resource_class, page_size=None,
+                  include_aim_id=False, **kwargs):
+        """Iterate over AIM resources that match specified criteria.
+
+        Same as find, but resources are retrieved from the store
+        'page_size' at a time and yielded as they are built, so that
+        scanning large tables runs in bounded memory. Result ordering is
+        determined by the store, 'order_by' is therefore not supported.
+        """
+        self._validate_resource_class(resource_class)
+        attr_val = {k: v for k, v in kwargs.iteritems()
+                    if k in resource_class.attributes() + ['in_', 'notin_']}
+        db_cls = context.store.resource_to_db_type(resource_class)
+        if not db_cls:
+            return
+        for obj in context.store.iter_query(db_cls, resource_class,
+                                            page_size=page_size, **attr_val):
+            yield context.store.make_resource(resource_class, obj,
+                                              include_aim_id=include_aim_id)
+
     def count(self, context, resource_class, **kwargs):
         self._validate_resource_class(resource_class)
         attr_val = {k: v for k, v in kwargs.iteritems()
@@ -395,11 +456,82 @@ class AimManager(object):
                 return True
             return False
 
+    def _set_resources_sync(self, context, resources, sync_status,
+                            message='', exclude=None):
+        """Bulk version of _set_resource_sync.
+
+        Statuses are retrieved and transitioned with a fixed number of
+        queries per utils.BULK_QUERY_SIZE resources. Returns the list of
+        resources whose status was actually changed.
+        """
+        resources = [x for x in resources
+                     if isinstance(x, api_res.AciResourceBase)]
+        if not resources:
+            return []
+        if not context.store.supports_sql:
+            return [x for x in resources if self._set_resource_sync(
+                context, x, sync_status, message=message, exclude=exclude)]
+        exclude = exclude or []
+        with context.store.begin(subtransactions=True):
+            by_status_id = {}
+            for res in resources:
+                res_type, res_id = self._get_injected_status_params(res)
+                if res_id is None:
+                    by_status_id = None
+                    break
+                by_status_id[(res_type, res_id)] = res
+            if by_status_id is None:
+                by_status_id = {
+                    (type(res).__name__, aim_id): res for res, aim_id in
+                    context.store.query_aim_ids(resources)}
+            if not by_status_id:
+                return []
+            existing = set()
+            changed = []
+            self._invalidate_cache(context, api_status.AciStatus)
+            for res_ids in utils.chunks(set(x[1] for x in by_status_id)):
+                for status in self.find(context, api_status.AciStatus,
+                                        in_={'resource_id': res_ids}):
+                    existing.add((status.resource_type, status.resource_id))
+                filters = {'in_': {'resource_id': res_ids}}
+                if exclude:
+                    filters['notin_'] = {'sync_status': exclude}
+                for status in context.store.update_all(
+                        api_status.AciStatus, filters=filters,
+                        sync_status=sync_status, sync_message=message):
+                    res = by_status_id.get((status.resource_type,
+                                            status.resource_id))
+                    if res is not None:
+                        changed.append(res)
+            # Create the statuses that don't exist yet
+            # NOTE(ivar): this matches the behavior of get_status, which
+            # creates a N/A status when none is present.
+            apply_new = api_status.AciStatus.SYNC_NA not in exclude
+            for (res_type, res_id), res in by_status_id.iteritems():
+                if (res_type, res_id) in existing:
+                    continue
+                self.create(context, api_status.AciStatus(
+                    resource_type=res_type, resource_id=res_id,
+                    resource_root=res.root, resource_dn=res.dn,
+                    sync_status=(sync_status if apply_new else
+                                 api_status.AciStatus.SYNC_NA),
+                    sync_message=message if apply_new else ''))
+                if apply_new:
+                    changed.append(res)
+            return changed
+
     def set_resource_sync_synced(self, context, resource):
         self._set_resource_sync(context, resource, api_status.AciStatus.SYNCED)
 
+    def set_resources_sync_synced(self, context, resources):
+        """Set multiple resources in synced state at once."""
+        with context.store.begin(subtransactions=True):
+            return self._set_resources_sync(context, resources,
+                                            api_status.AciStatus.SYNCED)
+
     def recover_root_errors(self, context, root):
         with context.store.begin(subtransactions=True):
+            self._invalidate_cache(context, api_status.AciStatus)
             context.store.update_all(
                 api_status.AciStatus,
                 filters={'sync_status': api_status.AciStatus.SYNC_FAILED,
@@ -430,11 +562,86 @@ class AimManager(object):
                                                    parent_klass(**identity),
                                                    top=False)
                 if cascade:
-                    for child_res in self.get_subtree(context, resource):
+                    for child_res in self.get_subtree(context, resource,
+                                                      identities_only=True):
                         self.set_resource_sync_pending(context, child_res,
                                                        top=False,
                                                        cascade=False)
 
+    def set_resources_sync_pending(self, context, resources):
+        """Set multiple resources in pending state at once.
+
+        Same semantics as set_resource_sync_pending, but parent and subtree
+        propagation is computed in memory: only resources in error state
+        can be moved to pending during propagation, so those are retrieved
+        once for all the involved roots.
+        """
+        with context.store.begin(subtransactions=True):
+            changed = self._set_resources_sync(
+                context, resources, api_status.AciStatus.SYNC_PENDING,
+                exclude=[api_status.AciStatus.SYNC_PENDING])
+            if not changed:
+                return
+            failed = self._find_failed_resources(
+                context, set(x.root for x in changed))
+            if not failed:
+                return
+            propagated = []
+            seen = set()
+
+            def visit(key, cascade):
+                if key in failed and key not in seen:
+                    seen.add(key)
+                    propagated.append(failed[key])
+                    walk(key, cascade)
+
+            def walk(key, cascade):
+                klass, identity = key
+                parent_klass = klass._tree_parent
+                if parent_klass:
+                    visit((parent_klass, identity[
+                        :len(parent_klass.identity_attributes)]), True)
+                if cascade:
+                    for other in failed.keys():
+                        if (other[1][:len(identity)] == identity and
+                                self._is_ancestor_class(klass, other[0])):
+                            visit(other, False)
+
+            for res in changed:
+                walk((type(res), tuple(res.identity)), True)
+            self._set_resources_sync(
+                context, propagated, api_status.AciStatus.SYNC_PENDING,
+                exclude=[api_status.AciStatus.SYNCED,
+                         api_status.AciStatus.SYNC_PENDING,
+                         api_status.AciStatus.SYNC_NA])
+
+    def _find_failed_resources(self, context, roots):
+        # Returns resources in error state for the given roots, indexed by
+        # (class, identity)
+        by_klass = {}
+        for root_chunk in utils.chunks(roots):
+            for status in self.find(
+                    context, api_status.AciStatus,
+                    sync_status=api_status.AciStatus.SYNC_FAILED,
+                    in_={'resource_root': root_chunk}):
+                if status.parent_class in self.aim_resources:
+                    by_klass.setdefault(status.parent_class, []).append(
+                        status.resource_id)
+        result = {}
+        for klass, aim_ids in by_klass.iteritems():
+            for id_chunk in utils.chunks(aim_ids):
+                for res in self.find(context, klass, in_={'aim_id': id_chunk}):
+                    result[(klass, tuple(res.identity))] = res
+        return result
+
+    def _is_ancestor_class(self, ancestor, klass):
+        klass = klass._tree_parent
+        while klass:
+            if klass == ancestor:
+                return True
+            klass = klass._tree_parent
+        return False
+
     def set_resource_sync_error(self, context, resource, message='', top=True):
         with context.store.begin(subtransactions=True):
             # No need to set sync_error for resources already in that state
@@ -443,7 +650,8 @@ class AimManager(object):
                     message=message,
                     exclude=[api_status.AciStatus.SYNC_FAILED]) and top:
                 # Set sync_error for the whole subtree
-                for child_res in self.get_subtree(context, resource):
+                for child_res in self.get_subtree(context, resource,
+                                                  identities_only=True):
                     self.set_resource_sync_error(
                         context, child_res,
                         message="Parent resource %s is "
@@ -489,14 +697,44 @@ class AimManager(object):
         objs = self._query_db(store, cls, for_update=for_update, **id_attr)
         return objs[0] if objs else None
 
-    def _get_status_params(self, context, resource):
+    def _get_db_obj(self, context, resource, for_update=False):
+        # Same as _query_db_obj, served by the context cache when enabled.
+        # Locking reads always hit the store. Missing objects are not
+        # cached, since they could be created by another context.
+        cache = getattr(context, 'cache', None)
+        if cache is None or not context.store.in_transaction:
+            return self._query_db_obj(context.store, resource,
+                                      for_update=for_update)
+        if not for_update:
+            found, db_obj = cache.get(type(resource), resource.identity)
+            if found:
+                return db_obj
+        db_obj = self._query_db_obj(context.store, resource,
+                                    for_update=for_update)
+        if db_obj is not None:
+            cache.set(type(resource), resource.identity, db_obj)
+        return db_obj
+
+    def _invalidate_cache(self, context, resource_class=None, identity=None):
+        cache = getattr(context, 'cache', None)
+        if cache is not None:
+            if resource_class is None:
+                cache.clear()
+            else:
+                cache.invalidate(resource_class, identity=identity)
+
+    def _get_injected_status_params(self, resource):
         res_type = type(resource).__name__
-        # Try to avoid DB call
         inj_id = getattr(resource, '_injected_aim_id',
                          getattr(resource, '_aim_id', None))
+        return res_type, inj_id or None
+
+    def _get_status_params(self, context, resource):
+        # Try to avoid DB call
+        res_type, inj_id = self._get_injected_status_params(resource)
         if inj_id:
             return res_type, inj_id
-        db_obj = self._query_db_obj(context.store, resource)
+        db_obj = self._get_db_obj(context, resource)
         if db_obj is None:
             # TODO(ivar): should we raise a proper exception?
             return None, None
@@ -508,11 +746,14 @@ class AimManager(object):
             return None, None
         return res_type, res_id
 
-    def get_subtree(self, context, resource):
-        return self._get_subtree(context, type(resource), *resource.identity)
+    def get_subtree(self, context, resource, identities_only=False):
+        return self._get_subtree(context, type(resource), *resource.identity,
+                                 identities_only=identities_only)
 
     def _get_subtree(self, context, klass, *identity, **kwargs):
         subtree_resources = []
+        find = (self.find_identities if kwargs.pop('identities_only', False)
+                else self.find)
 
         def get_subtree_klasses(klass):
             for child_klass in self._model_tree.get(klass, []):
@@ -520,7 +761,7 @@ class AimManager(object):
                       for i, v in enumerate(identity)}
                 # Extra search attributes
                 id.update(kwargs)
-                subtree_resources.extend(self.find(context, child_klass, **id))
+                subtree_resources.extend(find(context, child_klass, **id))
                 get_subtree_klasses(child_klass)
         get_subtree_klasses(klass)
         return subtree_resources
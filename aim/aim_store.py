@@ -16,6 +16,7 @@
 from contextlib import contextmanager
 import copy
 from oslo_log import log as logging
+import six
 from sqlalchemy import and_
 from sqlalchemy import event as sa_event
 from sqlalchemy import or_
@@ -28,6 +29,7 @@ from aim.api import resource as api_res
 from aim.api import service_graph as api_service_graph
 from aim.api import status as api_status
 from aim.api import tree as api_tree
+from aim.common import utils
 from aim.db import agent_model
 from aim.db import config_model
 from aim.db import hashtree_db_listener as ht_db_l
@@ -41,6 +43,13 @@ from aim.k8s import api_v1
 
 
 LOG = logging.getLogger(__name__)
+DEFAULT_PAGE_SIZE = 500
+
+
+def _identity_key(values):
+    # DB rows are unicode, resource identities might be byte strings
+    return tuple(x.decode('utf-8') if isinstance(x, six.binary_type)
+                 else six.text_type(x) for x in values)
 
 
 @contextmanager
@@ -83,6 +92,17 @@ class AimStore(object):
         # Expunge transaction artifacts if supported
         pass
 
+    @property
+    def in_transaction(self):
+        # Whether a transaction is currently open on this store
+        return False
+
+    def register_transaction_cache(self, cache):
+        # Register a cache object that needs to be cleared when the current
+        # outermost transaction ends. Caches should only be used when the
+        # store is in a transaction.
+        pass
+
     def resource_to_db_type(self, resource_klass):
         # Returns the DB object type for an AIM resource type
         return resource_klass
@@ -103,6 +123,31 @@ class AimStore(object):
         # Return list of objects that match specified criteria
         pass
 
+    def query_attributes(self, db_obj_type, resource_klass, attributes,
+                         in_=None, notin_=None, order_by=None,
+                         lock_update=False, **filters):
+        # Return list of resource attribute dictionaries, restricted to
+        # 'attributes', for the objects that match specified criteria.
+        # Stores may override this to only retrieve the requested attributes.
+        result = []
+        for obj in (self.query(db_obj_type, resource_klass, in_=in_,
+                               notin_=notin_, order_by=order_by,
+                               lock_update=lock_update, **filters) or []):
+            attr = self.to_attr(resource_klass, obj)
+            if 'aim_id' in attributes and hasattr(obj, 'aim_id'):
+                attr['aim_id'] = obj.aim_id
+            result.append({k: attr[k] for k in attributes if k in attr})
+        return result
+
+    def iter_query(self, db_obj_type, resource_klass, in_=None, notin_=None,
+                   page_size=None, **filters):
+        # Return an iterator over the objects that match specified criteria.
+        # Stores that support paging retrieve 'page_size' objects at a time.
+        # The default implementation simply iterates over the whole result.
+        for obj in (self.query(db_obj_type, resource_klass, in_=in_,
+                               notin_=notin_, **filters) or []):
+            yield obj
+
     def count(self, db_obj_type, resource_klass, in_=None, notin_=None,
               **filters):
         # Return count of objects that match specified criteria
@@ -135,6 +180,9 @@ class AimStore(object):
     def query_statuses(self, resources):
         raise NotImplementedError('query_statuses not implemented')
 
+    def query_aim_ids(self, resources):
+        raise NotImplementedError('query_aim_ids not implemented')
+
     def register_before_session_flush_callback(self, name, func):
         """Register callback for update to AIM objects.
 
@@ -289,6 +337,19 @@ class SqlAlchemyStore(AimStore):
             self.add_commit_hook()
             self._initialize_hooks()
 
+    @property
+    def in_transaction(self):
+        return bool(self.db_session and
+                    self.db_session.transaction is not None)
+
+    def register_transaction_cache(self, cache):
+        if not self.db_session:
+            return
+        if not hasattr(self.db_session, '_aim_caches'):
+            self.db_session._aim_caches = []
+        if cache not in self.db_session._aim_caches:
+            self.db_session._aim_caches.append(cache)
+
     def _initialize_hooks(self):
         self.register_before_session_flush_callback(
             'hashtree_db_listener_on_commit',
@@ -326,14 +387,16 @@ class SqlAlchemyStore(AimStore):
         db_klass = self.db_model_map[resource_klass]
         query = self._query(db_klass, resource_klass, **filters)
         # Commit hook is not called after update call for some reason
-        for obj in query.all():
+        objs = query.all()
+        for obj in objs:
             for k, v in kwargs.iteritems():
                 setattr(obj, k, v)
             self.add(obj)
+        return objs
 
     def _query(self, db_obj_type, resource_klass, in_=None, notin_=None,
-               order_by=None, lock_update=False, **filters):
-        query = self.db_session.query(db_obj_type)
+               order_by=None, lock_update=False, entities=None, **filters):
+        query = self.db_session.query(*(entities or [db_obj_type]))
         for k, v in (in_ or {}).iteritems():
             query = query.filter(getattr(db_obj_type, k).in_(v))
         for k, v in (notin_ or {}).iteritems() or {}:
@@ -371,6 +434,34 @@ class SqlAlchemyStore(AimStore):
         return [self.make_resource(api_status.AciStatus, x)
                 for x in db_statuses]
 
+    def query_aim_ids(self, resources):
+        # Returns a list of (resource, aim_id) tuples, running one query
+        # per resource type and BULK_QUERY_SIZE resources. Resources not
+        # found in the DB are omitted.
+        by_klass = {}
+        for res in resources:
+            by_klass.setdefault(type(res), []).append(res)
+        result = []
+        for res_klass, res_list in by_klass.iteritems():
+            db_klass = self.db_model_map.get(res_klass)
+            if not db_klass or not hasattr(db_klass, 'aim_id'):
+                continue
+            id_attrs = res_klass.identity_attributes.keys()
+            by_identity = {_identity_key(x.identity): x for x in res_list}
+            for chunk in utils.chunks(by_identity):
+                query = self.db_session.query(
+                    db_klass.aim_id,
+                    *[getattr(db_klass, k) for k in id_attrs])
+                query = query.filter(
+                    or_(*[and_(*[getattr(db_klass, k) == v
+                                 for k, v in zip(id_attrs, identity)])
+                          for identity in chunk]))
+                for row in query.all():
+                    res = by_identity.get(_identity_key(row[1:]))
+                    if res is not None:
+                        result.append((res, row[0]))
+        return result
+
     def query(self, db_obj_type, resource_klass, in_=None, notin_=None,
               order_by=None, lock_update=False, **filters):
 
@@ -378,6 +469,59 @@ class SqlAlchemyStore(AimStore):
                            order_by=order_by, lock_update=lock_update,
                            **filters).all()
 
+    def query_attributes(self, db_obj_type, resource_klass, attributes,
+                         in_=None, notin_=None, order_by=None,
+                         lock_update=False, **filters):
+        columns = set(x.key for x in db_obj_type.__mapper__.column_attrs)
+        if not set(attributes) <= columns:
+            # Attributes built out of relationships need the whole object
+            return super(SqlAlchemyStore, self).query_attributes(
+                db_obj_type, resource_klass, attributes, in_=in_,
+                notin_=notin_, order_by=order_by, lock_update=lock_update,
+                **filters)
+        # Only select the needed columns, this also skips the eager loading
+        # of the joined relationships.
+        query = self._query(
+            db_obj_type, resource_klass, in_=in_, notin_=notin_,
+            order_by=order_by, lock_update=lock_update,
+            entities=[getattr(db_obj_type, x) for x in attributes], **filters)
+        result = []
+        for row in query.all():
+            # Go through a transient model object so that any attribute
+            # conversion done by the model is preserved.
+            db_obj = db_obj_type()
+            for k, v in zip(attributes, row):
+                setattr(db_obj, k, v)
+            attr = db_obj.to_attr(self.db_session)
+            result.append({k: attr[k] for k in attributes if k in attr})
+        return result
+
+    def iter_query(self, db_obj_type, resource_klass, in_=None, notin_=None,
+                   page_size=None, **filters):
+        # Keyset pagination on the primary key: every page is retrieved with
+        # an independent query that starts right after the last key of the
+        # previous page, so the whole result is never held in memory.
+        page_size = page_size or DEFAULT_PAGE_SIZE
+        mapper = db_obj_type.__mapper__
+        pk_attrs = [mapper.get_property_by_column(x).key
+                    for x in mapper.primary_key]
+        pk_cols = [getattr(db_obj_type, x) for x in pk_attrs]
+        last = None
+        while True:
+            query = self._query(db_obj_type, resource_klass, in_=in_,
+                                notin_=notin_, **filters)
+            if last is not None:
+                query = query.filter(or_(*[
+                    and_(*([pk_cols[j] == last[j] for j in range(i)] +
+                           [pk_cols[i] > last[i]]))
+                    for i in range(len(pk_cols))]))
+            page = query.order_by(*pk_cols).limit(page_size).all()
+            for obj in page:
+                yield obj
+            if len(page) < page_size:
+                break
+            last = [getattr(page[-1], x) for x in pk_attrs]
+
     def count(self, db_obj_type, resource_klass, in_=None, notin_=None,
               **filters):
 
@@ -520,6 +664,8 @@ class SqlAlchemyStore(AimStore):
             # sqlalchemy 1.0.11 and below
             if transaction._parent is not None:
                 return
+        for cache in getattr(session, '_aim_caches', []):
+            cache.clear()
         try:
             added = list(session._aim_stash['added'])
             updated = list(session._aim_stash['updated'])
@@ -640,14 +786,38 @@ class K8sStore(AimStore):
                 raise
         self._post_delete(deleted)
 
-    def query(self, db_obj_type, resource_klass, in_=None, notin_=None,
-              order_by=None, lock_update=False, **filters):
+    def _list_selectors(self, db_obj_type, resource_klass, filters):
         def_ns = (self.namespace
                   if db_obj_type == api_v1.AciContainersObject else None)
 
         selectors = db_obj_type().build_selectors(resource_klass, filters)
         obj_name = selectors.pop('name', None)
         obj_ns = selectors.pop('namespace', None) or def_ns
+        return obj_name, obj_ns, selectors
+
+    def _list(self, db_obj_type, obj_name, obj_ns, selectors, **kwargs):
+        field_selectors = selectors.pop('field_selector', [])
+        if obj_name:
+            field_selectors.append('metadata.name=%s' % obj_name)
+        if field_selectors:
+            selectors['field_selector'] = '&'.join(field_selectors)
+        selectors.update(kwargs)
+        try:
+            return self.klient.list(db_obj_type, obj_ns, **selectors)
+        except api_v1.klient.ApiException as e:
+            if str(e.status) == '400':
+                # Some K8S objects may not support fieldSelector
+                LOG.info('Query for %s, namespace %s, selectors %s '
+                         'treated as Bad Request: %s',
+                         db_obj_type.kind, obj_ns, selectors, e)
+                return {'items': []}
+            else:
+                raise e
+
+    def query(self, db_obj_type, resource_klass, in_=None, notin_=None,
+              order_by=None, lock_update=False, **filters):
+        obj_name, obj_ns, selectors = self._list_selectors(
+            db_obj_type, resource_klass, filters)
 
         if obj_name and obj_ns:
             try:
@@ -659,24 +829,48 @@ class K8sStore(AimStore):
                 else:
                     raise e
         else:
-            field_selectors = selectors.pop('field_selector', [])
-            if obj_name:
-                field_selectors.append('metadata.name=%s' % obj_name)
-            if field_selectors:
-                selectors['field_selector'] = '&'.join(field_selectors)
-            try:
-                items = self.klient.list(db_obj_type, obj_ns, **selectors)
-                items = items['items']
-            except api_v1.klient.ApiException as e:
-                if str(e.status) == '400':
-                    # Some K8S objects may not support fieldSelector
-                    LOG.info('Query for %s, namespace %s, selectors %s '
-                             'treated as Bad Request: %s',
-                             db_obj_type.kind, obj_ns, selectors, e)
-                    items = []
-                else:
-                    raise e
+            items = self._list(db_obj_type, obj_name, obj_ns,
+                               selectors)['items']
+
+        result = self._filter_items(db_obj_type, resource_klass, items,
+                                    in_=in_, notin_=notin_, **filters)
+        if order_by:
+            if isinstance(order_by, basestring):
+                order_by = [order_by]
+            result = sorted(result,
+                            key=lambda x: tuple([x[k] for k in order_by]))
+        return result
+
+    def iter_query(self, db_obj_type, resource_klass, in_=None, notin_=None,
+                   page_size=None, **filters):
+        obj_name, obj_ns, selectors = self._list_selectors(
+            db_obj_type, resource_klass, filters)
+        if obj_name and obj_ns:
+            # At most one object
+            for obj in self.query(db_obj_type, resource_klass, in_=in_,
+                                  notin_=notin_, **filters):
+                yield obj
+            return
+        # Use API server chunking, every page carries the continue token for
+        # the next one
+        page_size = page_size or DEFAULT_PAGE_SIZE
+        token = None
+        while True:
+            kwargs = {'limit': page_size}
+            if token:
+                kwargs['continue'] = token
+            page = self._list(db_obj_type, obj_name, obj_ns,
+                              copy.deepcopy(selectors), **kwargs)
+            for obj in self._filter_items(db_obj_type, resource_klass,
+                                          page['items'], in_=in_,
+                                          notin_=notin_, **filters):
+                yield obj
+            token = (page.get('metadata') or {}).get('continue')
+            if not token:
+                break
 
+    def _filter_items(self, db_obj_type, resource_klass, items, in_=None,
+                      notin_=None, **filters):
         result = []
         aim_id_val = filters.pop('aim_id', None)
         for item in (items or []):
@@ -700,6 +894,8 @@ class K8sStore(AimStore):
                         raise e
             item_attr = db_obj.to_attr(resource_klass,
                                        defaults=self.attribute_defaults)
+            # aim_id is not a resource attribute, but can be used in filters
+            item_attr.setdefault('aim_id', db_obj.aim_id)
             if filters or in_ or notin_:
                 for k, v in filters.iteritems():
                     if item_attr.get(k) != v:
@@ -716,11 +912,6 @@ class K8sStore(AimStore):
                             result.append(db_obj)
             else:
                 result.append(db_obj)
-        if order_by:
-            if isinstance(order_by, basestring):
-                order_by = [order_by]
-            result = sorted(result,
-                            key=lambda x: tuple([x[k] for k in order_by]))
         return result
 
     def count(self, db_obj_type, resource_klass, in_=None, notin_=None,
@@ -138,6 +138,30 @@ class ResourceBase(object):
         return self.hash
 
 
+@utils.lru_cache('resource_dn')
+def _build_dn(mo_name, identity):
+    return apic_client.ManagedObjectClass(mo_name).dn(*identity)
+
+
+@utils.lru_cache('resource_rn')
+def _build_rn(mo_name, identity):
+    mo = apic_client.ManagedObjectClass(mo_name)
+    if mo.rn_param_count > 0:
+        return mo.rn(*identity[-mo.rn_param_count:])
+    else:
+        return mo.rn()
+
+
+@utils.lru_cache('resource_root')
+def _build_root(mo_name, identity):
+    mos_and_types = utils.decompose_dn(mo_name, _build_dn(mo_name, identity))
+    mo = apic_client.ManagedObjectClass(mos_and_types[0][0])
+    if mo.rn_param_count > 0:
+        return mo.rn(mos_and_types[0][1])
+    else:
+        return mo.rn()
+
+
 class AciResourceBase(ResourceBase):
     """Base class for AIM resources that map to ACI objects.
 
@@ -157,16 +181,11 @@ class AciResourceBase(ResourceBase):
 
     @property
     def dn(self):
-        return apic_client.ManagedObjectClass(self._aci_mo_name).dn(
-            *self.identity)
+        return _build_dn(self._aci_mo_name, tuple(self.identity))
 
     @property
     def rn(self):
-        mo = apic_client.ManagedObjectClass(self._aci_mo_name)
-        if mo.rn_param_count > 0:
-            return mo.rn(*self.identity[-mo.rn_param_count:])
-        else:
-            return mo.rn()
+        return _build_rn(self._aci_mo_name, tuple(self.identity))
 
     @classmethod
     def from_dn(cls, dn):
@@ -183,12 +202,7 @@ class AciResourceBase(ResourceBase):
 
     @property
     def root(self):
-        mos_and_types = utils.decompose_dn(self._aci_mo_name, self.dn)
-        mo = apic_client.ManagedObjectClass(mos_and_types[0][0])
-        if mo.rn_param_count > 0:
-            return mo.rn(mos_and_types[0][1])
-        else:
-            return mo.rn()
+        return _build_root(self._aci_mo_name, tuple(self.identity))
 
     @classmethod
     def root_ref_attribute(cls):
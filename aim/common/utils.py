@@ -14,11 +14,13 @@
 #    under the License.
 
 import base64
+import collections
 from contextlib import contextmanager
 import functools
 import hashlib
 import json
 import os
+import Queue as queue
 import random
 import re
 import threading
@@ -39,6 +41,9 @@ VMWARE_VMM_TYPE = 'VMware'
 KNOWN_VMM_TYPES = {'openstack': OPENSTACK_VMM_TYPE,
                    'vmware': VMWARE_VMM_TYPE}
 ACI_FAULT = 'faultInst'
+DN_CACHE_SIZE = 50000
+# Maximum number of resources matched by a single bulk lookup query
+BULK_QUERY_SIZE = 200
 
 
 def log(method):
@@ -58,6 +63,15 @@ def log(method):
     return wrapper
 
 
+def chunks(items, size=None):
+    # Yields consecutive slices of items holding at most size elements,
+    # BULK_QUERY_SIZE by default
+    size = size or BULK_QUERY_SIZE
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
 def generate_uuid():
     return str(uuid.uuid4())
 
@@ -191,9 +205,107 @@ class FakeContext(object):
             self.store = store
 
 
+class LRUCache(object):
+    """Thread safe, bounded, least recently used cache."""
+
+    def __init__(self, size, name=None):
+        self.size = size
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            # Most recently used
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            if len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'size': len(self._data), 'hits': self.hits,
+                    'misses': self.misses,
+                    'hit_rate': (float(self.hits) / lookups
+                                 if lookups else 0.0)}
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+_MISSING = object()
+
+
+def get_cache(name, size=DN_CACHE_SIZE):
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = LRUCache(size, name=name)
+        return _caches[name]
+
+
+def get_cache_stats():
+    return {name: cache.stats() for name, cache in _caches.items()}
+
+
+def lru_cache(name, size=DN_CACHE_SIZE):
+    """Memoize a function of hashable arguments in a shared LRU cache.
+
+    Exceptions are not cached, and cached values are shared among callers
+    so they must not be modified. Calls with unhashable arguments bypass
+    the cache.
+    """
+    def wrap(func):
+        # Lookups only take the lock of this cache
+        cache = get_cache(name, size)
+
+        @functools.wraps(func)
+        def inner(*args):
+            try:
+                result = cache.get(args, _MISSING)
+            except TypeError:
+                return func(*args)
+            if result is _MISSING:
+                result = func(*args)
+                cache.set(args, result)
+            return result
+        return inner
+    return wrap
+
+
+@lru_cache('dn_decompose')
+def _decompose_dn_guess(dn, mo_type):
+    mo, mos_and_rns = apic_client.DNManager().aci_decompose_dn_guess(
+        dn, mo_type)
+    return mo, tuple(mos_and_rns)
+
+
+def decompose_dn_guess(dn, mo_type):
+    """Cached version of DNManager.aci_decompose_dn_guess."""
+    mo, mos_and_rns = _decompose_dn_guess(dn, mo_type)
+    return mo, list(mos_and_rns)
+
+
 def decompose_dn(mo_type, dn):
     try:
-        return apic_client.DNManager().aci_decompose_dn_guess(dn, mo_type)[1]
+        return decompose_dn_guess(dn, mo_type)[1]
     except (apic_client.DNManager.InvalidNameFormat, KeyError,
             apic_client.cexc.ApicManagedObjectNotSupported, IndexError):
         log_ = LOG.warning
@@ -268,6 +380,51 @@ def spawn_thread(target, *args, **kwargs):
     return thd
 
 
+class WorkerPool(object):
+    """Fixed size pool of daemon threads consuming a task queue."""
+
+    def __init__(self, size, name='worker'):
+        self.size = size
+        self.name = name
+        self._tasks = queue.Queue()
+        self._threads = [spawn_thread(self._work) for _ in range(size)]
+
+    def _work(self):
+        while True:
+            func, item, done = self._tasks.get()
+            result = None
+            try:
+                result = func(item)
+            except Exception as e:
+                LOG.error("Unexpected error in %s pool while processing "
+                          "%s: %s" % (self.name, item, e))
+                LOG.debug(traceback.format_exc())
+            finally:
+                done(result)
+
+    def map(self, func, items):
+        """Call func on every item and wait for all of them to complete.
+
+        :return: list of results in the same order of items, None is
+        returned for calls that raised an exception.
+        """
+        items = list(items)
+        results = [None] * len(items)
+        completed = threading.Semaphore(0)
+
+        def done_callback(index):
+            def done(result):
+                results[index] = result
+                completed.release()
+            return done
+
+        for index, item in enumerate(items):
+            self._tasks.put((func, item, done_callback(index)))
+        for _ in items:
+            completed.acquire()
+        return results
+
+
 # Key/Values will be garbage collected once al references are lost
 all_locks = weakref.WeakValueDictionary()
 _master_lock = threading.Lock()
@@ -334,6 +491,29 @@ def json_dumps(dict):
     return json.dumps(dict)
 
 
+def ensure_dir(path):
+    if path and not os.path.exists(path):
+        os.makedirs(path)
+
+
+def dump_json_file(path, data):
+    """Replace the file with the JSON dump of data, atomically.
+
+    Missing directories are created. IOError and OSError are raised to the
+    caller.
+    """
+    ensure_dir(os.path.dirname(path))
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.rename(tmp_path, path)
+
+
+def load_json_file(path):
+    with open(path) as f:
+        return json.load(f)
+
+
 def schedule_next_event(interval, deviation):
     return get_time() + interval + random.randrange(-interval * deviation,
                                                     interval * deviation)
@@ -46,6 +46,17 @@ agent_opts = [
                        "an event is received before starting the "
                        "reconciliation. This will squash similar events "
                        "together")),
+    cfg.FloatOpt('agent_event_squash_max_time', default=2,
+                 help=("Upper bound in seconds to the time AID keeps "
+                       "squashing events when they keep coming in bursts. "
+                       "Each new event extends the squash window by "
+                       "agent_event_squash_time, up to this value after the "
+                       "first event was received.")),
+    cfg.FloatOpt('agent_full_sweep_interval', default=600,
+                 help=("Seconds after which AID observes and reconciles all "
+                       "the served roots, even if no event marked them as "
+                       "changed. Set to 0 to always reconcile all the served "
+                       "roots.")),
     cfg.IntOpt('agent_report_interval', default=60,
                help=("Number of seconds after which an agent reports his "
                      "state")),
@@ -65,6 +76,40 @@ agent_opts = [
                     "ownership in ACI"),
     cfg.FloatOpt('aci_tenant_polling_yield', default=0.2,
                  help="how long the ACITenant yield to other processed"),
+    cfg.IntOpt('aci_push_batch_size', default=1,
+               help="Maximum number of AIM objects created in APIC with a "
+                    "single transaction. Batched transactions are posted "
+                    "from the root of the tenant, including the containers "
+                    "of the objects. When 1, every object is pushed in its "
+                    "own transaction"),
+    cfg.IntOpt('apic_session_pool_size', default=0,
+               help="Number of APIC sessions used to run DELETE requests "
+                    "concurrently, which is also the maximum number of "
+                    "concurrent requests to APIC. When 0, deletes are run "
+                    "sequentially by the tenant managers"),
+    cfg.IntOpt('aci_tenant_delete_concurrency', default=4,
+               help="Maximum number of concurrent DELETE requests of a "
+                    "single tenant when apic_session_pool_size is set"),
+    cfg.StrOpt('aci_tree_cache_dir', default='',
+               help="Directory where the ACI tenant managers save their "
+                    "trees during quiet periods. On start, they are loaded "
+                    "to serve the tenant until the APIC subscription "
+                    "validates them. Empty to disable the cache"),
+    cfg.BoolOpt('aci_tenant_reset_verify', default=False,
+                help="On scheduled resets, compare the number of objects of "
+                     "every subscribed class with APIC and only retrieve "
+                     "again the classes that diverge, instead of reloading "
+                     "the whole tenant. Since counts don't detect modified "
+                     "objects, every few verifications a full reset is "
+                     "still run"),
+    cfg.IntOpt('aci_tenant_max_concurrent_resets', default=0,
+               help="Maximum number of ACI tenants running a scheduled full "
+                    "reset at the same time, the others postpone it. 0 "
+                    "means unlimited"),
+    cfg.IntOpt('aci_tenant_workers', default=0,
+               help="Number of worker threads processing the events and "
+                    "push backlogs of all the ACI tenants. When 0, every "
+                    "tenant is served by its own thread"),
     cfg.IntOpt('max_operation_retry', default=5,
                help="How many creations/deletions are attempted by AID before "
                     "declaring failure on a specific object"),
@@ -110,6 +155,54 @@ agent_opts = [
                 help=("(Temporary) Set to False if you want the agents to "
                       "use SecurityGroupRule state from the action log "
                       "rather than fetching it from the DB.")),
+    cfg.BoolOpt('sql_instrumentation', default=False,
+                help=("(Restart Required) Set to True to account SQL "
+                      "statements, rows and time per AimManager method and "
+                      "per reconciliation cycle. Only used with the SQL "
+                      "store.")),
+    cfg.FloatOpt('sql_slow_query_threshold', default=1.0,
+                 help=("Seconds after which an SQL statement is logged as "
+                       "slow when sql_instrumentation is enabled. Set to 0 "
+                       "to disable slow query logging.")),
+    cfg.StrOpt('sql_stats_dir', default='/run/aid/sql_stats',
+               help=("Directory where services periodically dump their SQL "
+                     "statistics when sql_instrumentation is enabled. They "
+                     "can be inspected with 'aimdebug sql-stats'.")),
+    cfg.StrOpt('cycle_stats_dir', default='',
+               help=("(Restart Required) Directory where AID periodically "
+                     "dumps the per phase, universe and tenant statistics of "
+                     "its last reconciliation cycles, as well as the "
+                     "profiles of slow cycles. They can be inspected with "
+                     "'aimdebug aid-cycle-stats'. Empty to disable the "
+                     "dump.")),
+    cfg.FloatOpt('cycle_profile_threshold', default=0,
+                 help=("(Restart Required) Seconds after which an AID "
+                       "reconciliation cycle is considered slow. The cycle "
+                       "following a slow one is run under cProfile and its "
+                       "profile saved in cycle_stats_dir. Set to 0 to "
+                       "disable profiling.")),
+    cfg.IntOpt('reconcile_workers', default=1,
+               help=("(Restart Required) Number of threads used by each "
+                     "universe to reconcile tenants concurrently. Every "
+                     "worker uses its own DB session. With 1, tenants are "
+                     "reconciled sequentially by the main AID thread.")),
+    cfg.FloatOpt('aim_observer_interval', default=0,
+                 help=("(Restart Required) When set, AID consumes the action "
+                       "log and loads the AIM hash trees in a background "
+                       "thread every this number of seconds, so that "
+                       "reconciliation cycles only process what changed "
+                       "since. Set to 0 to observe AIM only at the beginning "
+                       "of each cycle. Not used with the K8S store.")),
+    cfg.IntOpt('aim_push_chunk_size', default=100,
+               help=("(Restart Required) Number of objects the AIM "
+                     "operational and monitored universes write in a single "
+                     "transaction when pushing ACI changes. If a chunk "
+                     "fails, its objects are retried one by one.")),
+    cfg.IntOpt('reconcile_tenant_max_keys', default=0,
+               help=("Maximum number of differences each universe pushes "
+                     "for a single tenant in a reconciliation cycle. Bigger "
+                     "tenants are synchronized over multiple cycles without "
+                     "delaying the others. Set to 0 for no limit.")),
 ]
 
 # TODO(ivar): move into AIM section
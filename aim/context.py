@@ -16,14 +16,65 @@
 from aim import aim_store
 
 
+class IdentityMapCache(object):
+    """Transaction scoped cache of store objects.
+
+    Objects are keyed by resource class and identity. The cache is only
+    used while the store is in a transaction, and it's cleared by the store
+    when the outermost transaction ends.
+    """
+
+    def __init__(self):
+        self._objects = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, klass, identity):
+        # Returns a (found, object) tuple
+        try:
+            result = self._objects[(klass, tuple(identity))]
+            self.hits += 1
+            return True, result
+        except KeyError:
+            self.misses += 1
+            return False, None
+
+    def set(self, klass, identity, obj):
+        self._objects[(klass, tuple(identity))] = obj
+
+    def invalidate(self, klass, identity=None):
+        if identity is not None:
+            self._objects.pop((klass, tuple(identity)), None)
+        else:
+            for key in [x for x in self._objects if x[0] == klass]:
+                del self._objects[key]
+
+    def clear(self):
+        self._objects = {}
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else 0.0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hit_rate, 'size': len(self._objects)}
+
+
 class AimContext(object):
     """Holds contextual information needed for AimManager calls."""
 
-    def __init__(self, db_session=None, store=None):
+    def __init__(self, db_session=None, store=None, cache=False):
         if db_session:
             self.store = aim_store.SqlAlchemyStore(db_session)
         else:
             self.store = store
+        # Opt-in per transaction cache of objects retrieved by identity
+        self.cache = None
+        if cache and self.store:
+            self.cache = IdentityMapCache()
+            self.store.register_transaction_cache(self.cache)
 
     # For backwards compatibility
     @property
@@ -110,8 +110,8 @@ class HashTreeDbListener(object):
                         if type not in ROOTLESS_TYPES:
                             filters[klass.root_ref_attribute()] = name
                     # Get all objects of that type
-                    for obj in self.aim_manager.find(aim_ctx, klass,
-                                                     **filters):
+                    for obj in self.aim_manager.iter_find(aim_ctx, klass,
+                                                          **filters):
                         # Need all the faults and statuses as well
                         stat = self.aim_manager.get_status(
                             aim_ctx, obj, create_if_absent=False)
@@ -138,16 +138,36 @@ class HashTreeDbListener(object):
             if roots is not None:
                 filters['in_'] = {'resource_root': roots}
             to_delete = []
-            for stat in self.aim_manager.find(aim_ctx, klass, **filters):
-                parent = self.aim_manager.get_by_id(
-                    aim_ctx, stat.parent_class, stat.resource_id)
-                if not parent or parent.root != stat.resource_root:
-                    to_delete.append(stat.id)
+            by_parent_class = {}
+            for stat in self.aim_manager.find(aim_ctx, klass,
+                                              attributes=['id'], **filters):
+                by_parent_class.setdefault(stat.parent_class, []).append(stat)
+            for parent_klass, stats in by_parent_class.iteritems():
+                if parent_klass not in self.aim_manager.aim_resources:
+                    # The parent type can't be resolved, these statuses
+                    # will never have a parent
+                    LOG.warning("Deleting status objects of unknown "
+                                "resource types %s" %
+                                [(x.resource_type, x.id) for x in stats])
+                    to_delete.extend(x.id for x in stats)
+                    continue
+                parents = {}
+                for chunk in utils.chunks(stats):
+                    parents.update(
+                        (x._aim_id, x) for x in
+                        self.aim_manager.find_identities(
+                            aim_ctx, parent_klass, include_aim_id=True,
+                            in_={'aim_id': [y.resource_id for y in chunk]}))
+                for stat in stats:
+                    parent = parents.get(stat.resource_id)
+                    if not parent or parent.root != stat.resource_root:
+                        to_delete.append(stat.id)
             if to_delete:
                 LOG.info("Deleting parentless status objects "
                          "%s" % to_delete)
-                self.aim_manager.delete_all(
-                    aim_ctx, klass, in_={'id': to_delete})
+                for chunk in utils.chunks(to_delete):
+                    self.aim_manager.delete_all(
+                        aim_ctx, klass, in_={'id': chunk})
 
     def reset(self, store, root=None):
         aim_ctx = utils.FakeContext(store=store)
@@ -169,6 +189,7 @@ class HashTreeDbListener(object):
         return cache[klass]
 
     def catch_up_with_action_log(self, store, served_tenants=None):
+        """Push the action log to the trees, return the updated roots."""
         ctx = utils.FakeContext(store=store)
         with ctx.store.begin(subtransactions=True):
             served_tenants = served_tenants or set()
@@ -187,6 +208,7 @@ class HashTreeDbListener(object):
             # to concurrency issues. Remove when no longer needed.
             if aim_cfg.CONF.aim.validate_config_trees:
                 self._validate_config_trees(ctx, log_by_root.keys())
+            return set(log_by_root.keys())
 
     def _preprocess_logs(self, ctx, logs):
         resetting_roots = set()
@@ -0,0 +1,219 @@
+# Copyright (c) 2017 Cisco Systems
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""SQL statement accounting.
+
+When enabled, every statement executed by SQLAlchemy engines is accounted
+(number of statements, rows and wall time) to the outermost AimManager
+method in the calling stack. Statistics are kept since the instrumentation
+was enabled, and per reconciliation cycle. When disabled, no engine event
+listener is installed at all.
+"""
+
+import os
+import sys
+import threading
+import time
+
+from oslo_log import log as logging
+from sqlalchemy import engine as sa_engine
+from sqlalchemy import event as sa_event
+
+from aim.common import utils
+
+
+LOG = logging.getLogger(__name__)
+UNATTRIBUTED = '<no AimManager caller>'
+DUMP_INTERVAL = 10
+STATEMENT_LOG_MAX_LEN = 1024
+SORT_KEYS = {'statements': 0, 'rows': 1, 'time': 2}
+_AIM_MANAGER_MODULE = os.path.join('aim', 'aim_manager')
+
+
+class SqlStats(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            # caller -> [statements, rows, time]
+            self.totals = {}
+            self.cycle = {}
+            self.since = time.time()
+
+    def record(self, caller, rows, elapsed):
+        with self._lock:
+            for stats in (self.totals, self.cycle):
+                entry = stats.setdefault(caller, [0, 0, 0.0])
+                entry[0] += 1
+                entry[1] += rows
+                entry[2] += elapsed
+
+    def start_cycle(self):
+        with self._lock:
+            self.cycle = {}
+
+    def end_cycle(self):
+        with self._lock:
+            cycle, self.cycle = self.cycle, {}
+        return cycle
+
+    def to_dict(self):
+        with self._lock:
+            return {'since': self.since,
+                    'callers': {k: list(v) for k, v in
+                                self.totals.iteritems()}}
+
+
+def summarize(stats):
+    """Total statements, rows and time of a caller -> stats dictionary."""
+    result = [0, 0, 0.0]
+    for entry in stats.values():
+        for i, value in enumerate(entry):
+            result[i] += value
+    return result
+
+
+def top(stats, count=None, sort_by='time'):
+    """Return (caller, statements, rows, time) tuples of the top callers."""
+    key = SORT_KEYS[sort_by]
+    result = sorted(stats.iteritems(), key=lambda x: x[1][key], reverse=True)
+    return [(k,) + tuple(v) for k, v in result[:count]]
+
+
+_stats = SqlStats()
+_config = {'enabled': False, 'slow_query_threshold': 0, 'dump_file': None,
+           'last_dump': 0}
+
+
+def enable(slow_query_threshold=0, dump_file=None):
+    """Start accounting SQL statements for this process.
+
+    :param slow_query_threshold: statements slower than this number of
+    seconds are logged, 0 disables slow query logging.
+    :param dump_file: if set, cumulative statistics are periodically
+    written to this file, so that they can be inspected from the CLI.
+    """
+    _config['slow_query_threshold'] = slow_query_threshold or 0
+    _config['dump_file'] = dump_file
+    if not _config['enabled']:
+        sa_event.listen(sa_engine.Engine, 'before_cursor_execute',
+                        _before_cursor_execute)
+        sa_event.listen(sa_engine.Engine, 'after_cursor_execute',
+                        _after_cursor_execute)
+        _config['enabled'] = True
+        _stats.reset()
+        LOG.info("SQL statement accounting enabled, slow query threshold: "
+                 "%s", slow_query_threshold)
+
+
+def disable():
+    if _config['enabled']:
+        sa_event.remove(sa_engine.Engine, 'before_cursor_execute',
+                        _before_cursor_execute)
+        sa_event.remove(sa_engine.Engine, 'after_cursor_execute',
+                        _after_cursor_execute)
+        _config['enabled'] = False
+
+
+def enable_from_config(conf, service):
+    if conf.aim.aim_store != 'sql' or not conf.aim.sql_instrumentation:
+        return
+    dump_file = None
+    if conf.aim.sql_stats_dir:
+        dump_file = os.path.join(conf.aim.sql_stats_dir, '%s.json' % service)
+    enable(slow_query_threshold=conf.aim.sql_slow_query_threshold,
+           dump_file=dump_file)
+
+
+def is_enabled():
+    return _config['enabled']
+
+
+def get_stats():
+    return _stats
+
+
+def start_cycle():
+    if _config['enabled']:
+        _stats.start_cycle()
+
+
+def end_cycle(log=None, name='cycle'):
+    """Return the statistics of the cycle, and log a summary of them."""
+    if not _config['enabled']:
+        return {}
+    cycle = _stats.end_cycle()
+    if log:
+        statements, rows, elapsed = summarize(cycle)
+        log.info("SQL statements for this %s: %s, rows: %s, time: %.3fs. "
+                 "Top callers: %s", name, statements, rows, elapsed,
+                 ', '.join('%s (%s, %s, %.3fs)' % x
+                           for x in top(cycle, count=5)))
+    dump()
+    return cycle
+
+
+def dump(force=True):
+    path = _config['dump_file']
+    if not path:
+        return
+    now = time.time()
+    if not force and now - _config['last_dump'] < DUMP_INTERVAL:
+        return
+    _config['last_dump'] = now
+    try:
+        utils.dump_json_file(path, _stats.to_dict())
+    except (IOError, OSError) as e:
+        LOG.warning("Failed to dump SQL statistics to %s: %s", path, e)
+
+
+def load(path):
+    return utils.load_json_file(path)
+
+
+def _find_caller():
+    # Outermost AimManager method in the calling stack
+    caller = UNATTRIBUTED
+    frame = sys._getframe(2)
+    while frame is not None:
+        code = frame.f_code
+        if os.path.splitext(code.co_filename)[0].endswith(
+                _AIM_MANAGER_MODULE):
+            caller = 'AimManager.%s' % code.co_name
+        frame = frame.f_back
+    return caller
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info.setdefault('aim_query_start', []).append(time.time())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    try:
+        elapsed = time.time() - conn.info['aim_query_start'].pop()
+    except (KeyError, IndexError):
+        return
+    caller = _find_caller()
+    _stats.record(caller, max(cursor.rowcount or 0, 0), elapsed)
+    threshold = _config['slow_query_threshold']
+    if threshold and elapsed >= threshold:
+        LOG.warning("Slow SQL statement (%.3fs) from %s: %s", elapsed,
+                    caller, statement[:STATEMENT_LOG_MAX_LEN])
+    dump(force=False)
@@ -443,7 +443,8 @@ class AciContainersV1(object):
 
     query_params = ['pretty', 'field_selector', 'label_selector',
                     'resource_version', 'timeout_seconds', 'watch',
-                    'grace_period_seconds', 'orphan_dependents']
+                    'grace_period_seconds', 'orphan_dependents', 'limit',
+                    'continue']
     verb_accept_headers = {
         'GET': ['application/json', 'application/yaml',
                 'application/vnd.kubernetes.protobuf',
@@ -28,6 +28,7 @@ from aim.common import utils
 from aim import config as aim_cfg
 from aim import context
 from aim.db import api
+from aim.db import sql_stats
 
 LOG = logging.getLogger(__name__)
 STATIC_QUERY_PARAMS = {
@@ -78,21 +79,22 @@ class AIMController(object):
         # Get status and faults only if explicitly requested
         klasses.discard(api_status.AciStatus)
         klasses.discard(api_status.AciFault)
-        all_resources = []
+        # Resources are read in pages, but the response is still built in
+        # memory since json_out serializes it as a whole
         data = []
         for klass in klasses:
-            all_resources.extend(self.mgr.find(
-                self.ctx, klass, include_aim_id=True, **filters))
-        for obj in all_resources:
-            if get_status:
-                status = self.mgr.get_status(self.ctx, obj,
-                                             create_if_absent=False)
-                if status:
-                    faults = status.faults
-                    del status.faults
-                    data.append(self._generate_data_item(status))
-                    data.extend([self._generate_data_item(f) for f in faults])
-            data.append(self._generate_data_item(obj))
+            for obj in self.mgr.iter_find(self.ctx, klass,
+                                          include_aim_id=True, **filters):
+                if get_status:
+                    status = self.mgr.get_status(self.ctx, obj,
+                                                 create_if_absent=False)
+                    if status:
+                        faults = status.faults
+                        del status.faults
+                        data.append(self._generate_data_item(status))
+                        data.extend([self._generate_data_item(f)
+                                     for f in faults])
+                data.append(self._generate_data_item(obj))
         return self._generate_response(data)
 
     def POST(self, path_, *args, **kwargs):
@@ -194,6 +196,7 @@ def shutdown():
 def main():
     aim_cfg.init(sys.argv[1:])
     aim_cfg.setup_logging()
+    sql_stats.enable_from_config(aim_cfg.CONF, 'http-server')
     signal.signal(signal.SIGTERM, shutdown)
     try:
         run(aim_cfg.CONF, False)
@@ -15,6 +15,9 @@
 
 import collections
 import copy
+import os
+import shutil
+import tempfile
 import time
 
 from apicapi import apic_client
@@ -24,8 +27,10 @@ import mock
 from aim.agent.aid.universes.aci import aci_universe
 from aim.agent.aid.universes.aci import converter
 from aim.agent.aid.universes.aci import tenant as aci_tenant
+from aim.agent.aid.universes import constants as lcon
 from aim.api import resource as a_res
 from aim.common.hashtree import structured_tree
+from aim.common import utils
 from aim import config as aim_cfg
 from aim.tests import base
 from aim import tree_manager
@@ -456,6 +461,95 @@ class TestAciTenant(base.TestAimDBBase, TestAciClientMixin):
         self.manager._event_loop()
         self.manager.tenant_name = old_name
 
+    def test_event_dispatcher(self):
+        ws_context = self.manager.ws_context
+        subscriber = ws_context.session.subscription_thread
+        # The dispatcher is driven by the test
+        with mock.patch.object(utils, 'spawn_thread'):
+            self.manager._subscribe_tenant()
+        ready = self.manager._events_ready
+        self.assertTrue(ws_context.dispatcher_thread is not None)
+        subscriber._subscriptions[self.manager.tenant.urls[0]] = '1'
+        subscriber._subscriptions['/api/other.json'] = '2'
+        # New sessions wake up all the tenants
+        ready.clear()
+        ws_context._watch_event_queue()
+        self.assertTrue(ready.is_set())
+        ready.clear()
+        ws_context._dispatch_events(block=False)
+        self.assertFalse(ready.is_set())
+        # Events of other subscriptions are ignored
+        subscriber._event_q.put(json.dumps(
+            {'subscriptionId': ['2'], 'imdata': []}))
+        ws_context._dispatch_events(block=False)
+        self.assertFalse(ready.is_set())
+        # Events wake the owning tenant up
+        self._set_events(self._init_event())
+        subscriber._event_q.put(json.dumps(
+            {'subscriptionId': ['1'], 'imdata': []}))
+        ws_context._dispatch_events(block=False)
+        self.assertTrue(ready.is_set())
+        self.manager._wait_for_events()
+        self.assertFalse(ready.is_set())
+        # Resources to push wake the tenant up as well
+        self.manager.push_aim_resources(
+            {'create': [a_res.BridgeDomain(tenant_name='tenant-1',
+                                           name='bd')]})
+        self.assertTrue(ready.is_set())
+        # Unregistered tenants are not woken up anymore
+        ws_context.unregister_listener(self.manager.tenant.urls)
+        ready.clear()
+        subscriber._event_q.put(json.dumps(
+            {'subscriptionId': ['1'], 'imdata': []}))
+        ws_context._dispatch_events(block=False)
+        self.assertFalse(ready.is_set())
+
+    def test_worker_pool(self):
+        # No worker threads, steps are driven by the test
+        pool = aci_tenant.AciTenantWorkerPool(0)
+        manager = aci_tenant.AciTenantManager(
+            'tn-1', self.cfg_manager,
+            aci_universe.AciUniverse.establish_aci_session(self.cfg_manager),
+            aci_universe.get_websocket_context(self.cfg_manager), pool=pool)
+        manager._get_full_state = mock.Mock(return_value=[{}])
+        manager.start()
+        self.assertIsNone(manager._thread)
+        # Scheduling a queued manager twice doesn't duplicate it
+        manager.schedule()
+        self.assertEqual([manager], list(pool._ready))
+        self.assertIs(manager, pool._next())
+        manager.run_step()
+        pool._done(manager)
+        self.assertTrue(manager.is_warm())
+        self.assertFalse(manager.is_dead())
+        # Not ready until the idle timer expires
+        self.assertEqual(0, len(pool._ready))
+        self.assertEqual(1, len(pool._timers))
+        # Pushing resources makes the tenant ready again, after its yield
+        manager._rest_until = 0
+        manager.push_aim_resources(
+            {'create': [a_res.BridgeDomain(tenant_name='tenant-1',
+                                           name='bd')]})
+        self.assertEqual([manager], list(pool._ready))
+        self.assertIs(manager, pool._next())
+        # Managers woken up while running run once more afterwards
+        manager.schedule()
+        self.assertEqual(0, len(pool._ready))
+        manager.run_step()
+        pool._done(manager)
+        self.assertEqual([manager], list(pool._ready))
+        self.assertTrue(manager.object_backlog.empty())
+        # Failures back off and eventually destroy the manager
+        manager.ws_context.has_event = mock.Mock(side_effect=KeyError)
+        manager.max_retries = 2
+        manager._unsubscribe_tenant = mock.Mock()
+        for _ in range(2):
+            manager._subscribed = True
+            manager.run_step()
+        self.assertTrue(manager.is_dead())
+        manager.run_step()
+        self.assertEqual(2, manager.ws_context.has_event.call_count)
+
     def test_login_failed(self):
         # Mock response and login
         with mock.patch('acitoolkit.acitoolkit.Session.login',
@@ -473,6 +567,85 @@ class TestAciTenant(base.TestAimDBBase, TestAciClientMixin):
                                   'https://2.2.2.2'],
                                  list(self.manager.ws_context.ws_urls))
 
+    def test_event_loop_tree_lock(self):
+        old_name = self.manager.tenant_name
+        self.addCleanup(setattr, self.manager, 'tenant_name', old_name)
+        self.manager.tenant_name = 'tn-test-tenant'
+        lock_name = lcon.ACI_TREE_LOCK_NAME_PREFIX + 'tn-test-tenant'
+        held = []
+
+        def try_lock():
+            try:
+                with utils.get_rlock(lock_name, blocking=False):
+                    held.append(False)
+            except utils.LockNotAcquired:
+                held.append(True)
+        fill_events = self.manager._fill_events
+
+        def check_lock(events):
+            # Check from another thread whether the tree lock is taken
+            utils.spawn_thread(try_lock).join()
+            return fill_events(events)
+        self.manager._fill_events = check_lock
+        self.manager._subscribe_tenant()
+        # A full resync holds the lock until the trees are rebuilt
+        self._set_events(self._init_event())
+        self.manager._event_loop()
+        self.assertEqual([True], held)
+        self.assertIsNotNone(self.manager.get_state_copy().root)
+        # Other events only take the lock to update the trees
+        self._set_events([{'fvBD': {'attributes': {
+            'dn': 'uni/tn-test-tenant/BD-test3', 'name': 'test3',
+            'status': 'created'}}}])
+        self.manager._event_loop()
+        self.assertEqual([True, False], held)
+
+    def test_tree_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.manager.tree_cache_dir = cache_dir
+        self.manager._state.add(('fvTenant|tenant-1', 'fvBD|bd1'), name='bd1')
+        self.manager._monitored_state.add(
+            ('fvTenant|tenant-1', 'fvBD|bd2'), name='bd2')
+        self.manager.tag_set = set(['uni/tn-tenant-1/BD-bd1'])
+        # Trees are saved after a loop without events
+        self.manager._cache_dirty = True
+        self.manager.ws_context.has_event = mock.Mock(return_value=False)
+        self.manager.polling_yield = 0
+        self.manager._event_loop()
+        path = os.path.join(cache_dir, 'tn-tenant-1.json')
+        self.assertTrue(os.path.exists(path))
+        self.assertFalse(self.manager._cache_dirty)
+
+        manager = aci_tenant.AciTenantManager(
+            'tn-tenant-1', self.cfg_manager,
+            aci_universe.AciUniverse.establish_aci_session(self.cfg_manager),
+            aci_universe.get_websocket_context(self.cfg_manager))
+        manager.tree_cache_dir = cache_dir
+        with mock.patch('aim.common.utils.AIMThread.start'):
+            manager.start()
+        # Only the configuration is served from the cache before subscribing
+        self.assertTrue(manager.is_config_warm())
+        self.assertFalse(manager.is_warm())
+        self.assertEqual(self.manager._state, manager._state)
+        self.assertEqual(structured_tree.StructuredHashTree(),
+                         manager._monitored_state)
+        self.assertEqual(self.manager.tag_set, manager.tag_set)
+        self.assertEqual(self.manager.get_state_copy(),
+                         manager.get_state_copy())
+        # Cached configuration isn't served once unsubscribed
+        with mock.patch.object(manager.ws_context, 'unsubscribe'):
+            manager._unsubscribe_tenant()
+        self.assertFalse(manager.is_config_warm())
+
+        # Stale caches are not loaded
+        with mock.patch('time.time',
+                        return_value=(time.time() +
+                                      aci_tenant.RESET_INTERVAL + 1)):
+            self.assertFalse(manager.load_tree_cache())
+        os.remove(path)
+        self.assertFalse(manager.load_tree_cache())
+
     def test_is_dead(self):
         self.assertFalse(self.manager.is_dead())
 
@@ -509,6 +682,99 @@ class TestAciTenant(base.TestAimDBBase, TestAciClientMixin):
         manager._main_loop()
         self.assertEqual(1, manager._unsubscribe_tenant.call_count)
 
+    def test_tenant_reset_verify(self):
+        self.manager.reset_verify = True
+        self.manager.tenant.filtered_children = ['fvTenant', 'fvBD']
+        tn = 'uni/tn-tenant-1'
+        self.manager._track_objects([
+            {'fvTenant': {'attributes': {'dn': tn}}},
+            {'fvBD': {'attributes': {'dn': tn + '/BD-a'}}},
+            {'fvBD': {'attributes': {'dn': tn + '/BD-b'}}},
+            {'fvSubnet': {'attributes': {'dn': tn + '/BD-a/subnet-1'}}},
+            {'fvBD': {'attributes': {'dn': tn + '/BD-b',
+                                     'status': 'deleted'}}}])
+        self.assertEqual({'fvTenant': set([tn]), 'fvBD': set([tn + '/BD-a'])},
+                         self.manager._known_dns)
+        apic = {'fvTenant': [tn], 'fvBD': [tn + '/BD-a']}
+
+        def get(url):
+            classes = url.split('target-subtree-class=')[1].split('&')[0]
+            dns = [(x, dn) for x in classes.split(',') for dn in apic[x]]
+            if 'rsp-subtree-include=count' in url:
+                return [{'moCount': {'attributes': {
+                    'count': str(len(dns))}}}]
+            return [{x: {'attributes': {'dn': dn}}} for x, dn in dns]
+        self.manager.aci_session.GET = mock.Mock(side_effect=get)
+        self.manager._process_events = mock.Mock()
+        # In sync, nothing is retrieved
+        self.manager.scheduled_reset = 0
+        self.manager._check_scheduled_reset()
+        self.assertEqual(1, self.manager.aci_session.GET.call_count)
+        self.assertFalse(self.manager._process_events.called)
+        self.assertTrue(self.manager.scheduled_reset > time.time())
+        # Only the diverged class is retrieved again
+        apic['fvBD'] = [tn + '/BD-a', tn + '/BD-c']
+        self.manager.aci_session.GET.reset_mock()
+        self.manager._check_scheduled_reset()
+        self.assertEqual(4, self.manager.aci_session.GET.call_count)
+        self.assertTrue(self.manager.aci_session.GET.call_args[0][0].endswith(
+            'target-subtree-class=fvBD'))
+        apic['fvBD'] = []
+        self.manager._check_scheduled_reset()
+        self.manager._process_events.assert_called_with(
+            [{'fvBD': {'attributes': {'dn': tn + '/BD-a',
+                                      'status': 'deleted'}}}])
+        self.assertEqual(3, self.manager._verifications)
+        # Full reset after too many verifications, counts can't detect
+        # modified objects
+        self.manager._verifications = aci_tenant.MAX_RESET_VERIFICATIONS
+        self.manager.aci_session.GET.reset_mock()
+        self.assertRaises(aci_tenant.ScheduledReset,
+                          self.manager._check_scheduled_reset)
+        self.assertFalse(self.manager.aci_session.GET.called)
+        self.assertEqual(0, self.manager._verifications)
+        # Full reset when the verification fails
+        self.manager.aci_session.GET.side_effect = Exception('fail')
+        self.assertRaises(aci_tenant.ScheduledReset,
+                          self.manager._check_scheduled_reset)
+
+    def test_tenant_reset_limiter(self):
+        limiter = aci_tenant.FullResetLimiter(1)
+        self.manager.reset_limiter = limiter
+        self.assertTrue(limiter.acquire())
+        # Postponed while another tenant is resetting
+        self.manager.scheduled_reset = 0
+        self.manager._check_scheduled_reset()
+        self.assertTrue(self.manager.scheduled_reset > time.time())
+        self.assertFalse(self.manager._reset_slot)
+        limiter.release()
+        self.assertRaises(aci_tenant.ScheduledReset,
+                          self.manager._check_scheduled_reset)
+        self.assertTrue(self.manager._reset_slot)
+        self.assertFalse(limiter.acquire())
+        # The slot is released once the tenant is subscribed again
+        self.manager._event_loop = mock.Mock()
+        self.manager._subscribe_tenant()
+        self.assertFalse(self.manager._reset_slot)
+        self.assertTrue(limiter.acquire())
+        # Releasing twice doesn't over-release the limiter
+        self.manager._release_reset_slot()
+        self.assertFalse(limiter.acquire())
+
+    def test_tenant_reset_slot_unsubscribe_failure(self):
+        limiter = aci_tenant.FullResetLimiter(1)
+        self.manager.reset_limiter = limiter
+        self.manager.reset_verify = False
+        self.manager.scheduled_reset = 0
+        self.manager.num_loop_runs = 1
+        self.manager._subscribe_tenant = mock.Mock()
+        self.manager._unsubscribe_tenant = mock.Mock(
+            side_effect=Exception('fail'))
+        self.assertRaises(Exception, self.manager._main_loop)
+        # The slot isn't held by the failed reset
+        self.assertFalse(self.manager._reset_slot)
+        self.assertTrue(limiter.acquire())
+
     def test_push_aim_resources(self):
         # Create some AIM resources
         bd1 = self._get_example_aim_bd()
@@ -586,6 +852,92 @@ class TestAciTenant(base.TestAimDBBase, TestAciClientMixin):
         self.manager.push_aim_resources({'delete': [bda1, bda2]})
         self.manager._push_aim_resources()
 
+    def test_push_aim_resources_batched(self):
+        self.manager.push_batch_size = 2
+        self.manager.creation_succeeded = mock.Mock()
+        self.manager.creation_failed = mock.Mock()
+        bd1 = self._get_example_aim_bd()
+        bd2 = self._get_example_aim_bd(name='test2')
+        bd3 = self._get_example_aim_bd(name='test3')
+        self.manager.push_aim_resources({'create': [bd1, bd2, bd3]})
+        self.manager._push_aim_resources()
+        # Objects are posted from the tenant root, 2 per transaction
+        post = self.manager.aci_session.post_body_dict
+        self.assertEqual(2, post.call_count)
+        for call in post.call_args_list:
+            self.assertEqual(('test-tenant',), call[0][2:])
+        self.assertEqual(3, self.manager.creation_succeeded.call_count)
+        self.assertFalse(self.manager.creation_failed.called)
+
+        # Failing transactions are split until the failure is isolated
+        post.reset_mock()
+        self.manager.creation_succeeded.reset_mock()
+        self.manager.push_batch_size = 10
+
+        def fail_on_test2(mo, data, *params):
+            if 'BD-test2' in str(data):
+                raise apic_client.cexc.ApicResponseNotOk(
+                    request='my_request', status=400, reason='bad request',
+                    err_text='bad request text', err_code=400)
+        post.side_effect = fail_on_test2
+        self.manager.push_aim_resources({'create': [bd1, bd2, bd3]})
+        self.manager._push_aim_resources()
+        self.assertEqual(
+            sorted([bd1.name, bd3.name]),
+            sorted(x[0][0].name for x in
+                   self.manager.creation_succeeded.call_args_list))
+        self.assertEqual(1, self.manager.creation_failed.call_count)
+        self.assertEqual(
+            bd2.name, self.manager.creation_failed.call_args[0][0].name)
+        post.side_effect = None
+
+    def test_push_aim_resources_delete_pool(self):
+        sessions = []
+
+        def session_factory():
+            sessions.append(mock.Mock())
+            return sessions[-1]
+        self.manager.session_pool = aci_tenant.ApicSessionPool(
+            session_factory, 3)
+        self.manager.delete_concurrency = 2
+        bda1 = self._get_example_aci_bd()
+        bda2 = self._get_example_aci_bd(dn='uni/tn-test-tenant/BD-test2')
+        sg1 = {'hostprotPol': {'attributes': {
+            'dn': 'uni/tn-test-tenant/pol-sg'}}}
+        sg_rule1 = {'hostprotRule': {'attributes': {
+            'dn': 'uni/tn-test-tenant/pol-sg/subj-default/rule-r1'}}}
+        self.manager.push_aim_resources({'delete': [
+            bda1, bda2, sg_rule1, sg1]})
+        self.manager._push_aim_resources()
+        # The tenant session is not used, children of deleted parents are
+        # still skipped
+        self.assertFalse(self.manager.aci_session.DELETE.called)
+        deleted = [call[0][0] for session in sessions for call in
+                   session.DELETE.call_args_list]
+        self.assertEqual(
+            sorted(['/mo/uni/tn-test-tenant/BD-test.json',
+                    '/mo/uni/tn-test-tenant/BD-test2.json',
+                    '/mo/uni/tn-test-tenant/pol-sg.json']), sorted(deleted))
+        # Per tenant concurrency is enforced
+        self.assertTrue(
+            len([x for x in sessions if x.DELETE.called]) <= 2)
+
+        # Failures are collected per object
+        for session in sessions:
+            session.DELETE.side_effect = (
+                apic_client.cexc.ApicResponseNotOk(
+                    request='my_request', status=400, reason='bad request',
+                    err_text='bad request text', err_code=400))
+        failures = self.manager.session_pool.delete(
+            [['uni/tn-test-tenant/BD-test'],
+             ['uni/tn-test-tenant/BD-test2']])
+        self.assertEqual(['uni/tn-test-tenant/BD-test',
+                          'uni/tn-test-tenant/BD-test2'],
+                         sorted(x[0] for x in failures))
+        # No exception is externally raised
+        self.manager.push_aim_resources({'delete': [bda1, bda2]})
+        self.manager._push_aim_resources()
+
     def test_fill_events_noop(self):
         # On unchanged data, fill events is a noop
         events = self._init_event()
@@ -662,6 +1014,40 @@ class TestAciTenant(base.TestAimDBBase, TestAciClientMixin):
             self.manager._fill_events(events))
         self.assertEqual(sorted([parent_bd, complete]), sorted(events))
 
+    def test_fill_events_batched(self):
+        events = []
+        complete = []
+        for name in ['bd1', 'bd2', 'bd3']:
+            dn = 'uni/tn-test-tenant/BD-%s' % name
+            events.append({"fvRsCtx": {"attributes": {
+                "dn": dn + "/rsctx", "tnFvCtxName": "test",
+                "status": "modified"}}})
+            complete.extend([
+                {'fvBD': {'attributes': {
+                    'arpFlood': 'no', 'dn': dn, 'epMoveDetectMode': '',
+                    'ipLearning': 'yes', 'limitIpLearnToSubnets': 'no',
+                    'nameAlias': '', 'unicastRoute': 'yes',
+                    'unkMacUcastAct': 'proxy'}}},
+                {"fvRsCtx": {"attributes": {
+                    "dn": dn + "/rsctx", "tnFvCtxName": "test"}}}])
+        # Both children of the same BD
+        events.append({"fvRsCtx": {"attributes": {
+            "dn": "uni/tn-test-tenant/BD-bd1/rsctx", "tnFvCtxName": "test",
+            "status": "modified"}}})
+        self._add_data_to_tree(complete, self.backend_state)
+        original = copy.deepcopy(events)
+        self.manager.get_resources = mock.Mock(
+            wraps=self.manager.get_resources)
+        result = self.manager._filter_ownership(
+            self.manager._fill_events(events))
+        self.assertEqual(sorted(complete), sorted(result))
+        # All the objects are retrieved at once, parents are synthesized
+        # once and the events are not modified
+        self.assertEqual(1, self.manager.get_resources.call_count)
+        self.assertEqual(
+            6, len(self.manager.get_resources.call_args[0][0]))
+        self.assertEqual(original, events)
+
     def test_fill_events_not_found(self):
         events = [
             {"fvRsCtx": {"attributes": {
@@ -921,6 +1307,25 @@ class TestAciTenant(base.TestAimDBBase, TestAciClientMixin):
             {'delete': aim_converter.convert([vrf])})
         self.assertEqual(2, len(self.manager.object_backlog.queue))
 
+    def test_squash_operations_index(self):
+        bds = [a_res.BridgeDomain(tenant_name='tn1', name='bd%s' % i)
+               for i in range(100)]
+        self.manager.push_aim_resources({'create': bds})
+        # Duplicates in the same request are squashed as well
+        bd = copy.deepcopy(bds[10])
+        bd.display_name = 'foo'
+        self.manager.push_aim_resources({'create': [bd, bds[20], bd]})
+        self.assertEqual(1, len(self.manager.object_backlog.queue))
+        queued = self.manager.object_backlog.queue[0]['create']
+        self.assertEqual(100, len(queued))
+        self.assertEqual('foo', queued[10].display_name)
+        # Once the backlog is pushed, new requests are queued again
+        self.manager._push_aim_resources()
+        self.assertEqual({}, self.manager._backlog_index)
+        self.manager.push_aim_resources({'create': [bd]})
+        self.assertEqual([{'create': [bd]}],
+                         list(self.manager.object_backlog.queue))
+
     def test_aci_types_not_convertible_if_monitored(self):
         self.assertEqual({'fvRsProv': ['l3extInstP'],
                           'fvRsCons': ['l3extInstP']},
@@ -17,6 +17,7 @@ import mock
 
 from aim.agent.aid.universes.aci import aci_universe
 from aim.agent.aid.universes.aci import tenant as aci_tenant
+from aim.agent.aid.universes import base_universe
 from aim.api import resource
 from aim.common.hashtree import structured_tree
 from aim.common import utils
@@ -228,8 +229,15 @@ class TestAciUniverseMixin(test_aci_tenant.TestAciClientMixin):
                 ('fvTenant|t1', 'vzBrCP|c', 'vzSubj|s', 'vzOutTerm|outtmnl',
                  'vzRsFiltAtt|h'),
                 ('fvTenant|t1', 'vzBrCP|c', 'vzSubj|s')]
-        result = self.universe.get_resources(keys)
+        find = structured_tree.StructuredHashTree.find
+        with mock.patch.object(structured_tree.StructuredHashTree, 'find',
+                               autospec=True, side_effect=find) as find_mock:
+            result = self.universe.get_resources(keys)
         self.assertEqual(sorted(objs), sorted(result))
+        # Every key is looked up only once, regardless of duplicates and
+        # related nodes expansion
+        looked_up = [x[0][1] for x in find_mock.call_args_list]
+        self.assertEqual(len(set(looked_up)), len(looked_up))
 
     # TODO(kentwu): need to enable this test case
     @base.requires(['skip'])
@@ -323,6 +331,79 @@ class TestAciUniverseMixin(test_aci_tenant.TestAciClientMixin):
             self.universe.ws_context._thread_monitor({'monitor_runs': 4})
             self.assertEqual(0, harakiri.call_count)
 
+    def test_sync_log_eviction(self):
+        self.universe.max_backoff_time = 0
+        bd = resource.BridgeDomain(tenant_name='t1', name='b')
+        self.universe._track_universe_actions(
+            {'create': [bd], 'delete': []}, 'tn-t1')
+        self.universe._track_universe_actions(
+            {'create': [], 'delete': []}, 'tn-t2')
+        # Entries are tracked by identity
+        self.assertEqual([('BridgeDomain', 't1', 'b')],
+                         self.universe._sync_log['tn-t1']['create'].keys())
+        stats = self.universe.sync_log_stats()
+        self.assertEqual(2, stats['roots'])
+        self.assertEqual(1, stats['entries'])
+        self.assertTrue(stats['time'] >= 0)
+        # Unserved roots are evicted
+        self.universe._evict_sync_log({'tn-t2': None})
+        self.assertEqual(['tn-t2'], self.universe._sync_log.keys())
+        self.assertEqual(0, self.universe.sync_log_stats()['entries'])
+
+    def test_sync_log_object_changed(self):
+        self.universe.max_backoff_time = 0
+        bd = resource.BridgeDomain(tenant_name='t1', name='b')
+        for _ in range(3):
+            self.universe._track_universe_actions(
+                {'create': [bd], 'delete': []}, 'tn-t1')
+        entry = self.universe._sync_log['tn-t1']['create'][
+            ('BridgeDomain', 't1', 'b')]
+        self.assertEqual(2, entry['retries'])
+        # A new version of the object doesn't inherit the retries
+        bd = resource.BridgeDomain(tenant_name='t1', name='b',
+                                   vrf_name='other')
+        self.universe._track_universe_actions(
+            {'create': [bd], 'delete': []}, 'tn-t1')
+        entry = self.universe._sync_log['tn-t1']['create'][
+            ('BridgeDomain', 't1', 'b')]
+        self.assertEqual(0, entry['retries'])
+        self.assertEqual(bd, entry['res'])
+
+    def test_key_budget(self):
+        self.universe.reconcile_max_keys = 8
+        differences = {'create': [('a',) * (x % 3 + 1) for x in range(10)],
+                       'delete': [('d', str(x)) for x in range(10)]}
+        deferred = self.universe._apply_key_budget('tn-t1', differences)
+        # Deletions get their share of the budget, parents go first
+        self.assertEqual(6, len(differences['create']))
+        self.assertEqual(2, len(differences['delete']))
+        self.assertEqual(12, len(deferred))
+        self.assertEqual(1, len(differences['create'][0]))
+        # Unused share goes to the other action
+        differences = {'create': [('c', str(x)) for x in range(10)],
+                       'delete': [('d',)]}
+        self.universe._apply_key_budget('tn-t1', differences)
+        self.assertEqual(7, len(differences['create']))
+        self.assertEqual(1, len(differences['delete']))
+        self.assertEqual(set(['tn-t1']), self.universe.pop_deferred_roots())
+
+    def test_tenant_priority(self):
+        changed = {'tn-t1': mock.Mock(root_full_hash='a')}
+        same = {'tn-t1': mock.Mock(root_full_hash='b')}
+        other = {'tn-t1': mock.Mock(root_full_hash='b')}
+        with mock.patch.object(self.universe, '_has_pending_retries',
+                               return_value=True):
+            # Pending changes win over retries
+            self.assertEqual(
+                base_universe.PRIORITY_CHANGED,
+                self.universe._tenant_priority('tn-t1', changed, other))
+            self.assertEqual(
+                base_universe.PRIORITY_RETRY,
+                self.universe._tenant_priority('tn-t1', same, other))
+        self.assertEqual(
+            base_universe.PRIORITY_VERIFY,
+            self.universe._tenant_priority('tn-t1', same, other))
+
     def test_track_universe_actions(self):
         # When AIM is the current state, created objects are in ACI form,
         # deleted objects are in AIM form
@@ -346,6 +346,33 @@ class TestAimDbUniverseBase(object):
         else:
             self.assertIsNone(res)
 
+    def test_push_resources_isolate_failures(self):
+        aim_mgr = aim_manager.AimManager()
+        aim_mgr.create(self.ctx, resource.Tenant(name='t1'))
+        self.universe.push_chunk_size = 2
+        aps = [self._get_example_aci_app_profile(dn='uni/tn-t1/ap-a%s' % x)
+               for x in range(5)]
+        create = self.universe.manager.create
+
+        def fail_create(context, res, *args, **kwargs):
+            if getattr(res, 'name', None) == 'a1':
+                raise Exception('Fake failure')
+            return create(context, res, *args, **kwargs)
+
+        with mock.patch.object(self.universe.manager, 'create',
+                               side_effect=fail_create):
+            self.universe.push_resources(self.ctx, {'create': aps,
+                                                    'delete': []})
+        # Only the failing object is missing, the rest of its chunk is
+        # pushed anyway
+        for x in range(5):
+            ap = aim_mgr.get(self.ctx, resource.ApplicationProfile(
+                tenant_name='t1', name='a%s' % x))
+            if x == 1:
+                self.assertIsNone(ap)
+            else:
+                self.assertIsNotNone(ap)
+
     def test_push_resources_service_graph(self):
         aim_mgr = aim_manager.AimManager()
         aim_mgr.create(self.ctx, resource.Tenant(name='t1'))
@@ -553,6 +580,25 @@ class TestAimDbUniverse(TestAimDbUniverseBase, base.TestAimDBBase):
         self.assertEqual('uni/tn-t1/BD-b', purge[0][1].dn)
         self.universe.max_backoff_time = old_backoff_time
 
+    @base.requires(['sql'])
+    def test_background_observe(self):
+        aim_mgr = aim_manager.AimManager()
+        tn = aim_mgr.create(self.ctx, resource.Tenant(name='t1'))
+        self.universe.serve(self.ctx, [tn.root])
+        self.universe.background_observe(self.ctx)
+        self.assertTrue(tn.root in self.universe._snapshot)
+        snapshot = self.universe._snapshot[tn.root][1]
+        # Nothing changed, the snapshot is consumed as is
+        self.universe.observe(self.ctx)
+        self.assertIs(snapshot, self.universe.state[tn.root])
+        # Changes are loaded
+        aim_mgr.create(self.ctx, resource.BridgeDomain(tenant_name='t1',
+                                                       name='bd'))
+        self.universe.observe(self.ctx)
+        self.assertIsNot(snapshot, self.universe.state[tn.root])
+        self.assertIsNotNone(self.universe.state[tn.root].find(
+            ('fvTenant|t1', 'fvBD|bd')))
+
 
 class TestAimDbOperationalUniverse(TestAimDbUniverseBase, base.TestAimDBBase):
 
@@ -20,6 +20,8 @@ from apicapi import apic_client
 from apicapi import exceptions as aexc
 import mock
 
+from aim.agent.aid import cycle_stats
+from aim.agent.aid import event_handler
 from aim.agent.aid import service
 from aim.agent.aid.universes.aci import aci_universe
 from aim import aim_manager
@@ -461,6 +463,53 @@ class TestAgent(base.TestAimDBBase, test_aci_tenant.TestAciClientMixin):
         agent.conf_manager.subs_mgr._poll_and_execute()
         self.assertEqual(130, agent.polling_interval)
 
+    def test_adaptive_event_squash(self):
+        agent = self._create_agent()
+        agent.squash_time = 1
+        agent.squash_max_time = 3
+        clock = [1000.0]
+        timeouts = []
+        # (seconds elapsed before the event, event)
+        events = [(0, 'reconcile'), (0.5, 'reconcile'), (0.9, 'reconcile'),
+                  (0.9, 'reconcile'), (0.7, None), (0, None)]
+
+        def get_event(timeout):
+            timeouts.append(timeout)
+            elapsed, event = events.pop(0)
+            clock[0] += elapsed
+            return event
+
+        def cycle(serve, roots=None):
+            agent.run_daemon_loop = False
+
+        with mock.patch.object(agent.events, 'get_event',
+                               side_effect=get_event):
+            with mock.patch.object(agent, '_reconciliation_cycle',
+                                   side_effect=cycle) as rec:
+                with mock.patch('time.time', side_effect=lambda: clock[0]):
+                    with mock.patch.object(
+                            cycle_stats, 'record_event_latency') as latency:
+                        agent._daemon_loop()
+        self.assertEqual(1, rec.call_count)
+        # Every event extends the squash window, up to squash_max_time
+        self.assertEqual(service.AID_EXIT_CHECK_INTERVAL, timeouts[0])
+        for expected, timeout in zip([1, 1, 1, 0.7], timeouts[1:5]):
+            self.assertAlmostEqual(expected, timeout)
+        self.assertAlmostEqual(3, agent.event_latency['last'])
+        self.assertEqual(1, agent.event_latency['count'])
+        self.assertEqual(1, latency.call_count)
+        self.assertAlmostEqual(3, latency.call_args[0][0])
+
+    def test_config_change_wakeup(self):
+        agent = self._create_agent()
+        self.set_override('agent_event_squash_time', 7, 'aim')
+        while agent.events.get_event(0):
+            pass
+        agent.conf_manager.subs_mgr._poll_and_execute()
+        self.assertEqual(7, agent.squash_time)
+        self.assertEqual(event_handler.EVENT_WAKEUP,
+                         agent.events.get_event(0))
+
     def test_change_report_interval(self):
         agent = self._create_agent()
         self.set_override('agent_report_interval', 130, 'aim')
@@ -1430,6 +1479,198 @@ class TestAgent(base.TestAimDBBase, test_aci_tenant.TestAciClientMixin):
         finally:
             hashtree_db_listener.MAX_EVENTS_PER_ROOT = original_max_value
 
+    def test_parallel_reconcile(self):
+        self.set_override('reconcile_workers', 2, 'aim')
+        agent = self._create_agent()
+        current_config = agent.multiverse[0]['current']
+        desired_config = agent.multiverse[0]['desired']
+        current_monitor = agent.multiverse[2]['current']
+        desired_monitor = agent.multiverse[2]['desired']
+        apic_client.ApicSession.post_body_dict = (
+            self._mock_current_manager_post)
+        apic_client.ApicSession.DELETE = self._mock_current_manager_delete
+        tenants = [resource.Tenant(name='test_parallel_reconcile%s' % x)
+                   for x in range(3)]
+        for tn in tenants:
+            self.aim_manager.create(self.ctx, tn)
+        self._first_serve(agent)
+        for tn in tenants:
+            self.aim_manager.create(
+                self.ctx, resource.BridgeDomain(tenant_name=tn.name,
+                                                name='bd', vrf_name='vrf'))
+            self.aim_manager.create(
+                self.ctx, resource.VRF(tenant_name=tn.name, name='vrf'))
+        self._sync_and_verify(agent, current_config,
+                              [(current_config, desired_config),
+                               (current_monitor, desired_monitor)],
+                              tenants=[x.root for x in tenants])
+        self.assertIsNotNone(current_config._reconcile_pool)
+        for tn in tenants:
+            self.assertTrue(tn.root in current_config.reconcile_time)
+            bd = resource.BridgeDomain(tenant_name=tn.name, name='bd')
+            self.assertEqual(
+                aim_status.AciStatus.SYNCED,
+                self.aim_manager.get_status(self.ctx, bd).sync_status)
+
+    def test_skip_converged_tenants(self):
+        agent = self._create_agent()
+        current_config = agent.multiverse[0]['current']
+        desired_config = agent.multiverse[0]['desired']
+        current_monitor = agent.multiverse[2]['current']
+        desired_monitor = agent.multiverse[2]['desired']
+        apic_client.ApicSession.post_body_dict = (
+            self._mock_current_manager_post)
+        apic_client.ApicSession.DELETE = self._mock_current_manager_delete
+        tn = resource.Tenant(name='test_skip_converged_tenants')
+        self.aim_manager.create(self.ctx, tn)
+        self._first_serve(agent)
+        self.aim_manager.create(
+            self.ctx, resource.VRF(tenant_name=tn.name, name='vrf'))
+        self._sync_and_verify(agent, current_config,
+                              [(current_config, desired_config),
+                               (current_monitor, desired_monitor)],
+                              tenants=[tn.root])
+        self.assertTrue(tn.root in current_config._converged_hashes)
+        # Nothing changed, the tenant is not diffed again
+        with mock.patch.object(desired_config, 'get_resources',
+                               return_value=[]) as get_res:
+            agent._reconciliation_cycle()
+            self.assertFalse(get_res.called)
+            # Pending retries are honored even if nothing changed
+            current_config._sync_log[tn.root]['create'] = {'fake': {}}
+            agent._reconciliation_cycle()
+            self.assertTrue(get_res.called)
+        # Changes in the desired state are synchronized
+        bd = self.aim_manager.create(
+            self.ctx, resource.BridgeDomain(tenant_name=tn.name, name='bd',
+                                            vrf_name='vrf'))
+        self._sync_and_verify(agent, current_config,
+                              [(current_config, desired_config),
+                               (current_monitor, desired_monitor)],
+                              tenants=[tn.root])
+        self.assertEqual(
+            aim_status.AciStatus.SYNCED,
+            self.aim_manager.get_status(self.ctx, bd).sync_status)
+        self.assertTrue(tn.root in current_config._converged_hashes)
+
+    def test_schedule_tenants(self):
+        agent = self._create_agent()
+        current_config = agent.multiverse[0]['current']
+        synced = tree.StructuredHashTree().include(
+            [{'key': ('keyA', 'keyB')}])
+        changed = tree.StructuredHashTree().include(
+            [{'key': ('keyA', 'keyC')}])
+        my_state = {'verify1': synced, 'verify2': synced, 'changed': synced,
+                    'retry': synced}
+        other_state = {'verify1': synced, 'verify2': synced,
+                       'changed': changed, 'retry': synced}
+        current_config._sync_log['retry'] = {'create': {'fake': {}},
+                                             'delete': {}}
+        current_config.reconcile_time = {'verify1': 2, 'verify2': 1}
+        self.assertEqual(
+            ['changed', 'retry', 'verify2', 'verify1'],
+            current_config._schedule_tenants(my_state.keys(), my_state,
+                                             other_state))
+
+    def test_tenant_key_budget(self):
+        self.set_override('reconcile_tenant_max_keys', 2, 'aim')
+        agent = self._create_agent()
+        current_config = agent.multiverse[0]['current']
+        desired_config = agent.multiverse[0]['desired']
+        current_monitor = agent.multiverse[2]['current']
+        desired_monitor = agent.multiverse[2]['desired']
+        apic_client.ApicSession.post_body_dict = (
+            self._mock_current_manager_post)
+        apic_client.ApicSession.DELETE = self._mock_current_manager_delete
+        tn = resource.Tenant(name='test_tenant_key_budget')
+        self.aim_manager.create(self.ctx, tn)
+        self._first_serve(agent)
+        self._sync_and_verify(agent, current_config,
+                              [(current_config, desired_config),
+                               (current_monitor, desired_monitor)],
+                              tenants=[tn.root])
+        self.aim_manager.create(
+            self.ctx, resource.VRF(tenant_name=tn.name, name='vrf'))
+        bd = self.aim_manager.create(
+            self.ctx, resource.BridgeDomain(tenant_name=tn.name, name='bd',
+                                            vrf_name='vrf'))
+        self.aim_manager.create(
+            self.ctx, resource.ApplicationProfile(tenant_name=tn.name,
+                                                  name='ap'))
+        # Over budget, the tenant asks for another cycle
+        with mock.patch.object(agent.events, 'reconcile') as reconcile:
+            agent._reconciliation_cycle()
+            reconcile.assert_called_once_with(roots=set([tn.root]))
+        self.assertFalse(tn.root in current_config._converged_hashes)
+        for _ in range(3):
+            self._observe_aci_events(current_config)
+            agent._reconciliation_cycle()
+        self._sync_and_verify(agent, current_config,
+                              [(current_config, desired_config),
+                               (current_monitor, desired_monitor)],
+                              tenants=[tn.root])
+        self.assertEqual(
+            aim_status.AciStatus.SYNCED,
+            self.aim_manager.get_status(self.ctx, bd).sync_status)
+
+    def test_reconcile_dirty_roots(self):
+        agent = self._create_agent()
+        current_config = agent.multiverse[0]['current']
+        desired_config = agent.multiverse[0]['desired']
+        current_monitor = agent.multiverse[2]['current']
+        desired_monitor = agent.multiverse[2]['desired']
+        apic_client.ApicSession.post_body_dict = (
+            self._mock_current_manager_post)
+        apic_client.ApicSession.DELETE = self._mock_current_manager_delete
+        tn1 = resource.Tenant(name='test_reconcile_dirty_roots1')
+        tn2 = resource.Tenant(name='test_reconcile_dirty_roots2')
+        self.aim_manager.create(self.ctx, tn1)
+        self.aim_manager.create(self.ctx, tn2)
+        self._first_serve(agent)
+        self._sync_and_verify(agent, current_config,
+                              [(current_config, desired_config),
+                               (current_monitor, desired_monitor)],
+                              tenants=[tn1.root, tn2.root])
+        bd1 = self.aim_manager.create(
+            self.ctx, resource.BridgeDomain(tenant_name=tn1.name, name='bd'))
+        bd2 = self.aim_manager.create(
+            self.ctx, resource.BridgeDomain(tenant_name=tn2.name, name='bd'))
+        # Only the dirty root is observed and synchronized
+        agent._reconciliation_cycle(serve=False, roots=set([tn1.root]))
+        self._observe_aci_events(current_config)
+        agent._reconciliation_cycle(serve=False, roots=set([tn1.root]))
+        self.assertEqual(
+            aim_status.AciStatus.SYNCED,
+            self.aim_manager.get_status(self.ctx, bd1).sync_status)
+        self.assertIsNone(desired_config.state[tn2.root].find(
+            ('fvTenant|' + tn2.name, 'fvBD|bd')))
+        # A full sweep synchronizes the rest
+        self._sync_and_verify(agent, current_config,
+                              [(current_config, desired_config),
+                               (current_monitor, desired_monitor)],
+                              tenants=[tn1.root, tn2.root])
+        self.assertEqual(
+            aim_status.AciStatus.SYNCED,
+            self.aim_manager.get_status(self.ctx, bd2).sync_status)
+
+    def test_cycle_stats(self):
+        agent = self._create_agent()
+        tn = resource.Tenant(name='test_cycle_stats')
+        self.aim_manager.create(self.ctx, tn)
+        self._first_serve(agent)
+        agent._reconciliation_cycle()
+        cycle = cycle_stats.get_stats().history[-1]
+        for phase in ['calculate_tenants', 'serve', 'observe',
+                      'vote_deletion_candidates', 'reconcile',
+                      'reconcile_tenant']:
+            self.assertTrue(phase in cycle['phases'], phase)
+        for pair in agent.multiverse:
+            self.assertTrue(
+                'observe' in cycle['universes'][pair['desired'].name])
+            self.assertTrue(
+                'reconcile' in cycle['universes'][pair['current'].name])
+        self.assertTrue('reconcile_tenant' in cycle['tenants'][tn.root])
+
     def test_divergence_reset(self):
         agent = self._create_agent()
         tenant_name = 'test_divergence_reset'
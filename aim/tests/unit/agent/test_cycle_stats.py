@@ -0,0 +1,110 @@
+# Copyright (c) 2017 Cisco Systems
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+
+import mock
+
+from aim.agent.aid import cycle_stats
+from aim.tests import base
+
+
+class TestCycleStats(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestCycleStats, self).setUp()
+        self.stats_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.stats_dir)
+        cycle_stats.configure(dump_dir=self.stats_dir)
+        self.addCleanup(cycle_stats.configure)
+
+    def test_accounting(self):
+        # Nothing is recorded outside of a cycle
+        with cycle_stats.measure('observe', 'u1'):
+            pass
+        self.assertEqual({}, cycle_stats.end_cycle())
+        cycle_stats.start_cycle()
+        with cycle_stats.measure('observe', 'u1'):
+            pass
+        with cycle_stats.measure('observe', 'u2'):
+            pass
+        for tenant in ['tn1', 'tn2', 'tn1']:
+            with cycle_stats.measure('diff', 'u1', tenant):
+                pass
+        log = mock.Mock()
+        cycle = cycle_stats.end_cycle(log=log)
+        self.assertEqual(2, cycle['phases']['observe'][0])
+        self.assertEqual(3, cycle['phases']['diff'][0])
+        self.assertEqual(1, cycle['universes']['u2']['observe'][0])
+        self.assertEqual(3, cycle['universes']['u1']['diff'][0])
+        self.assertEqual(2, cycle['tenants']['tn1']['diff'][0])
+        self.assertEqual(set(['tn1', 'tn2']),
+                         set(x[0] for x in cycle_stats.top_tenants(cycle)))
+        self.assertEqual(1, log.info.call_count)
+        # Last cycles are dumped
+        dumped = cycle_stats.load(os.path.join(self.stats_dir, 'aid.json'))
+        self.assertEqual(cycle['phases'], dumped['cycles'][-1]['phases'])
+
+    def test_dump_interval(self):
+        path = os.path.join(self.stats_dir, 'aid.json')
+        cycle_stats.start_cycle()
+        cycle_stats.end_cycle()
+        self.assertEqual(1, len(cycle_stats.load(path)['cycles']))
+        # Following cycles are only dumped once the interval expires
+        cycle_stats.start_cycle()
+        cycle_stats.end_cycle()
+        self.assertEqual(1, len(cycle_stats.load(path)['cycles']))
+        with mock.patch.object(cycle_stats, 'DUMP_INTERVAL', 0):
+            cycle_stats.start_cycle()
+            cycle_stats.end_cycle()
+        self.assertEqual(3, len(cycle_stats.load(path)['cycles']))
+
+    def test_event_latency(self):
+        stats = cycle_stats.CycleStats()
+        # Latencies are attached to the last completed cycle
+        stats.record_event_latency(2.0)
+        stats.start_cycle()
+        stats.end_cycle()
+        stats.record_event_latency(3.0)
+        stats.record_event_latency(1.0)
+        cycle = stats.to_dict()['cycles'][-1]
+        self.assertEqual({'last': 1.0, 'min': 1.0, 'max': 3.0},
+                         cycle['event_latency'])
+        self.assertEqual({'last': 1.0, 'min': 1.0, 'max': 3.0},
+                         cycle_stats.summarize(cycle)['event_latency'])
+        stats.start_cycle()
+        stats.end_cycle()
+        stats.record_event_latency(4.0)
+        self.assertEqual({'last': 4.0, 'min': 1.0, 'max': 4.0},
+                         stats.to_dict()['cycles'][-1]['event_latency'])
+        # Cycles without events don't report any latency
+        stats.start_cycle()
+        self.assertEqual({}, cycle_stats.summarize(
+            stats.end_cycle())['event_latency'])
+
+    def test_profile_slow_cycle(self):
+        cycle_stats.configure(dump_dir=self.stats_dir,
+                              profile_threshold=0.000001)
+        cycle_stats.start_cycle()
+        with cycle_stats.measure('observe'):
+            sum(range(1000))
+        cycle_stats.end_cycle()
+        # First slow cycle is not profiled, the next one is
+        self.assertEqual([], cycle_stats.list_profiles(self.stats_dir))
+        cycle_stats.start_cycle()
+        cycle_stats.end_cycle()
+        self.assertEqual(1, len(cycle_stats.list_profiles(self.stats_dir)))
@@ -60,3 +60,39 @@ class TestEventHandler(base.TestAimDBBase):
         self.sender.reconcile()
         self.assertEqual(event_handler.EVENT_RECONCILE,
                          self.handler.get_event())
+
+    def test_receive_root_event(self):
+        self.handler.pop_dirty_roots()
+        self.sender.reconcile(roots=['tn-t2', 'tn-t1'])
+        self.assertEqual(event_handler.EVENT_RECONCILE,
+                         self.handler.get_event())
+        self.sender.reconcile(roots=['tn-t3'])
+        self.assertEqual(event_handler.EVENT_RECONCILE,
+                         self.handler.get_event())
+        # Dirty roots accumulate until popped
+        self.assertEqual(set(['tn-t1', 'tn-t2', 'tn-t3']),
+                         self.handler.pop_dirty_roots())
+        self.assertEqual(set(), self.handler.pop_dirty_roots())
+        # Events without roots require a full reconciliation
+        self.sender.reconcile(roots=['tn-t1'])
+        self.sender.reconcile()
+        self.handler.get_event()
+        self.handler.get_event()
+        self.assertIsNone(self.handler.pop_dirty_roots())
+        self.sender.serve()
+        self.handler.get_event()
+        self.assertIsNone(self.handler.pop_dirty_roots())
+
+    def test_encode_event(self):
+        self.assertEqual(
+            (event_handler.EVENT_RECONCILE, ['tn-t1', 'tn-t2']),
+            event_handler.decode_event(event_handler.encode_event(
+                event_handler.EVENT_RECONCILE, ['tn-t2', 'tn-t1'])))
+        self.assertEqual(
+            (event_handler.EVENT_SERVE, None),
+            event_handler.decode_event(event_handler.EVENT_SERVE))
+        # Roots that don't fit in the payload are dropped
+        roots = ['tn-%s' % x for x in range(event_handler.PAYLOAD_MAX_LEN)]
+        self.assertEqual(
+            event_handler.EVENT_RECONCILE,
+            event_handler.encode_event(event_handler.EVENT_RECONCILE, roots))
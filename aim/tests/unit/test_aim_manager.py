@@ -39,6 +39,7 @@ from aim.api import tree as api_tree
 from aim.common.hashtree import structured_tree
 from aim.common import utils
 from aim import config  # noqa
+from aim import context
 from aim.db import api
 from aim.db import hashtree_db_listener
 from aim.db import tree_model  # noqa
@@ -148,6 +149,146 @@ class TestAimManager(base.TestAimDBBase):
                                                                 name='test'))
         self.assertEqual(aim_status.AciStatus.SYNC_PENDING, vmmd.sync_status)
 
+    def test_bulk_sync_status(self):
+        self.mgr.create(self.ctx, resource.Tenant(name='t1'))
+        ap = self.mgr.create(self.ctx, resource.ApplicationProfile(
+            tenant_name='t1', name='ap'))
+        epgs = [self.mgr.create(self.ctx, resource.EndpointGroup(
+            tenant_name='t1', app_profile_name='ap', name='epg%s' % x))
+            for x in range(3)]
+        bd = self.mgr.create(self.ctx, resource.BridgeDomain(
+            tenant_name='t1', name='bd'))
+        self.mgr.set_resource_sync_error(self.ctx, ap)
+        self.mgr.set_resource_sync_error(self.ctx, epgs[1])
+        self.mgr.set_resource_sync_synced(self.ctx, bd)
+
+        # Only epgs[0] is set pending, the failed parent is recovered along
+        # with its failed subtree
+        self.mgr.set_resources_sync_pending(self.ctx, [epgs[0], bd])
+        status = self.mgr.get_status(self.ctx, ap)
+        self.assertEqual(aim_status.AciStatus.SYNC_PENDING, status.sync_status)
+        for epg in epgs[:2]:
+            status = self.mgr.get_status(self.ctx, epg)
+            self.assertEqual(aim_status.AciStatus.SYNC_PENDING,
+                             status.sync_status)
+        status = self.mgr.get_status(self.ctx, epgs[2])
+        self.assertEqual(aim_status.AciStatus.SYNC_PENDING, status.sync_status)
+        status = self.mgr.get_status(self.ctx, bd)
+        self.assertEqual(aim_status.AciStatus.SYNC_PENDING, status.sync_status)
+
+        self.mgr.set_resources_sync_synced(self.ctx, epgs + [ap])
+        for res in epgs + [ap]:
+            status = self.mgr.get_status(self.ctx, res)
+            self.assertEqual(aim_status.AciStatus.SYNCED, status.sync_status)
+        # Calls with no resources are a no-op
+        self.assertEqual([], self.mgr.set_resources_sync_synced(self.ctx, []))
+        # Lookups and updates are split in chunks
+        with mock.patch('aim.common.utils.BULK_QUERY_SIZE', 2):
+            self.mgr.set_resources_sync_pending(self.ctx, epgs + [ap])
+        for res in epgs + [ap]:
+            status = self.mgr.get_status(self.ctx, res)
+            self.assertEqual(aim_status.AciStatus.SYNC_PENDING,
+                             status.sync_status)
+
+    @base.requires(['sql'])
+    def test_query_aim_ids(self):
+        names = [u't\xe8nant%s' % x for x in range(5)]
+        for name in names:
+            self.mgr.create(self.ctx, resource.Tenant(name=name))
+        tenants = [resource.Tenant(name=x) for x in names + ['missing']]
+        with mock.patch('aim.common.utils.BULK_QUERY_SIZE', 2):
+            with self.ctx.store.begin(subtransactions=True):
+                result = self.ctx.store.query_aim_ids(tenants)
+        self.assertEqual(set(id(x) for x in tenants[:-1]),
+                         set(id(x[0]) for x in result))
+        self.assertTrue(all(x[1] for x in result))
+
+    def test_iter_find(self):
+        for x in range(7):
+            self.mgr.create(self.ctx, resource.Tenant(name='t%s' % x))
+            self.mgr.create(self.ctx, resource.BridgeDomain(
+                tenant_name='t%s' % x, name='bd'))
+            self.mgr.create(self.ctx, resource.BridgeDomain(
+                tenant_name='t%s' % x, name='bd1'))
+        for page_size in [None, 1, 2, 7, 100]:
+            result = list(self.mgr.iter_find(self.ctx, resource.BridgeDomain,
+                                             page_size=page_size))
+            self.assertEqual(14, len(result))
+            self.assertEqual(
+                sorted(x.identity for x in self.mgr.find(
+                    self.ctx, resource.BridgeDomain)),
+                sorted(x.identity for x in result))
+        result = list(self.mgr.iter_find(self.ctx, resource.BridgeDomain,
+                                         page_size=3, name='bd1'))
+        self.assertEqual(7, len(result))
+        self.assertTrue(all(x.name == 'bd1' for x in result))
+        result = list(self.mgr.iter_find(
+            self.ctx, resource.BridgeDomain, page_size=1,
+            in_={'tenant_name': ['t1', 't2']}))
+        self.assertEqual(4, len(result))
+        self.assertEqual([], list(self.mgr.iter_find(
+            self.ctx, resource.BridgeDomain, tenant_name='t9')))
+
+    def test_find_attributes(self):
+        self.mgr.create(self.ctx, resource.Tenant(name='t1'))
+        self.mgr.create(self.ctx, resource.BridgeDomain(
+            tenant_name='t1', name='bd', vrf_name='vrf',
+            l3out_names=['l1', 'l2'], display_name='bd1'))
+        self.mgr.create(self.ctx, resource.BridgeDomain(
+            tenant_name='t1', name='bd2', vrf_name='vrf2'))
+
+        result = self.mgr.find_identities(self.ctx, resource.BridgeDomain,
+                                          vrf_name='vrf')
+        self.assertEqual(1, len(result))
+        self.assertEqual(['t1', 'bd'], result[0].identity)
+        # Non identity attributes are left to their defaults
+        self.assertEqual([], result[0].l3out_names)
+        self.assertEqual('', result[0].display_name)
+
+        result = self.mgr.find(self.ctx, resource.BridgeDomain,
+                               attributes=['vrf_name', 'display_name'],
+                               name='bd')
+        self.assertEqual('vrf', result[0].vrf_name)
+        self.assertEqual('bd1', result[0].display_name)
+        self.assertEqual([], result[0].l3out_names)
+
+        # Collections are retrieved when explicitly requested
+        result = self.mgr.find(self.ctx, resource.BridgeDomain,
+                               attributes=['l3out_names'], name='bd')
+        self.assertEqual(['l1', 'l2'], sorted(result[0].l3out_names))
+
+        result = self.mgr.find_identities(
+            self.ctx, resource.BridgeDomain, include_aim_id=True,
+            order_by='name')
+        self.assertEqual(['bd', 'bd2'], [x.name for x in result])
+        full = self.mgr.find(self.ctx, resource.BridgeDomain,
+                             include_aim_id=True, order_by='name')
+        self.assertEqual([x._aim_id for x in full],
+                         [x._aim_id for x in result])
+
+    @base.requires(['sql'])
+    def test_identity_cache(self):
+        ctx = context.AimContext(store=self.ctx.store, cache=True)
+        self.mgr.create(ctx, resource.Tenant(name='t1'))
+        bd = resource.BridgeDomain(tenant_name='t1', name='bd')
+        with ctx.store.begin(subtransactions=True):
+            self.assertTrue(ctx.store.in_transaction)
+            # Missing objects are not cached
+            self.assertIsNone(self.mgr.get(ctx, bd))
+            self.assertIsNone(self.mgr.get(ctx, bd))
+            self.assertEqual(0, ctx.cache.stats()['size'])
+            self.mgr.create(ctx, bd)
+            self.assertEqual('bd', self.mgr.get(ctx, bd).name)
+            self.mgr.update(ctx, bd, vrf_name='vrf')
+            self.assertEqual('vrf', self.mgr.get(ctx, bd).vrf_name)
+            self.mgr.delete(ctx, bd)
+            self.assertIsNone(self.mgr.get(ctx, bd))
+            self.assertEqual(3, ctx.cache.hits)
+            self.assertEqual(5, ctx.cache.misses)
+            self.assertEqual(0.375, ctx.cache.hit_rate)
+        # Cache is discarded when the transaction ends
+        self.assertEqual(0, ctx.cache.stats()['size'])
+
     def test_multiple_statuses(self):
         t1 = self.mgr.create(self.ctx, resource.Tenant(name='t1'))
         t2 = self.mgr.create(self.ctx, resource.Tenant(name='t2'))
@@ -257,7 +257,7 @@ class TestHashTreeDbListener(base.TestAimDBBase):
             # consequently a reconcile call
             exp_calls = [
                 mock.call(mock.ANY, 'serve', None),
-                mock.call(mock.ANY, 'reconcile', None)]
+                mock.call(mock.ANY, 'reconcile', None, roots=[tn_rn])]
             self._check_call_list(exp_calls, cast)
             self.mgr.create(self.ctx, tn)
             cast.reset_mock()
@@ -265,16 +265,16 @@ class TestHashTreeDbListener(base.TestAimDBBase):
             self.mgr.create(self.ctx, epg)
             # Create AP will create tenant, create EPG will modify it
             exp_calls = [
-                mock.call(mock.ANY, 'reconcile', None),
-                mock.call(mock.ANY, 'reconcile', None),
-                mock.call(mock.ANY, 'reconcile', None),
-                mock.call(mock.ANY, 'reconcile', None)]
+                mock.call(mock.ANY, 'reconcile', None, roots=[tn_rn]),
+                mock.call(mock.ANY, 'reconcile', None, roots=[tn_rn]),
+                mock.call(mock.ANY, 'reconcile', None, roots=[tn_rn]),
+                mock.call(mock.ANY, 'reconcile', None, roots=[tn_rn])]
             self._check_call_list(exp_calls, cast)
             cast.reset_mock()
             self.mgr.update(self.ctx, epg, bd_name='bd2')
             exp_calls = [
-                mock.call(mock.ANY, 'reconcile', None),
-                mock.call(mock.ANY, 'reconcile', None)]
+                mock.call(mock.ANY, 'reconcile', None, roots=[tn_rn]),
+                mock.call(mock.ANY, 'reconcile', None, roots=[tn_rn])]
             self._check_call_list(exp_calls, cast)
             cast.reset_mock()
             self.tt_mgr.delete_by_root_rn(self.ctx, tn_rn)
@@ -311,7 +311,9 @@ class TestHashTreeDbListener(base.TestAimDBBase):
                 self.assertEqual(0, cast.call_count)
             exp_calls = [
                 mock.call(mock.ANY, 'serve', None),
-                mock.call(mock.ANY, 'reconcile', None)]
+                mock.call(mock.ANY, 'reconcile', None,
+                          roots=['tn-test_tree_hooks',
+                                 'tn-test_tree_hooks1'])]
             self._check_call_list(exp_calls, cast)
 
     def test_monitored_state_change(self):
@@ -432,3 +434,26 @@ class TestHashTreeDbListener(base.TestAimDBBase):
         self.db_l.catch_up_with_action_log(self.ctx.store)
         # status doesn't exist anymore
         self.assertIsNone(self.mgr.get(self.ctx, status))
+
+    def test_cleanup_zombie_status_objects(self):
+        tenants = [self.mgr.create(self.ctx, aim_res.Tenant(name='t%s' % x))
+                   for x in range(3)]
+        statuses = [self.mgr.get_status(self.ctx, x) for x in tenants]
+        zombie = self.mgr.create(self.ctx, aim_status.AciStatus(
+            resource_type='Tenant', resource_id='none', resource_root='tn-t0',
+            resource_dn='uni/tn-t0'))
+        with mock.patch('aim.common.utils.BULK_QUERY_SIZE', 1):
+            self.db_l.cleanup_zombie_status_objects(self.ctx)
+        self.assertIsNone(self.mgr.get(self.ctx, zombie))
+        for status in statuses:
+            self.assertIsNotNone(self.mgr.get(self.ctx, status))
+
+    def test_cleanup_unknown_type_status_objects(self):
+        tenant = self.mgr.create(self.ctx, aim_res.Tenant(name='t1'))
+        status = self.mgr.get_status(self.ctx, tenant)
+        # Statuses whose parent type can't be resolved are deleted
+        with mock.patch.object(aim_status.AciStatus, 'parent_class',
+                               new=property(lambda self: None)):
+            self.db_l.cleanup_zombie_status_objects(self.ctx,
+                                                    roots=['tn-t1'])
+        self.assertIsNone(self.mgr.get(self.ctx, status))
@@ -0,0 +1,87 @@
+# Copyright (c) 2017 Cisco Systems
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+
+import mock
+
+from aim import aim_manager
+from aim.api import resource
+from aim.db import sql_stats
+from aim.tests import base
+
+
+class TestSqlStats(base.TestAimDBBase):
+
+    def setUp(self):
+        super(TestSqlStats, self).setUp()
+        self.mgr = aim_manager.AimManager()
+        self.addCleanup(sql_stats.disable)
+
+    @base.requires(['sql'])
+    def test_accounting(self):
+        self.mgr.create(self.ctx, resource.Tenant(name='t0'))
+        self.assertEqual({}, sql_stats.end_cycle())
+        sql_stats.enable()
+        sql_stats.start_cycle()
+        self.mgr.create(self.ctx, resource.Tenant(name='t1'))
+        self.mgr.find(self.ctx, resource.Tenant)
+        cycle = sql_stats.end_cycle()
+        # Statements are accounted to the outermost AimManager method
+        self.assertTrue(cycle['AimManager.create'][0] > 1)
+        self.assertTrue(cycle['AimManager.find'][0] >= 1)
+        self.assertFalse(
+            [x for x in cycle if x.startswith('AimManager._')])
+        statements, rows, elapsed = sql_stats.summarize(cycle)
+        self.assertEqual(statements, sum(x[0] for x in cycle.values()))
+        self.assertEqual('AimManager.create',
+                         sql_stats.top(cycle, count=1,
+                                       sort_by='statements')[0][0])
+        # New cycle is empty, totals are kept
+        self.assertEqual({}, sql_stats.end_cycle())
+        self.assertEqual(
+            cycle['AimManager.find'],
+            sql_stats.get_stats().to_dict()['callers']['AimManager.find'])
+
+        sql_stats.disable()
+        self.mgr.find(self.ctx, resource.Tenant)
+        self.assertEqual({}, sql_stats.end_cycle())
+
+    @base.requires(['sql'])
+    def test_slow_query(self):
+        sql_stats.enable(slow_query_threshold=0.000001)
+        with mock.patch.object(sql_stats.LOG, 'warning') as warn:
+            self.mgr.find(self.ctx, resource.Tenant)
+            self.assertTrue(warn.called)
+        sql_stats.enable(slow_query_threshold=0)
+        with mock.patch.object(sql_stats.LOG, 'warning') as warn:
+            self.mgr.find(self.ctx, resource.Tenant)
+            self.assertFalse(warn.called)
+
+    @base.requires(['sql'])
+    def test_dump(self):
+        stats_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, stats_dir)
+        path = os.path.join(stats_dir, 'aid.json')
+        sql_stats.enable(dump_file=path)
+        sql_stats.start_cycle()
+        self.mgr.find(self.ctx, resource.Tenant)
+        sql_stats.end_cycle()
+        dumped = sql_stats.load(path)
+        self.assertEqual(
+            sql_stats.get_stats().to_dict()['callers']['AimManager.find'],
+            dumped['callers']['AimManager.find'])
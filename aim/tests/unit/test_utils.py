@@ -108,3 +108,51 @@ class TestUtils(base.TestAimDBBase):
         self.assertTrue('test' in internal_utils.all_locks)
         self.assertTrue('test2' in internal_utils.all_locks)
         self.assertEqual(2, len(internal_utils.all_locks))
+
+    def test_worker_pool(self):
+        pool = internal_utils.WorkerPool(3)
+        self.assertEqual(3, len(pool._threads))
+
+        def square(x):
+            if x == 3:
+                raise Exception('failure')
+            return x * x
+        # Results keep the order of the items, failures return None
+        self.assertEqual([0, 1, 4, None, 16], pool.map(square, range(5)))
+        self.assertEqual([], pool.map(square, []))
+
+    def test_lru_cache(self):
+        cache = internal_utils.LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(1, cache.get('a'))
+        # Least recently used is evicted
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual({'size': 2, 'hits': 2, 'misses': 1,
+                          'hit_rate': 2.0 / 3}, cache.stats())
+
+        calls = []
+
+        @internal_utils.lru_cache('test_lru_cache', size=10)
+        def double(x):
+            calls.append(x)
+            return x + x
+        self.addCleanup(internal_utils._caches.pop, 'test_lru_cache')
+        self.assertEqual(4, double(2))
+        self.assertEqual(4, double(2))
+        self.assertEqual([2], calls)
+        self.assertEqual(
+            1, internal_utils.get_cache_stats()['test_lru_cache']['hits'])
+        # Lookups don't go through the global cache registry
+        with mock.patch.object(internal_utils, 'get_cache') as get_cache:
+            self.assertEqual(4, double(2))
+            self.assertFalse(get_cache.called)
+        # Unhashable arguments bypass the cache
+        self.assertEqual([1, 1], double([1]))
+        # Cached decompositions can't be modified by the callers
+        dn = 'uni/tn-common/BD-bd'
+        internal_utils.decompose_dn('fvBD', dn).pop()
+        self.assertEqual([('fvTenant', 'common'), ('fvBD', 'bd')],
+                         internal_utils.decompose_dn('fvBD', dn))
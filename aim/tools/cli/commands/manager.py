@@ -38,6 +38,9 @@ ATTR_UNSPECIFIED = object()
 # the CLI until we have a proper resource schema
 DICT_LIST_ATTRS = ['static_paths']
 BOOL_ATTRS = ['monitored']
+# Rows are printed in tables of this size, so that only one batch of them
+# is kept in memory
+PRINT_BATCH_SIZE = 500
 
 
 def print_resource(res, plain=False):
@@ -52,17 +55,29 @@ def print_resource(res, plain=False):
 
 
 def print_resources(res_list, attrs=None, plain=False):
-    if not res_list:
-        return
-    if attrs:
-        header = ['Identity'] + attrs
-        rows = [([','.join(res.identity)] +
-                 [getattr(res, a, None) for a in attrs])
-                for res in res_list]
-    else:
-        header = res_list[0].identity_attributes
-        rows = [res.identity for res in res_list]
-    click.echo(tabulate(rows, headers=header,
+    # res_list can be any iterable, it is printed PRINT_BATCH_SIZE rows at
+    # a time
+    header = ['Identity'] + attrs if attrs else None
+    rows = []
+    printed = False
+    for res in res_list:
+        if attrs:
+            rows.append([','.join(res.identity)] +
+                        [getattr(res, a, None) for a in attrs])
+        else:
+            header = header or res.identity_attributes
+            rows.append(res.identity)
+        if len(rows) >= PRINT_BATCH_SIZE:
+            _print_rows(rows, header, plain, printed)
+            rows = []
+            printed = True
+    if rows:
+        _print_rows(rows, header, plain, printed)
+
+
+def _print_rows(rows, header, plain, continued):
+    # Plain tables continue the previous batch without repeating the header
+    click.echo(tabulate(rows, headers=() if plain and continued else header,
                         tablefmt='plain' if plain else 'psql'))
 
 
@@ -173,7 +188,7 @@ def find(klass):
         aim_ctx = ctx.obj['aim_ctx']
         column = list(column) if column else []
         validate_attributes(klass, column, '--column/-c', dn_is_valid=True)
-        results = manager.find(aim_ctx, klass, **kwargs)
+        results = manager.iter_find(aim_ctx, klass, **kwargs)
         print_resources(results, attrs=column, plain=plain)
     return _find
 
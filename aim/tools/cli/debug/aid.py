@@ -13,8 +13,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import os
+import time
+
 import click
+from tabulate import tabulate
 
+from aim.agent.aid import cycle_stats
 from aim.agent.aid import service
 from aim.tools.cli.groups import aimcli
 
@@ -29,3 +34,49 @@ def aid(ctx):
         click.echo("%s Agent terminated!" % e)
         return
     agent.daemon_loop()
+
+
+@aimcli.aim.command(name='aid-cycle-stats')
+@click.option('--cycles', '-c', default=1,
+              help='Number of most recent cycles to show')
+@click.option('--top', '-n', default=10,
+              help='Number of tenants to show per cycle')
+@click.pass_context
+# Show where the last AID reconciliation cycles spent their time
+def aid_cycle_stats(ctx, cycles, top):
+    stats_dir = ctx.obj['conf'].aim.cycle_stats_dir
+    if not stats_dir:
+        click.echo("AID cycle statistics are disabled, set cycle_stats_dir "
+                   "to enable them")
+        return
+    path = os.path.join(stats_dir, 'aid.json')
+    try:
+        stats = cycle_stats.load(path)
+    except (IOError, ValueError) as e:
+        click.echo("Failed to load AID cycle statistics from %s: %s" %
+                   (path, e))
+        return
+    for cycle in stats['cycles'][-cycles:]:
+        click.echo("Cycle started at %s, completed in %.3fs" % (
+            time.ctime(cycle['start']), cycle['elapsed']))
+        rows = [(phase, '', x[0], '%.3f' % x[1]) for phase, x in
+                sorted(cycle['phases'].items())]
+        for universe, phases in sorted(cycle['universes'].items()):
+            rows.extend((phase, universe, x[0], '%.3f' % x[1]) for phase, x
+                        in sorted(phases.items()))
+        click.echo(tabulate(rows, headers=['Phase', 'Universe', 'Calls',
+                                           'Time (s)'], tablefmt='psql'))
+        click.echo(tabulate(
+            [(x[0], '%.3f' % x[1]) for x in
+             cycle_stats.top_tenants(cycle, count=top)],
+            headers=['Tenant', 'Time (s)'], tablefmt='psql'))
+        if cycle.get('caches'):
+            click.echo(tabulate(
+                [(k, v['size'], v['hits'], v['misses'],
+                  '%.3f' % v['hit_rate']) for k, v in
+                 sorted(cycle['caches'].items())],
+                headers=['Cache', 'Size', 'Hits', 'Misses', 'Hit rate'],
+                tablefmt='psql'))
+    profiles = cycle_stats.list_profiles(stats_dir)
+    if profiles:
+        click.echo("Profiles of slow cycles:\n%s" % '\n'.join(profiles))
@@ -0,0 +1,58 @@
+# Copyright (c) 2017 Cisco Systems
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import glob
+import os
+import time
+
+import click
+from tabulate import tabulate
+
+from aim.db import sql_stats
+from aim.tools.cli.groups import aimcli
+
+
+@aimcli.aim.command(name='sql-stats')
+@click.option('--service', '-s', default=None,
+              help='Only show statistics of this service (eg. aid)')
+@click.option('--top', '-n', default=20,
+              help='Number of callers to show')
+@click.option('--sort-by', '-o', default='time',
+              type=click.Choice(sorted(sql_stats.SORT_KEYS.keys())))
+@click.pass_context
+# Show the AimManager methods issuing most SQL since services startup
+def sql_stats_show(ctx, service, top, sort_by):
+    stats_dir = ctx.obj['conf'].aim.sql_stats_dir
+    files = sorted(glob.glob(os.path.join(stats_dir, '%s.json' %
+                                          (service or '*'))))
+    if not files:
+        click.echo("No SQL statistics found in %s, make sure "
+                   "sql_instrumentation is enabled" % stats_dir)
+        return
+    for path in files:
+        try:
+            stats = sql_stats.load(path)
+        except (IOError, ValueError) as e:
+            click.echo("Failed to load %s: %s" % (path, e))
+            continue
+        statements, rows, elapsed = sql_stats.summarize(stats['callers'])
+        click.echo("%s: %s statements, %s rows, %.3fs since %s" % (
+            os.path.basename(path)[:-len('.json')], statements, rows,
+            elapsed, time.ctime(stats['since'])))
+        click.echo(tabulate(
+            [(x[0], x[1], x[2], '%.3f' % x[3]) for x in
+             sql_stats.top(stats['callers'], count=top, sort_by=sort_by)],
+            headers=['Caller', 'Statements', 'Rows', 'Time (s)'],
+            tablefmt='psql'))
@@ -274,12 +274,14 @@ class AimHashTreeMaker(object):
                 LOG.warning("Failed to get Key from dn %s: %s", dn, e)
 
     @staticmethod
+    @utils.lru_cache('dn_key')
     def _dn_to_key(mo_type, dn):
         type_and_dn = utils.decompose_dn(mo_type, dn)
         return tuple([str('|'.join(x))
                       for x in type_and_dn]) if type_and_dn else None
 
     @staticmethod
+    @utils.lru_cache('root_rn')
     def _extract_root_rn(root_key):
         root_split = root_key[0].split('|')
         return apic_client.DNManager().build([root_split]).split('/')[-1]